@@ -1,11 +1,11 @@
 # --- Start processing loop ---
 import os
 import re
-import time
 import csv
 import docx
-import requests
-import whisper
+from whisper_service import transcribe
+from rate_limiter import openai_create
+from workflow_cancel import exit_on_sigterm
 from pathlib import Path
 from datetime import datetime
 import gspread
@@ -29,7 +29,6 @@ tts_model = config.get("DEFAULT", "TTS_MODEL")
 timestamp_file_name = config.get("DEFAULT", "TIMESTAMP_FILE")
 whisper_model = config.get("DEFAULT", "WHISPER_MODEL")
 max_chars = config.getint("DEFAULT", "MAX_TTS_CHARS")
-retries = config.getint("DEFAULT", "RETRY_ATTEMPTS")
 min_segment_duration = config.getint("DEFAULT", "MIN_SEGMENT_DURATION_SECONDS", fallback=5)
 
 SERVICE_ACCOUNT_FILE = os.getenv("SMARTIKLE_WORKBOOK_GOOGLE_CREDENTIALS")
@@ -44,6 +43,8 @@ if not api_key:
     print("❌ OPENAI_API_KEY not set.")
     sys.exit(1)
 
+exit_on_sigterm()
+
 scope = [
     "https://www.googleapis.com/auth/spreadsheets.readonly",
     "https://www.googleapis.com/auth/spreadsheets",
@@ -60,8 +61,8 @@ SYSTEM_INSTRUCTION_PATH = "DONT_DELETE_ENV_FILES/system_instructions.txt"
 with open(SYSTEM_INSTRUCTION_PATH, "r", encoding="utf-8") as f:
     system_instruction = f.read().strip()
 
-client = OpenAI(api_key=api_key)
-session = requests.Session()
+# Retries and backoff are left to rate_limiter
+client = OpenAI(api_key=api_key, max_retries=0)
 
 # --- Calendar date selector to find the starting row ---
 selected_date = None
@@ -149,7 +150,8 @@ for idx, row in enumerate(data_rows[start_index - 2:], start=start_index):
     if not input_file.exists():
         if prompt_text:
             print(f"📝 essay.docx not found for {folder_name}, generating from prompt...")
-            response = client.chat.completions.create(
+            response = openai_create(
+                client.chat.completions, "chat",
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": system_instruction},
@@ -191,7 +193,8 @@ for idx, row in enumerate(data_rows[start_index - 2:], start=start_index):
     Essay:
     {full_story}
     """
-    yt_response = client.chat.completions.create(
+    yt_response = openai_create(
+        client.chat.completions, "chat",
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a content creator skilled at writing compelling YouTube titles and descriptions."},
@@ -234,7 +237,8 @@ for idx, row in enumerate(data_rows[start_index - 2:], start=start_index):
     {full_story}
     """
 
-    meta_response = client.chat.completions.create(
+    meta_response = openai_create(
+        client.chat.completions, "chat",
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a historical researcher and visual storytelling assistant."},
@@ -253,39 +257,22 @@ for idx, row in enumerate(data_rows[start_index - 2:], start=start_index):
         print("🎙️ Generating narration audio...")
         sheet.update_cell(idx, 4, "processing audio")        
         story_input = full_story[:max_chars]
-        for attempt in range(retries):
-            try:
-                tts_response = session.post(
-                    "https://api.openai.com/v1/audio/speech",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": tts_model,
-                        "input": story_input,
-                        "voice": selected_voice
-                    },
-                    timeout=60
-                )
-                if tts_response.status_code == 200:
-                    with open(audio_path, "wb") as f:
-                        f.write(tts_response.content)
-                    print(f"✅ Narration saved to: {audio_path}")
-                    break
-                else:
-                    print(f"⚠️ Attempt {attempt+1} failed: {tts_response.status_code}")
-                    print(tts_response.text)
-            except Exception as e:
-                print(f"❌ TTS attempt {attempt+1} failed: {e}")
-            time.sleep(5)
-        else:
-            print("❌ All TTS attempts failed. Skipping row.")
+        try:
+            tts_response = openai_create(
+                client.audio.speech, "speech",
+                model=tts_model,
+                input=story_input,
+                voice=selected_voice
+            )
+            tts_response.stream_to_file(audio_path)
+            print(f"✅ Narration saved to: {audio_path}")
+        except Exception as e:
+            print(f"❌ All TTS attempts failed ({e}). Skipping row.")
             continue
 
     print("🕒 Generating timestamped transcript...")
-    model = whisper.load_model(whisper_model)
-    result = model.transcribe(str(audio_path))
+    # Loaded once for all rows (or kept by the Whisper service, if WHISPER_SERVICE_URL is set)
+    result = transcribe(audio_path, whisper_model, word_timestamps=False)
     with open(timestamp_path, "w", encoding="utf-8") as f:
         for seg in result['segments']:
             f.write(f"[{seg['start']:.2f}s - {seg['end']:.2f}s] {seg['text'].strip()}\n")
@@ -8,8 +8,9 @@ This version accepts parameters from workflow_params.json instead of Google Shee
 import sys
 import io
 
-# Fix Unicode encoding for Windows console
-if sys.platform == 'win32':
+# Fix Unicode encoding for Windows console (only when run as a script; an
+# orchestrator importing this step owns the console streams)
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
@@ -29,18 +30,32 @@ import sys
 import time
 import docx
 import requests
-import whisper
 from pathlib import Path
 from datetime import datetime
 from openai import OpenAI
+import contextvars
 import configparser
+import argparse
+import threading
 import subprocess
-
-# --- Load config from file ---
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from rate_limiter import openai_create, openai_stream_chat
+from workflow_cancel import exit_on_sigterm
+from llm_cache import configure_llm_cache
+from workflow_metrics import timed_operation, record_operation
+from narration_audio import (TTS_PCM_FORMAT, TTS_CACHE_DIR_NAME, split_tts_chunks, join_pcm_to_mp3, save_chunk_offsets,
+                             tts_cache_key, tts_cache_file, prune_tts_cache)
+from narration_alignment import load_chunk_offsets, align_narration
+from whisper_service import transcribe
+
+# --- Load config from file (relative to this script, not the working directory) ---
+SCRIPT_DIR = Path(__file__).resolve().parent
 config = configparser.ConfigParser()
-config.read("DONT_DELETE_ENV_FILES/config/00_STEP1_Nasean_Create_Essay_11_createMP3and_TimeStamp_short.txt")
+config.read(SCRIPT_DIR / "DONT_DELETE_ENV_FILES/config/00_STEP1_Nasean_Create_Essay_11_createMP3and_TimeStamp_short.txt")
 
-ROOT_FOLDER = config.get("DEFAULT", "ROOT_FOLDER")
+# COURSE_COLLECTIVE_ROOT overrides the configured root (benchmarks, Linux hosts)
+ROOT_FOLDER = os.getenv("COURSE_COLLECTIVE_ROOT") or config.get("DEFAULT", "ROOT_FOLDER")
 OUTPUT_FOLDER_NAME = config.get("DEFAULT", "OUTPUT_FOLDER")
 AUDIO_FILE_NAME = config.get("DEFAULT", "AUDIO_FILE")
 selected_voice = config.get("DEFAULT", "VOICE")
@@ -48,22 +63,81 @@ tts_model = config.get("DEFAULT", "TTS_MODEL")
 timestamp_file_name = config.get("DEFAULT", "TIMESTAMP_FILE")
 whisper_model = config.get("DEFAULT", "WHISPER_MODEL")
 max_chars = config.getint("DEFAULT", "MAX_TTS_CHARS")
+# Stream the essay and narrate finished paragraphs while the rest is still generated
+STREAM_ESSAY = config.get("DEFAULT", "STREAM_ESSAY", fallback="YES").strip().upper() == "YES"
+NARRATION_WORKERS = config.getint("DEFAULT", "NARRATION_WORKERS", fallback=4)
+# One schema-constrained request for essay, quiz, title, description and visual metadata
+STRUCTURED_ESSAY = config.get("DEFAULT", "STRUCTURED_ESSAY", fallback="NO").strip().upper() == "YES"
+# json_schema response formats need a model that supports structured outputs
+STRUCTURED_ESSAY_MODEL = config.get("DEFAULT", "STRUCTURED_ESSAY_MODEL", fallback="gpt-4o")
+
+# Properties are generated in this order, so article_text streams early
+ESSAY_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["title", "slug", "article_text", "visual_metadata", "youtube_description", "quiz_json"],
+    "properties": {
+        "title": {"type": "string"},
+        "slug": {"type": "string", "description": "lowercase-words-joined-by-hyphens"},
+        "article_text": {"type": "string", "description": "The essay, paragraphs separated by a blank line"},
+        "visual_metadata": {
+            "type": "string",
+            "description": "2-4 sentences for AI image generation: \"Setting: [specific city/region, country]. "
+                           "Time: [era/years]. Background: [regional landscape, architecture, environment]. "
+                           "Visual style: [art style, color palette, lighting]. People: [brief physical/cultural "
+                           "description]. Atmosphere: [mood].\""
+        },
+        "youtube_description": {"type": "string", "description": "2-3 sentence YouTube description of the lesson"},
+        "quiz_json": {
+            "type": "object",
+            "additionalProperties": False,
+            "required": ["questions"],
+            "properties": {
+                "questions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "required": ["question", "options", "answer"],
+                        "properties": {
+                            "question": {"type": "string"},
+                            "options": {"type": "array", "items": {"type": "string"}},
+                            "answer": {"type": "string"}
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
 retries = config.getint("DEFAULT", "RETRY_ATTEMPTS")
 min_segment_duration = config.getint("DEFAULT", "MIN_SEGMENT_DURATION_SECONDS", fallback=5)
+# ALIGN: timestamps from the TTS chunk offsets and the essay text; WHISPER: transcribe the narration
+TIMESTAMP_MODE = config.get("DEFAULT", "TIMESTAMP_MODE", fallback="ALIGN").strip().upper()
 
-api_key = os.getenv("OPENAI_API_KEY")
-
-if not api_key:
-    print("[ERROR] OPENAI_API_KEY not set.")
-    sys.exit(1)
-
-client = OpenAI(api_key=api_key)
+client = None
 session = requests.Session()
 
-def load_workflow_params():
+
+def init_client(shared_client=None):
+    """Use the orchestrator's shared OpenAI client, or create one for standalone runs"""
+    global client
+    if shared_client is not None:
+        client = shared_client
+    elif client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("[ERROR] OPENAI_API_KEY not set.")
+            sys.exit(1)
+        # Retries and backoff are left to rate_limiter
+        client = OpenAI(api_key=api_key, max_retries=0)
+    return client
+
+def load_workflow_params(params_file=None):
     """Load parameters from workflow-specific params file"""
     # Check for workflow-specific params file (for concurrent execution support)
-    params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
+    if not params_file:
+        params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
 
     if not os.path.exists(params_file):
         print(f"[ERROR] Workflow parameters file not found: {params_file}")
@@ -94,8 +168,11 @@ def create_output_folder(slug):
     return output_folder
 
 
-def generate_essay_from_gpt(prompt, emotion_style=None, model="gpt-4"):
-    """Generate essay using GPT-4 with optional emotion/style"""
+def generate_essay_from_gpt(prompt, emotion_style=None, model="gpt-4", on_text=None):
+    """
+    Generate essay using GPT-4 with optional emotion/style
+    With on_text, the response is streamed and on_text(delta) sees it as it arrives
+    """
     print("[AI] Generating essay with GPT-4...")
 
     # Build system message with emotion/style if provided
@@ -118,20 +195,42 @@ def generate_essay_from_gpt(prompt, emotion_style=None, model="gpt-4"):
         system_message += f" Write in a {style_desc} tone and style."
         print(f"[INFO] Using emotion style: {style_desc}")
 
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=4000
-        )
+    if STRUCTURED_ESSAY:
+        model = STRUCTURED_ESSAY_MODEL
+        system_message += (" Return the essay, a quiz on it, a YouTube title and description, and the visual "
+                           "details (location, era, people, style, mood) an illustrator needs for it.")
+
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 4000
+    }
+    if STRUCTURED_ESSAY:
+        request["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "essay", "strict": True, "schema": ESSAY_SCHEMA}
+        }
 
-        content = response.choices[0].message.content
+    try:
+        with timed_operation("gpt.essay", model=model, stream=on_text is not None):
+            if on_text is not None:
+                content = openai_stream_chat(client.chat.completions, on_text, **request)
+            else:
+                response = openai_create(client.chat.completions, "chat", **request)
+                content = response.choices[0].message.content
+        if not content:
+            print("[ERROR] The model returned no essay (refused or empty response)")
+            sys.exit(1)
         print(f"[OK] Essay generated ({len(content)} characters)")
 
+        if STRUCTURED_ESSAY:
+            # The schema guarantees the shape; a parse failure means a truncated response
+            return json.loads(content)
+
         # Extract JSON from the response
         # GPT should return JSON wrapped in ```json ... ```
         json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
@@ -169,29 +268,248 @@ def save_essay_to_docx(essay_text, output_folder):
     print(f"[OK] Essay saved to: {essay_file}")
 
 
+def synthesize_speech(text, voice, audio_file, response_format="mp3"):
+    """One TTS request, saved to audio_file"""
+    with timed_operation("tts.speech", model=tts_model, chars=len(text)) as op:
+        response = openai_create(
+            client.audio.speech, "speech",
+            model=tts_model,
+            voice=voice,
+            input=text,
+            response_format=response_format
+        )
+
+        response.stream_to_file(audio_file)
+        op["bytes"] = Path(audio_file).stat().st_size
+    return audio_file
+
+
 def create_audio_narration(essay_text, output_folder, voice_override=None):
-    """Create MP3 audio narration using OpenAI TTS"""
+    """Create MP3 audio narration using OpenAI TTS, in chunks of at most MAX_TTS_CHARS"""
     print("[AUDIO] Creating audio narration...")
 
     # Use voice override from workflow params if provided, otherwise use config
     voice_to_use = voice_override if voice_override else selected_voice
     print(f"[INFO] Using voice: {voice_to_use}")
 
-    audio_file = output_folder / AUDIO_FILE_NAME
+    with ThreadPoolExecutor(max_workers=NARRATION_WORKERS) as executor:
+        narration = ParagraphNarration(executor, output_folder, voice_to_use)
+        for paragraph in essay_paragraphs(essay_text):
+            narration.add(paragraph)
+        return narration.finish(essay_text)
+
+
+def essay_paragraphs(article_text):
+    """The paragraphs the essay is saved and narrated in"""
+    return [paragraph.strip() for paragraph in article_text.split('\n\n') if paragraph.strip()]
+
+
+class ArticleTextStream:
+    """
+    Pulls finished paragraphs of article_text out of a streaming essay response
+    feed() takes each content delta; the JSON string value of "article_text" is
+    decoded as it arrives, and every paragraph followed by a blank line (or the
+    end of the string) goes to on_paragraph. on_complete gets the whole text.
+    """
+
+    KEY = re.compile(r'"article_text"\s*:\s*"')
+
+    def __init__(self, on_paragraph, on_complete=None):
+        self.on_paragraph = on_paragraph
+        self.on_complete = on_complete
+        self.raw = ""
+        self.text = ""
+        self.closed = False
+        self._pos = None
+        self._emitted = 0
+
+    def feed(self, delta):
+        self.raw += delta
+        if self.closed:
+            return
+        if self._pos is None:
+            match = self.KEY.search(self.raw)
+            if not match:
+                return
+            self._pos = match.end()
+        self._decode()
+
+        parts = self.text.split('\n\n')
+        finished = parts if self.closed else parts[:-1]
+        for part in finished[self._emitted:]:
+            if part.strip():
+                self.on_paragraph(part.strip())
+        self._emitted = len(finished)
+        if self.closed and self.on_complete:
+            self.on_complete(self.text)
+
+    def _decode(self):
+        """Decode the string value up to the last complete character or escape"""
+        raw, i = self.raw, self._pos
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self.closed = True
+                i += 1
+                break
+            if char != '\\':
+                self.text += char
+                i += 1
+                continue
+            length = 2
+            if raw[i + 1:i + 2] == 'u':
+                length = 6
+                # A high surrogate is only decodable together with its low half
+                if raw[i + 2:i + 4].lower() in ('d8', 'd9', 'da', 'db'):
+                    length = 12
+            if i + length > len(raw):
+                break
+            try:
+                self.text += json.loads(f'"{raw[i:i + length]}"')
+            except ValueError:
+                self.text += raw[i + 1:i + length]
+            i += length
+        self._pos = i
+
 
+def synthesize_chunk(text, voice, cache_file):
+    """Synthesize one chunk as PCM into the TTS cache"""
+    partial_file = cache_file.with_name(cache_file.name + ".part")
     try:
-        response = client.audio.speech.create(
-            model=tts_model,
-            voice=voice_to_use,
-            input=essay_text
-        )
+        synthesize_speech(text, voice, partial_file, TTS_PCM_FORMAT)
+        os.replace(partial_file, cache_file)
+    except BaseException:
+        partial_file.unlink(missing_ok=True)
+        raise
+    return cache_file
+
+
+class ParagraphNarration:
+    """
+    Synthesizes paragraphs as they are added, each in chunks of at most
+    MAX_TTS_CHARS, and joins them into the narration MP3. Chunks already in
+    the output folder's TTS cache (same text, voice and model) are reused.
+    """
+
+    def __init__(self, executor, output_folder, voice):
+        self.executor = executor
+        self.output_folder = output_folder
+        self.voice = voice
+        (output_folder / TTS_CACHE_DIR_NAME).mkdir(exist_ok=True)
+        self.paragraphs = []
+        self.chunks = []
+        self.futures = []
+        self.cache_hits = 0
+        self._pending = {}
+        self.started = time.perf_counter()
+        self._first_audio_lock = threading.Lock()
+        self._first_audio_recorded = False
+
+    def add(self, paragraph):
+        self.paragraphs.append(paragraph)
+        chunks = split_tts_chunks(paragraph, max_chars)
+        print(f"[AUDIO] Narrating paragraph {len(self.paragraphs)}"
+              + (f" ({len(chunks)} chunks)..." if len(chunks) > 1 else "..."))
+        for text in chunks:
+            key = tts_cache_key(text, self.voice, tts_model)
+            self.chunks.append({"paragraph": len(self.paragraphs) - 1, "text": text, "key": key})
+            future = self._pending.get(key)
+            if future is None:
+                cache_file = tts_cache_file(self.output_folder, key)
+                if cache_file.exists():
+                    self.cache_hits += 1
+                    record_operation({"name": "tts.cache_hit", "seconds": 0.0, "ok": True, "chars": len(text)})
+                    future = Future()
+                    future.set_result(cache_file)
+                    self._record_first_audio()
+                else:
+                    future = self.executor.submit(contextvars.copy_context().run,
+                                                  self._synthesize, text, cache_file)
+                self._pending[key] = future
+            self.futures.append(future)
+
+    def _synthesize(self, text, cache_file):
+        # Runs in the step's copied context, so the metric reaches the step's recorder
+        cache_file = synthesize_chunk(text, self.voice, cache_file)
+        self._record_first_audio()
+        return cache_file
+
+    def _record_first_audio(self):
+        with self._first_audio_lock:
+            if self._first_audio_recorded:
+                return
+            self._first_audio_recorded = True
+        record_operation({"name": "tts.first_audio", "ok": True,
+                          "seconds": round(time.perf_counter() - self.started, 3)})
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+    def finish(self, article_text):
+        """Wait for the chunks and join them; re-narrate if the final essay has other paragraphs"""
+        audio_file = self.output_folder / AUDIO_FILE_NAME
+        try:
+            part_files = [future.result() for future in self.futures]
+            if not part_files or essay_paragraphs(article_text) != self.paragraphs:
+                # Paragraphs that did match are in the TTS cache by now
+                print("[WARN] Streamed paragraphs differ from the final essay, narrating it again")
+                return create_audio_narration(article_text, self.output_folder, self.voice)
+            if self.cache_hits:
+                print(f"[INFO] {self.cache_hits} of {len(part_files)} chunks reused from the TTS cache")
+            offsets = join_pcm_to_mp3(part_files, audio_file)
+            chunks_file = save_chunk_offsets(self.chunks, offsets, self.output_folder)
+            prune_tts_cache(self.output_folder, {chunk["key"] for chunk in self.chunks})
+            print(f"[OK] Audio saved to: {audio_file} ({len(part_files)} chunks, {offsets[-1][1]:.1f}s)")
+            print(f"[OK] Chunk offsets saved to: {chunks_file}")
+            return audio_file
+        except Exception as e:
+            print(f"[ERROR] Error creating audio: {e}")
+            sys.exit(1)
+
+
+def write_timestamp_file(segments, output_folder):
+    """Write segments ({"start", "end", "text"}) in the format Step 2 reads"""
+    timestamp_file = output_folder / timestamp_file_name
+    with open(timestamp_file, 'w', encoding='utf-8') as f:
+        segment_num = 1
+        for segment in segments:
+            start_time = segment['start']
+            end_time = segment['end']
+            text = segment['text'].strip()
+
+            f.write(f"Segment {segment_num}\n")
+            f.write(f"Start: {start_time:.2f}s\n")
+            f.write(f"End: {end_time:.2f}s\n")
+            f.write(f"Text: {text}\n")
+            f.write("\n")
+
+            segment_num += 1
+
+    print(f"[OK] Timestamps saved to: {timestamp_file}")
+    print(f"[OK] Total segments: {len(segments)}")
+
+
+def create_timestamps(audio_file, output_folder):
+    """Timestamps by aligning the essay text (TIMESTAMP_MODE=ALIGN) or by Whisper"""
+    if TIMESTAMP_MODE == "ALIGN":
+        chunks = load_chunk_offsets(output_folder)
+        if chunks:
+            return create_timestamps_by_alignment(audio_file, output_folder, chunks)
+        print("[WARN] No narration chunk offsets, falling back to Whisper")
+    return create_timestamps_with_whisper(audio_file, output_folder)
+
+
+def create_timestamps_by_alignment(audio_file, output_folder, chunks):
+    """Segment the known essay text using the TTS chunk offsets and the pauses in the audio"""
+    print("[TIME] Creating timestamps by aligning the essay text...")
 
-        response.stream_to_file(audio_file)
-        print(f"[OK] Audio saved to: {audio_file}")
-        return audio_file
+    try:
+        segments = align_narration(chunks, audio_file, min_segment_duration)
+        write_timestamp_file(segments, output_folder)
 
     except Exception as e:
-        print(f"[ERROR] Error creating audio: {e}")
+        print(f"[ERROR] Error creating timestamps: {e}")
         sys.exit(1)
 
 
@@ -200,27 +518,9 @@ def create_timestamps_with_whisper(audio_file, output_folder):
     print("[TIME] Creating timestamps with Whisper...")
 
     try:
-        model = whisper.load_model(whisper_model)
-        result = model.transcribe(str(audio_file), word_timestamps=True)
-
-        timestamp_file = output_folder / timestamp_file_name
-        with open(timestamp_file, 'w', encoding='utf-8') as f:
-            segment_num = 1
-            for segment in result['segments']:
-                start_time = segment['start']
-                end_time = segment['end']
-                text = segment['text'].strip()
-
-                f.write(f"Segment {segment_num}\n")
-                f.write(f"Start: {start_time:.2f}s\n")
-                f.write(f"End: {end_time:.2f}s\n")
-                f.write(f"Text: {text}\n")
-                f.write("\n")
-
-                segment_num += 1
-
-        print(f"[OK] Timestamps saved to: {timestamp_file}")
-        print(f"[OK] Total segments: {len(result['segments'])}")
+        # Through the shared service if WHISPER_SERVICE_URL is set; the model is loaded once either way
+        result = transcribe(audio_file, whisper_model, word_timestamps=True)
+        write_timestamp_file(result['segments'], output_folder)
 
     except Exception as e:
         print(f"[ERROR] Error creating timestamps: {e}")
@@ -240,7 +540,7 @@ def save_youtube_metadata(data, output_folder):
     # Save description
     desc_file = output_folder / "youtubedescription.txt"
     with open(desc_file, 'w', encoding='utf-8') as f:
-        f.write(f"Learn about {title}\n\n")
+        f.write(f"{data.get('youtube_description') or f'Learn about {title}'}\n\n")
         f.write(f"Generated by Smartikle Content Pipeline\n")
         f.write(f"Slug: {slug}\n")
 
@@ -318,15 +618,17 @@ Format as:
 """
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert at extracting visual details for AI image generation. Be specific and concise."},
-                {"role": "user", "content": metadata_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
+        with timed_operation("gpt.metadata", model="gpt-4"):
+            response = openai_create(
+                client.chat.completions, "chat",
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": "You are an expert at extracting visual details for AI image generation. Be specific and concise."},
+                    {"role": "user", "content": metadata_prompt}
+                ],
+                temperature=0.3,
+                max_tokens=500
+            )
 
         metadata = response.choices[0].message.content.strip()
         print(f"[OK] Visual metadata extracted ({len(metadata)} characters)")
@@ -345,7 +647,87 @@ def save_visual_metadata(metadata, output_folder):
     print(f"[OK] Visual metadata saved to: {metadata_file}")
 
 
-def main():
+def run_post_essay_tasks(params, essay_data, article_text, voice_selection, output_folder):
+    """
+    DOCX and JSON saves, visual metadata (GPT) and narration (TTS) do not
+    depend on each other, so they run as concurrent tasks and only the
+    narration is on the way to whisper (essay -> TTS -> whisper).
+    Returns (visual_metadata, audio_file) once all of them are done
+    """
+    def visual_metadata_task():
+        # Part of the structured response, if that was used
+        metadata = essay_data.get('visual_metadata') or extract_visual_metadata(params['topic'], article_text)
+        save_visual_metadata(metadata, output_folder)
+        return metadata
+
+    essay_title = essay_data.get('title', params['topic'])
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        def submit(fn, *args):
+            return executor.submit(contextvars.copy_context().run, fn, *args)
+
+        audio_future = submit(create_audio_narration, article_text, output_folder, voice_selection)
+        metadata_future = submit(visual_metadata_task)
+        save_futures = [
+            submit(save_essay_to_docx, article_text, output_folder),
+            submit(save_essay_json, params['slug'], essay_title, article_text, output_folder)
+        ]
+        for future in save_futures:
+            future.result()
+        return metadata_future.result(), audio_future.result()
+
+
+def stream_essay_and_narration(params, emotion_style, voice_selection, output_folder):
+    """
+    Stream the essay and start work on it before it is complete: each finished
+    paragraph is narrated right away, and the visual metadata is extracted as
+    soon as the article text is. Writes the same files as the sequential path.
+    Returns (essay_data, article_text, visual_metadata, audio_file)
+    """
+    voice_to_use = voice_selection if voice_selection else selected_voice
+    print(f"[INFO] Using voice: {voice_to_use}")
+
+    with ThreadPoolExecutor(max_workers=NARRATION_WORKERS + 1) as executor:
+        narration = ParagraphNarration(executor, output_folder, voice_to_use)
+        metadata_future = []
+
+        def on_article_complete(text):
+            if STRUCTURED_ESSAY:
+                # Comes with the essay response itself
+                return
+            metadata_future.append(executor.submit(contextvars.copy_context().run,
+                                                   extract_visual_metadata, params['topic'], text))
+
+        stream = ArticleTextStream(narration.add, on_article_complete)
+        try:
+            essay_data = generate_essay_from_gpt(params['prompt'], emotion_style, on_text=stream.feed)
+        except BaseException:
+            narration.cancel()
+            for future in metadata_future:
+                future.cancel()
+            raise
+
+        article_text = essay_data.get('article_text', '')
+        if not article_text:
+            print("[ERROR] No article text generated")
+            sys.exit(1)
+
+        save_essay_to_docx(article_text, output_folder)
+        essay_title = essay_data.get('title', params['topic'])
+        save_essay_json(params['slug'], essay_title, article_text, output_folder)
+
+        if STRUCTURED_ESSAY:
+            visual_metadata = essay_data['visual_metadata']
+        elif metadata_future and stream.text.strip() == article_text.strip():
+            visual_metadata = metadata_future[0].result()
+        else:
+            visual_metadata = extract_visual_metadata(params['topic'], article_text)
+        save_visual_metadata(visual_metadata, output_folder)
+
+        audio_file = narration.finish(article_text)
+    return essay_data, article_text, visual_metadata, audio_file
+
+
+def main(params_file=None, auto_launch=True):
     print("""
 ================================================================
               STEP 1: Essay Creation & Audio Narration
@@ -354,38 +736,34 @@ def main():
     """)
 
     # Load workflow parameters
-    params = load_workflow_params()
+    params = load_workflow_params(params_file)
+    configure_llm_cache(params)
 
     # Create output folder using slug
     output_folder = create_output_folder(params['slug'])
 
     # Generate essay using GPT with emotion style
     emotion_style = params.get('emotionStyle', None)
-    essay_data = generate_essay_from_gpt(params['prompt'], emotion_style)
-
-    # Extract article text
-    article_text = essay_data.get('article_text', '')
-    if not article_text:
-        print("[ERROR] No article text generated")
-        sys.exit(1)
-
-    # Save essay to DOCX
-    save_essay_to_docx(article_text, output_folder)
+    voice_selection = params.get('ttsVoice', None)  # Get voice from params if available
 
-    # Save essay to JSON
-    essay_title = essay_data.get('title', params['topic'])
-    save_essay_json(params['slug'], essay_title, article_text, output_folder)
+    if STREAM_ESSAY:
+        essay_data, article_text, visual_metadata, audio_file = stream_essay_and_narration(
+            params, emotion_style, voice_selection, output_folder)
+    else:
+        essay_data = generate_essay_from_gpt(params['prompt'], emotion_style)
 
-    # Extract visual metadata for image generation
-    visual_metadata = extract_visual_metadata(params['topic'], article_text)
-    save_visual_metadata(visual_metadata, output_folder)
+        # Extract article text
+        article_text = essay_data.get('article_text', '')
+        if not article_text:
+            print("[ERROR] No article text generated")
+            sys.exit(1)
 
-    # Create audio narration with selected voice
-    voice_selection = params.get('ttsVoice', None)  # Get voice from params if available
-    audio_file = create_audio_narration(article_text, output_folder, voice_selection)
+        # Save the essay, extract visual metadata and create the narration side by side
+        visual_metadata, audio_file = run_post_essay_tasks(
+            params, essay_data, article_text, voice_selection, output_folder)
 
-    # Create timestamps with Whisper
-    create_timestamps_with_whisper(audio_file, output_folder)
+    # Create timestamps (essay alignment or Whisper)
+    create_timestamps(audio_file, output_folder)
 
     # Save YouTube metadata
     save_youtube_metadata(essay_data, output_folder)
@@ -400,6 +778,9 @@ def main():
 ================================================================
     """)
 
+    if not auto_launch:
+        return
+
     # Auto-launch STEP 2
     print("\n[START] Auto-launching STEP 2...")
     try:
@@ -411,5 +792,58 @@ def main():
         print("[WARN] Could not auto-launch STEP 2")
 
 
+def renarrate(params_file=None):
+    """
+    Narrate an edited essay again: the body of essay.json in the workflow's
+    output folder replaces essay_short.docx, the narration and its timestamps.
+    Paragraphs the edit did not touch come from the TTS cache.
+    The orchestrator runs this instead of the whole step when essay.json is
+    the only step 1 output edited since the last run, so editing essay.json
+    and re-running the workflow keeps the edit and redoes steps 2-4.
+    """
+    params = load_workflow_params(params_file)
+    output_folder = create_output_folder(params['slug'])
+
+    essay_file = output_folder / "essay.json"
+    if not essay_file.exists():
+        print(f"[ERROR] Essay JSON not found: {essay_file}")
+        sys.exit(1)
+    with open(essay_file, 'r', encoding='utf-8') as f:
+        article_text = json.load(f).get('body', '')
+    if not article_text:
+        print("[ERROR] essay.json has no body to narrate")
+        sys.exit(1)
+
+    save_essay_to_docx(article_text, output_folder)
+    audio_file = create_audio_narration(article_text, output_folder, params.get('ttsVoice', None))
+    create_timestamps(audio_file, output_folder)
+    print("[OK] Narration updated")
+
+
+def run(params_file, shared_client=None):
+    """
+    In-process entry point for workflow_orchestrator.
+    The orchestrator schedules STEP 2 itself, so the auto-launch is skipped.
+    """
+    init_client(shared_client)
+    main(params_file, auto_launch=False)
+
+
+def run_renarrate(params_file, shared_client=None):
+    """In-process entry point for re-narrating an edited essay.json"""
+    init_client(shared_client)
+    renarrate(params_file)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--renarrate", action="store_true",
+                        help="Narrate the workflow's edited essay.json again instead of writing a new essay")
+    args = parser.parse_args()
+
+    exit_on_sigterm()
+    init_client()
+    if args.renarrate:
+        renarrate()
+    else:
+        main()
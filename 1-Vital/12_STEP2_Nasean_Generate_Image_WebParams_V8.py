@@ -8,8 +8,9 @@ This version accepts parameters from workflow_params.json instead of Google Shee
 import sys
 import io
 
-# Fix Unicode encoding for Windows console
-if sys.platform == 'win32':
+# Fix Unicode encoding for Windows console (only when run as a script; an
+# orchestrator importing this step owns the console streams)
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
@@ -25,21 +26,31 @@ except Exception as e:
 
 import os
 import re
-import requests
-import time
 import sys
 import json
+import hashlib
+import contextvars
 import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 from openai import OpenAI
 
-# --- Load Config File ---
+from workflow_progress import report_progress
+from rate_limiter import openai_create, backoff_delay
+from llm_cache import configure_llm_cache
+from workflow_metrics import timed_operation
+from step_journal import StepJournal, is_complete_png
+from image_download import save_image_result
+from workflow_cancel import cancellable_sleep, exit_on_sigterm
+
+# --- Load Config File (relative to this script, not the working directory) ---
+SCRIPT_DIR = Path(__file__).resolve().parent
 config = configparser.ConfigParser()
-with open("DONT_DELETE_ENV_FILES/config/12_STEP2_Nasean_Generate_Image_from_prompts_short_V7.txt", "r", encoding="utf-8") as f:
+with open(SCRIPT_DIR / "DONT_DELETE_ENV_FILES/config/12_STEP2_Nasean_Generate_Image_from_prompts_short_V7.txt", "r", encoding="utf-8") as f:
     config.read_file(f)
 
-ROOT_FOLDER = Path(__file__).resolve().parent / "Course_Collective"
+ROOT_FOLDER = Path(os.getenv("COURSE_COLLECTIVE_ROOT") or SCRIPT_DIR / "Course_Collective")
 
 INPUT_FILE_NAME = config.get("DEFAULT", "INPUT_FILE")
 OUTPUT_FOLDER_NAME = config.get("DEFAULT", "OUTPUT_FOLDER")
@@ -64,18 +75,42 @@ style_tags = config.get("DEFAULT", "style_tags", fallback="").split(",")
 system_msg = config.get("DEFAULT", "system_msg")
 always_append = f"{append}, {', '.join(style_tags)}"
 
+# Segments prompted and generated at the same time (resource_slot still caps OpenAI calls host-wide)
+IMAGE_WORKERS = config.getint("DEFAULT", "IMAGE_WORKERS", fallback=6)
+# b64_json returns the PNG in the API response; url needs a second download
+IMAGE_RESPONSE_FORMAT = config.get("DEFAULT", "IMAGE_RESPONSE_FORMAT", fallback="b64_json").strip()
+
+# Batch mode: all segment prompts from one chat completion, split only near the context limit
+PROMPT_BATCH = config.get("DEFAULT", "PROMPT_BATCH", fallback="YES").strip().upper() == "YES"
+PROMPT_MODEL = "gpt-4"
+PROMPT_MODEL_CONTEXT_TOKENS = 8192
+# Room left for the reply, per segment (one-sentence prompt plus JSON framing)
+PROMPT_REPLY_TOKENS_PER_SEGMENT = 150
+
 # --- OpenAI Setup ---
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    print("[ERROR] OPENAI_API_KEY not set.")
-    sys.exit(1)
-client = OpenAI(api_key=api_key)
+client = None
+
 
+def init_client(shared_client=None):
+    """Use the orchestrator's shared OpenAI client, or create one for standalone runs"""
+    global client
+    if shared_client is not None:
+        client = shared_client
+    elif client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("[ERROR] OPENAI_API_KEY not set.")
+            sys.exit(1)
+        # Retries and backoff are left to rate_limiter
+        client = OpenAI(api_key=api_key, max_retries=0)
+    return client
 
-def load_workflow_params():
+
+def load_workflow_params(params_file=None):
     """Load parameters from workflow-specific params file"""
     # Check for workflow-specific params file (for concurrent execution support)
-    params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
+    if not params_file:
+        params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
 
     if not os.path.exists(params_file):
         print(f"[ERROR] Workflow parameters file not found: {params_file}")
@@ -109,23 +144,198 @@ def generate_prompt(narration):
         print(f"[WARN] Warning: Prompt too long ({len(full_prompt)} characters). Trimming.")
         full_prompt = full_prompt[:3000] + "..."
 
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": full_prompt}
-        ]
-    )
+    with timed_operation("gpt.image_prompt", model=PROMPT_MODEL):
+        response = openai_create(
+            client.chat.completions, "chat",
+            model=PROMPT_MODEL,
+            messages=[
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": full_prompt}
+            ]
+        )
     return response.choices[0].message.content.strip().replace("Prompt:", "").strip()
 
 
-def main():
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def build_batch_prompt_message(batch):
+    """User message asking for one prompt per segment as a JSON array"""
+    segment_lines = "\n".join(f"{filename}: {narration}" for filename, narration in batch)
+    return (
+        f"Create one prompt for a {style} {mode} illustration for each narration segment below.\n"
+        f"The segments are consecutive parts of one story, so keep people, setting and look consistent.\n"
+        f"Follow this style instruction: {guidance}\n"
+        f"Avoid: {negative_guidance}\n"
+        f"End every prompt with: {always_append}\n"
+        f"Respond only with a JSON array with one object per segment, in order: "
+        f'[{{"segment": "<segment name>", "prompt": "<one sentence>"}}]\n\n'
+        f"Segments:\n{segment_lines}"
+    )
+
+
+def split_prompt_batches(segments):
+    """Group segments so each request, with its expected reply, stays within the context window"""
+    budget = int(PROMPT_MODEL_CONTEXT_TOKENS * 0.9)
+    overhead = estimate_tokens(system_msg + build_batch_prompt_message([]))
+    batches, current, used = [], [], overhead
+    for filename, narration in segments:
+        cost = estimate_tokens(f"{filename}: {narration}\n") + PROMPT_REPLY_TOKENS_PER_SEGMENT
+        if current and used + cost > budget:
+            batches.append(current)
+            current, used = [], overhead
+        current.append((filename, narration))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_prompt_array(content):
+    """{segment name: prompt} from a JSON array reply, tolerating a ```json fence around it"""
+    match = re.search(r"\[.*\]", content, re.DOTALL)
+    items = json.loads(match.group(0) if match else content)
+    return {
+        str(item["segment"]).strip(): str(item["prompt"]).replace("Prompt:", "").strip()
+        for item in items
+        if isinstance(item, dict) and "segment" in item and "prompt" in item
+    }
+
+
+def generate_prompts_batched(segments):
+    """
+    Generate the prompts of many segments with as few chat completions as possible
+    Returns {filename: prompt}; segments missing from it (failed batch, dropped
+    item, too-short prompt) fall back to generate_prompt()
+    """
+    prompts = {}
+    for batch in split_prompt_batches(segments):
+        print(f"[AI] Generating {len(batch)} image prompts in one request...")
+        try:
+            with timed_operation("gpt.image_prompt_batch", model=PROMPT_MODEL, segments=len(batch)):
+                response = openai_create(
+                    client.chat.completions, "chat",
+                    model=PROMPT_MODEL,
+                    messages=[
+                        {"role": "system", "content": system_msg},
+                        {"role": "user", "content": build_batch_prompt_message(batch)}
+                    ],
+                    max_tokens=PROMPT_REPLY_TOKENS_PER_SEGMENT * len(batch)
+                )
+            batch_prompts = parse_prompt_array(response.choices[0].message.content)
+        except Exception as e:
+            print(f"[WARN] Batched prompt request failed, using one request per segment: {e}")
+            continue
+
+        for filename, _ in batch:
+            prompt = batch_prompts.get(filename, "")
+            if len(prompt) >= 10:
+                prompts[filename] = prompt
+        missing = len(batch) - sum(1 for filename, _ in batch if filename in prompts)
+        if missing:
+            print(f"[WARN] {missing} prompts missing from the batch reply, generating them one by one")
+    return prompts
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def image_already_done(journal, filename, image_path, narration_hash):
+    """
+    Decide whether an existing segment image can be kept
+    A journaled image is kept if its narration and size are unchanged and the
+    file still has the recorded checksum. Images without a matching checksum
+    (older runs, or replaced in the review tool) are kept only if the PNG is
+    complete, so a truncated download is generated again.
+    """
+    entry = journal.get(filename)
+    if entry and (entry.get("narration") != narration_hash or entry.get("size") != size):
+        print(f"[REDO] {filename} — narration or size changed since it was generated.")
+        return False
+    if journal.is_done(filename, image_path, narration=narration_hash, size=size):
+        return True
+    if image_path.exists():
+        if is_complete_png(image_path):
+            journal.record(filename, image_path, narration=narration_hash, size=size,
+                           model=entry.get("model") if entry else None,
+                           prompt=entry.get("prompt") if entry else None)
+            return True
+        print(f"[REDO] {filename} — incomplete image file, generating again.")
+    return False
+
+
+def generate_segment_image(journal, image_folder, filename, narration, essay_metadata, prompt,
+                           position, total_segments):
+    """
+    Generate and save the image for one segment, with retries
+    prompt comes from the batched request; without one it is generated here
+    Returns ("created" | "skipped" | "failed", prompt line or None)
+    """
+    image_path = image_folder / filename
+    narration_hash = text_hash(f"{narration}{essay_metadata}")
+
+    print(f"[AI] Generating image {position}/{total_segments}: {filename}")
+
+    # Generate prompt
+    if not prompt:
+        prompt = generate_prompt(narration)
+    if essay_metadata:
+        prompt += f"\n{essay_metadata}"
+
+    if not prompt or len(prompt.strip()) < 10:
+        print(f"[WARN] Skipping {filename} — invalid prompt.")
+        return "skipped", None
+    prompt_line = f"{filename} -> {prompt}"
+
+    # Generate image with retries
+    for attempt in range(retries):
+        try:
+            with timed_operation("dalle.generate", image=filename, size=size):
+                response = openai_create(
+                    client.images, "images",
+                    model="dall-e-3",
+                    prompt=prompt,
+                    size=size,
+                    quality="standard",
+                    response_format=IMAGE_RESPONSE_FORMAT,
+                    n=1
+                )
+            # Decoded or streamed to .part and renamed, so a crash never leaves a partial PNG
+            item = response.data[0]
+            with timed_operation("dalle.save", image=filename, source="b64" if item.b64_json else "url") as op:
+                op["bytes"] = save_image_result(item, image_path)
+
+            # Save prompt text
+            with open(image_folder / Path(filename).with_suffix(".txt"), "w", encoding="utf-8") as pf:
+                pf.write(prompt)
+
+            if image_path.exists():
+                journal.record(filename, image_path, narration=narration_hash, size=size,
+                               model="dall-e-3", prompt=text_hash(prompt))
+                print(f"[OK] Saved {filename}")
+                return "created", prompt_line
+            print(f"[ERROR] {filename} not saved.")
+            return "failed", prompt_line
+
+        except Exception as e:
+            print(f"[ERROR] Attempt {attempt+1} failed for {filename}: {e}")
+            if attempt < retries - 1:
+                # Rate limits were already waited out by openai_create; this backs off other failures
+                cancellable_sleep(backoff_delay(attempt))
+    return "failed", prompt_line
+
+
+def main(params_file=None):
     print("\n" + "="*60)
     print("STEP 2: Generate Images from Prompts")
     print("="*60 + "\n")
 
     # Load workflow parameters
-    params = load_workflow_params()
+    params = load_workflow_params(params_file)
+    configure_llm_cache(params)
 
     # Use slug as folder name (e.g., WED26-2026-01-15-23-37-49)
     folder_name = params['slug']
@@ -204,69 +414,48 @@ def main():
 
     print(f"[INFO] Found {len(segments)} narration segments")
 
-    # Generate images
-    generated_prompts = []
+    # Generate images concurrently, checkpointing each finished image in the step journal
+    journal = StepJournal(output_folder, "step2_images")
     total_segments = len(segments)
-    skipped = created = failed = 0
+    results = {}
 
+    # Skip segments that already have a complete image for this narration
+    todo = []
     for idx_img, (filename, narration) in enumerate(segments, start=1):
-        image_path = image_folder / filename
-
-        # Skip if image already exists
-        if image_path.exists():
+        narration_hash = text_hash(f"{narration}{essay_metadata}")
+        if image_already_done(journal, filename, image_folder / filename, narration_hash):
             print(f"[SKIP] {filename} — image already exists.")
-            skipped += 1
-            continue
-
-        print(f"[AI] Generating image {idx_img}/{total_segments}: {filename}")
-
-        # Generate prompt
-        prompt = generate_prompt(narration)
-        if essay_metadata:
-            prompt += f"\n{essay_metadata}"
-
-        if not prompt or len(prompt.strip()) < 10:
-            print(f"[WARN] Skipping {filename} — invalid prompt.")
-            skipped += 1
-            continue
-
-        generated_prompts.append(f"{filename} -> {prompt}")
-
-        # Generate image with retries
-        for attempt in range(retries):
-            try:
-                response = client.images.generate(
-                    model="dall-e-3",
-                    prompt=prompt,
-                    size=size,
-                    quality="standard",
-                    n=1
-                )
-                img_url = response.data[0].url
-                img_data = requests.get(img_url).content
-
-                # Save image
-                with open(image_path, "wb") as f:
-                    f.write(img_data)
-
-                # Save prompt text
-                with open(image_folder / Path(filename).with_suffix(".txt"), "w", encoding="utf-8") as pf:
-                    pf.write(prompt)
-
-                if image_path.exists():
-                    print(f"[OK] Saved {filename}")
-                    created += 1
-                else:
-                    print(f"[ERROR] {filename} not saved.")
-                    failed += 1
-                break
-
-            except Exception as e:
-                print(f"[ERROR] Attempt {attempt+1} failed for {filename}: {e}")
-                if attempt == retries - 1:
-                    failed += 1
-                else:
-                    time.sleep(2)  # Wait before retry
+            results[filename] = ("skipped", None)
+        else:
+            todo.append((idx_img, filename, narration))
+    report_progress(len(results), total_segments, "image")
+
+    prompts = {}
+    if PROMPT_BATCH and todo:
+        prompts = generate_prompts_batched([(filename, narration) for _, filename, narration in todo])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGE_WORKERS, len(todo)))) as executor:
+        # Each worker runs in a copy of this context, so progress, metrics,
+        # cancellation and priority still reach the orchestrator
+        futures = {
+            executor.submit(contextvars.copy_context().run, generate_segment_image, journal, image_folder,
+                            filename, narration, essay_metadata, prompts.get(filename),
+                            idx_img, total_segments): filename
+            for idx_img, filename, narration in todo
+        }
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                report_progress(len(results), total_segments, "image")
+        except BaseException:
+            # Don't start segments that are still queued
+            for future in futures:
+                future.cancel()
+            raise
+
+    outcomes = [outcome for outcome, _ in results.values()]
+    created, skipped, failed = (outcomes.count(name) for name in ("created", "skipped", "failed"))
+    generated_prompts = [results[filename][1] for filename, _ in segments if results[filename][1]]
 
     # Save generated prompts
     with open(prompt_output_file, "w", encoding="utf-8") as pf:
@@ -338,5 +527,13 @@ def main():
         sys.exit(0)
 
 
+def run(params_file, shared_client=None):
+    """In-process entry point for workflow_orchestrator"""
+    init_client(shared_client)
+    main(params_file)
+
+
 if __name__ == "__main__":
+    exit_on_sigterm()
+    init_client()
     main()
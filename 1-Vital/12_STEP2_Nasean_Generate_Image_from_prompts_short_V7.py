@@ -1,7 +1,6 @@
 # --- Start processing loop ---
 import os
 import re
-import requests
 import time
 import sys
 import configparser
@@ -14,6 +13,10 @@ from tkcalendar import Calendar
 import tkinter as tk
 import argparse
 
+from rate_limiter import openai_create, backoff_delay
+from image_download import save_image_result
+from workflow_cancel import exit_on_sigterm, cancellable_sleep
+
 # --- Load Config File ---
 config = configparser.ConfigParser()
 with open("DONT_DELETE_ENV_FILES/config/12_STEP2_Nasean_Generate_Image_from_prompts_short_V7.txt", "r", encoding="utf-8") as f:
@@ -99,7 +102,9 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     print("❌ ERROR: OPENAI_API_KEY not set.")
     exit()
-client = OpenAI(api_key=api_key)
+# Retries and backoff are left to rate_limiter
+client = OpenAI(api_key=api_key, max_retries=0)
+exit_on_sigterm()
 
 def generate_prompt(narration):
     user_msg = (
@@ -114,7 +119,8 @@ def generate_prompt(narration):
     if len(full_prompt) > 3000:
         print(f"⚠️ Warning: Prompt too long ({len(full_prompt)} characters). Trimming.")
         full_prompt = full_prompt[:3000] + "..."
-    response = client.chat.completions.create(
+    response = openai_create(
+        client.chat.completions, "chat",
         model="gpt-4",
         messages=[
             {"role": "system", "content": system_msg},
@@ -212,17 +218,15 @@ for idx, row in enumerate(data_rows, start=2):
 
         for attempt in range(retries):
             try:
-                response = client.images.generate(
+                response = openai_create(
+                    client.images, "images",
                     model="dall-e-3",
                     prompt=prompt,
                     size=size,
                     quality="standard",
                     n=1
                 )
-                img_url = response.data[0].url
-                img_data = requests.get(img_url).content
-                with open(image_path, "wb") as f:
-                    f.write(img_data)
+                save_image_result(response.data[0], image_path)
                 with open(image_folder / Path(filename).with_suffix(".txt"), "w", encoding="utf-8") as pf:
                     pf.write(prompt)
                 if image_path.exists():
@@ -236,6 +240,9 @@ for idx, row in enumerate(data_rows, start=2):
                 print(f"❌ Attempt {attempt+1} failed for {filename}: {e}")
                 if attempt == retries - 1:
                     failed += 1
+                else:
+                    # Rate limits were already waited out by openai_create; this backs off other failures
+                    cancellable_sleep(backoff_delay(attempt))
 
     with open(prompt_output_file, "w", encoding="utf-8") as pf:
         pf.write("\n".join(generated_prompts))
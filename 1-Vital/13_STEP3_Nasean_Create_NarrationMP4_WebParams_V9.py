@@ -8,8 +8,9 @@ This version accepts parameters from workflow_params.json instead of Google Shee
 import sys
 import io
 
-# Fix Unicode encoding for Windows console
-if sys.platform == 'win32':
+# Fix Unicode encoding for Windows console (only when run as a script; an
+# orchestrator importing this step owns the console streams)
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
@@ -32,20 +33,26 @@ import configparser
 from pathlib import Path
 from datetime import datetime
 
-# === Load config ===
+from resource_limits import resource_slot
+from workflow_metrics import timed_operation
+from workflow_cancel import run_process
+
+# === Load config (relative to this script, not the working directory) ===
+SCRIPT_DIR = Path(__file__).resolve().parent
 config = configparser.ConfigParser()
-config.read("DONT_DELETE_ENV_FILES/config/13_STEP3_Nasean_Create_Nasean_NarrationMP4_vertical.txt")
+config.read(SCRIPT_DIR / "DONT_DELETE_ENV_FILES/config/13_STEP3_Nasean_Create_Nasean_NarrationMP4_vertical.txt")
 
-ROOT_FOLDER = Path(__file__).resolve().parent / "Course_Collective"
+ROOT_FOLDER = Path(os.getenv("COURSE_COLLECTIVE_ROOT") or SCRIPT_DIR / "Course_Collective")
 FRAME_RATE = config.getint("DEFAULT", "FRAME_RATE")
 VIDEO_CODEC = config.get("DEFAULT", "VIDEO_CODEC")
 PIX_FMT = config.get("DEFAULT", "PIX_FMT")
 
 
-def load_workflow_params():
+def load_workflow_params(params_file=None):
     """Load parameters from workflow-specific params file"""
     # Check for workflow-specific params file (for concurrent execution support)
-    params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
+    if not params_file:
+        params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
 
     if not os.path.exists(params_file):
         print(f"[ERROR] Workflow parameters file not found: {params_file}")
@@ -64,13 +71,13 @@ def load_workflow_params():
     return params
 
 
-def main():
+def main(params_file=None):
     print("\n" + "="*60)
     print("STEP 3: Create Narration Video")
     print("="*60 + "\n")
 
     # Load workflow parameters
-    params = load_workflow_params()
+    params = load_workflow_params(params_file)
 
     # Use slug as folder name (e.g., WED26-2026-01-15-23-37-49)
     folder_name = params['slug']
@@ -163,7 +170,9 @@ def main():
     print(f"[INFO] This may take a few minutes...")
 
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        with timed_operation("ffmpeg.narration", output=output_video.name) as op, resource_slot("ffmpeg"):
+            result = run_process(cmd, check=True, capture_output=True, text=True)
+            op["bytes"] = output_video.stat().st_size
         print(f"[OK] Video created successfully: {output_video}")
     except subprocess.CalledProcessError as e:
         print(f"[ERROR] FFmpeg failed: {e}")
@@ -191,5 +200,10 @@ def main():
     sys.exit(0)
 
 
+def run(params_file, shared_client=None):
+    """In-process entry point for workflow_orchestrator (this step makes no OpenAI calls)"""
+    main(params_file)
+
+
 if __name__ == "__main__":
     main()
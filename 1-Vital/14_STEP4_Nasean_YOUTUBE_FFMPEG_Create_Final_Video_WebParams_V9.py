@@ -8,8 +8,9 @@ This version accepts parameters from workflow_params.json instead of Google Shee
 import sys
 import io
 
-# Fix Unicode encoding for Windows console
-if sys.platform == 'win32':
+# Fix Unicode encoding for Windows console (only when run as a script; an
+# orchestrator importing this step owns the console streams)
+if sys.platform == 'win32' and __name__ == "__main__":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
@@ -33,21 +34,29 @@ import configparser
 from pathlib import Path
 from datetime import datetime
 
+from workflow_progress import report_progress
+from resource_limits import resource_slot
+from workflow_metrics import timed_operation
+from workflow_cancel import run_process
+from step_journal import StepJournal
+from artifact_cache import file_sha256
+
 # --- CONFIG ---
 script_dir = Path(__file__).resolve().parent
 config = configparser.ConfigParser()
-config.read("DONT_DELETE_ENV_FILES/config/14_STEP4_Nasean_YOUTUBE_FFMPEG_Create_Final_Video_UPLOADER_verticle_v6.txt")
+config.read(script_dir / "DONT_DELETE_ENV_FILES/config/14_STEP4_Nasean_YOUTUBE_FFMPEG_Create_Final_Video_UPLOADER_verticle_v6.txt")
 
-root_folder = Path(__file__).resolve().parent / "Course_Collective"
+root_folder = Path(os.getenv("COURSE_COLLECTIVE_ROOT") or script_dir / "Course_Collective")
 FRAME_RATE = config.getint("DEFAULT", "FRAME_RATE")
 VIDEO_CODEC = config.get("DEFAULT", "VIDEO_CODEC")
 PIX_FMT = config.get("DEFAULT", "PIX_FMT")
 
 
-def load_workflow_params():
+def load_workflow_params(params_file=None):
     """Load parameters from workflow-specific params file"""
     # Check for workflow-specific params file (for concurrent execution support)
-    params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
+    if not params_file:
+        params_file = os.getenv('WORKFLOW_PARAMS_FILE', 'workflow_params.json')
 
     if not os.path.exists(params_file):
         print(f"[ERROR] Workflow parameters file not found: {params_file}")
@@ -80,22 +89,58 @@ def fix_image_and_txt_naming(image_folder):
 
 def overlay_on_background(img, bg, out):
     """Overlay image on background"""
-    subprocess.run([
-        "ffmpeg", "-y",
-        "-i", str(bg),
-        "-i", str(img),
-        "-filter_complex", "[1:v]scale=1024:1024[fg];[0:v][fg]overlay=(W-w)/2:(H-h)/2",
-        "-frames:v", "1", str(out)
-    ], check=True, capture_output=True)
+    with timed_operation("ffmpeg.overlay", output=out.name), resource_slot("ffmpeg"):
+        run_process([
+            "ffmpeg", "-y",
+            "-i", str(bg),
+            "-i", str(img),
+            "-filter_complex", "[1:v]scale=1024:1024[fg];[0:v][fg]overlay=(W-w)/2:(H-h)/2",
+            "-frames:v", "1", str(out)
+        ], check=True, capture_output=True)
 
 
-def main():
+def overlay_with_checkpoint(journal, img, bg, bg_checksum, out):
+    """Overlay image on background unless the journal has the same overlay already"""
+    unit = {"source": file_sha256(img), "background": bg_checksum}
+    key = f"overlay:{out.stem}"
+    if journal.is_done(key, out, **unit):
+        print(f"[SKIP] {out.name} — overlay already done.")
+        return
+    overlay_on_background(img, bg, out)
+    journal.record(key, out, **unit)
+
+
+def encode_still_segment(img, duration, out):
+    """Encode a still image as a video segment of the given duration"""
+    with timed_operation("ffmpeg.segment", output=out.name, duration=duration), resource_slot("ffmpeg"):
+        run_process([
+            "ffmpeg", "-y", "-loop", "1",
+            "-i", str(img),
+            "-t", str(duration), "-c:v", "libx264",
+            "-pix_fmt", "yuv420p", "-r", str(FRAME_RATE),
+            "-an", str(out)
+        ], check=True, capture_output=True)
+
+
+def encode_with_checkpoint(journal, img, duration, out):
+    """Encode a segment unless the journal has one with the same source and encode parameters"""
+    unit = {"source": file_sha256(img), "duration": duration,
+            "codec": "libx264", "pix_fmt": "yuv420p", "frame_rate": FRAME_RATE}
+    key = f"segment:{out.stem}"
+    if journal.is_done(key, out, **unit):
+        print(f"[SKIP] {out.name} — segment already encoded.")
+        return
+    encode_still_segment(img, duration, out)
+    journal.record(key, out, **unit)
+
+
+def main(params_file=None):
     print("\n" + "="*60)
     print("STEP 4: Create Final Video")
     print("="*60 + "\n")
 
     # Load workflow parameters
-    params = load_workflow_params()
+    params = load_workflow_params(params_file)
 
     # Use slug as folder name (e.g., WED26-2026-01-15-23-37-49)
     folder_name = params['slug']
@@ -114,17 +159,20 @@ def main():
         'landscape': {
             'width': 1920,
             'height': 1080,
-            'background': 'background.jpg'
+            'background': 'background.jpg',
+            'narration': 'narration.mp4'
         },
         'portrait': {
             'width': 1080,
             'height': 1920,
-            'background': 'backgroundv.jpg'
+            'background': 'backgroundv.jpg',
+            'narration': 'narration_vertical.mp4'
         },
         'square': {
             'width': 1080,
             'height': 1080,
-            'background': 'background.jpg'  # Use landscape, will be cropped to square
+            'background': 'background.jpg',  # Use landscape, will be cropped to square
+            'narration': 'narration_square.mp4'
         }
     }
 
@@ -158,7 +206,10 @@ def main():
         # Setup paths
         image_folder = output_folder / "images"
         timestamp_file = output_folder / "narration_timestamps_short.txt"
-        audio_file = output_folder / "narration_backgroundv.mp4"
+        # Narration video written by Step 3 for this format (older runs used narration_backgroundv.mp4)
+        audio_file = output_folder / config_data['narration']
+        if not audio_file.exists() and (output_folder / "narration_backgroundv.mp4").exists():
+            audio_file = output_folder / "narration_backgroundv.mp4"
         response_file = output_folder / "youtubetitle.txt"
         temp_folder = output_folder / "segmentsv"
         overlaid_folder = output_folder / "overlaidv"
@@ -200,6 +251,11 @@ def main():
         # Fix image naming
         fix_image_and_txt_naming(image_folder)
 
+        # Overlays and segments are checkpointed per unit, so a rerun after a
+        # failure resumes where it stopped
+        journal = StepJournal(output_folder, "step4_segments")
+        background_checksum = file_sha256(background_image)
+
         # Parse timestamps and create overlaid images
         print("[VIDEO] Parsing timestamps and overlaying images...")
         segments = []
@@ -212,7 +268,9 @@ def main():
         if "Start:" in content and "End:" in content:
             # Parse multi-line format
             segment_blocks = content.split("Segment ")
-            for block in segment_blocks[1:]:  # Skip first empty block
+            total_blocks = len(segment_blocks) - 1
+            for idx_block, block in enumerate(segment_blocks[1:], start=1):  # Skip first empty block
+                report_progress(idx_block, total_blocks, "overlay")
                 lines = block.strip().split("\n")
                 if len(lines) >= 4:
                     try:
@@ -229,7 +287,7 @@ def main():
                         out = overlaid_folder / f"{segment_num:05}_overlay.png"
                         if img.exists():
                             print(f"[VIDEO] Processing image {segment_num}...")
-                            overlay_on_background(img, background_image, out)
+                            overlay_with_checkpoint(journal, img, background_image, background_checksum, out)
                             segments.append((out, start, end, duration))
                     except Exception as e:
                         print(f"[WARN] Failed to parse segment: {e}")
@@ -237,7 +295,9 @@ def main():
         else:
             # Parse old bracket format: [0.00s - 5.54s] Text
             pattern = r"\[(\d+\.\d+)s\s*-\s*(\d+\.\d+)s\]"
-            for idx_img, line in enumerate(content.split("\n")):
+            content_lines = content.split("\n")
+            for idx_img, line in enumerate(content_lines):
+                report_progress(idx_img + 1, len(content_lines), "overlay")
                 match = re.match(pattern, line.strip())
                 if match:
                     start = float(match.group(1))
@@ -247,7 +307,7 @@ def main():
                     out = overlaid_folder / f"{idx_img+1:05}_overlay.png"
                     if img.exists():
                         print(f"[VIDEO] Processing image {idx_img+1}...")
-                        overlay_on_background(img, background_image, out)
+                        overlay_with_checkpoint(journal, img, background_image, background_checksum, out)
                         segments.append((out, start, end, duration))
 
         print(f"[OK] Created {len(segments)} overlaid images")
@@ -265,29 +325,18 @@ def main():
                 gap = start - last_end
                 gap_segment = temp_folder / f"gap_{idx_img:03}.mp4"
                 print(f"[VIDEO] Creating gap segment ({gap:.2f}s)...")
-                subprocess.run([
-                    "ffmpeg", "-y", "-loop", "1",
-                    "-i", str(last_overlay),
-                    "-t", str(gap), "-c:v", "libx264",
-                    "-pix_fmt", "yuv420p", "-r", str(FRAME_RATE),
-                    "-an", str(gap_segment)
-                ], check=True, capture_output=True)
+                encode_with_checkpoint(journal, last_overlay, gap, gap_segment)
                 concat_lines.append(f"file '{gap_segment.as_posix()}'")
 
             # Create main segment
             segment = temp_folder / f"seg_{idx_img:03}.mp4"
             print(f"[VIDEO] Creating segment {idx_img+1}/{len(segments)} ({dur:.2f}s)...")
-            subprocess.run([
-                "ffmpeg", "-y", "-loop", "1",
-                "-i", str(img),
-                "-t", str(dur), "-c:v", "libx264",
-                "-pix_fmt", "yuv420p", "-r", str(FRAME_RATE),
-                "-an", str(segment)
-            ], check=True, capture_output=True)
+            encode_with_checkpoint(journal, img, dur, segment)
             concat_lines.append(f"file '{segment.as_posix()}'")
             log_lines.append(f"{img.name} duration {dur:.2f}s")
             last_end = end
             last_overlay = img
+            report_progress(idx_img + 1, len(segments), "segment")
 
         # Save concat list and log
         with open(concat_file, "w", encoding="utf-8") as f:
@@ -299,25 +348,27 @@ def main():
 
         # Concatenate all segments
         print("[VIDEO] Concatenating video segments...")
-        subprocess.run([
-            "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-            "-i", str(concat_file), "-c", "copy", str(video_only)
-        ], check=True, capture_output=True)
+        with timed_operation("ffmpeg.concat", segments=len(concat_lines)), resource_slot("ffmpeg"):
+            run_process([
+                "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+                "-i", str(concat_file), "-c", "copy", str(video_only)
+            ], check=True, capture_output=True)
         print("[OK] Video concatenated")
 
         # Merge with audio
         print("[VIDEO] Merging video with audio...")
         audio_duration = float(ffmpeg.probe(str(audio_file))['format']['duration'])
-        subprocess.run([
-            "ffmpeg", "-y",
-            "-i", str(video_only),
-            "-i", str(audio_file),
-            "-filter_complex",
-            f"[0:v]scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2,tpad=stop_mode=clone:stop_duration={audio_duration+2}[v]",
-            "-map", "[v]", "-map", "1:a",
-            "-c:v", VIDEO_CODEC, "-c:a", "aac",
-            "-shortest", str(output_video)
-        ], check=True, capture_output=True)
+        with timed_operation("ffmpeg.merge", output=output_video.name), resource_slot("ffmpeg"):
+            run_process([
+                "ffmpeg", "-y",
+                "-i", str(video_only),
+                "-i", str(audio_file),
+                "-filter_complex",
+                f"[0:v]scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2,tpad=stop_mode=clone:stop_duration={audio_duration+2}[v]",
+                "-map", "[v]", "-map", "1:a",
+                "-c:v", VIDEO_CODEC, "-c:a", "aac",
+                "-shortest", str(output_video)
+            ], check=True, capture_output=True)
 
         # Verify video was created
         if not output_video.exists():
@@ -351,5 +402,10 @@ def main():
         sys.exit(1)
 
 
+def run(params_file, shared_client=None):
+    """In-process entry point for workflow_orchestrator (this step makes no OpenAI calls)"""
+    main(params_file)
+
+
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 import os
 import pickle
+from pathlib import Path
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
@@ -7,15 +8,18 @@ from googleapiclient.http import MediaFileUpload
 SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
 CLIENT_SECRETS_FILE = "C:/DailyDevotionWomen/DONT_DELETE_ENV_FILES/oauth/client_secret_310102652485-4j4t2i22limqttkjnfdn948dssul81nq.apps.googleusercontent.com.json"  # <-- your OAuth JSON here
 
+# OAuth token shared by all workflows on this host, independent of the working directory
+TOKEN_FILE = os.getenv("YOUTUBE_TOKEN_FILE", str(Path(__file__).resolve().parent / "token.pickle"))
+
 def get_authenticated_service():
     credentials = None
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
+    if os.path.exists(TOKEN_FILE):
+        with open(TOKEN_FILE, "rb") as token:
             credentials = pickle.load(token)
     if not credentials:
         flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRETS_FILE, SCOPES)
         credentials = flow.run_console()
-        with open("token.pickle", "wb") as token:
+        with open(TOKEN_FILE, "wb") as token:
             pickle.dump(credentials, token)
     return build("youtube", "v3", credentials=credentials)
 
@@ -8,13 +8,17 @@ import gspread
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
 from google.oauth2.service_account import Credentials
 import tkinter as tk
 from tkcalendar import Calendar
 
+from rate_limit_store import get_shared_limiter
+from workflow_cancel import exit_on_sigterm
+
 # === Load config file ===
 config = configparser.ConfigParser()
-config.read("DONT_DELETE_ENV_FILES/config/15_STEP5_Nasean_youtube_UPLOADER_v1.txt")
+config.read(Path(__file__).resolve().parent / "DONT_DELETE_ENV_FILES/config/15_STEP5_Nasean_youtube_UPLOADER_v1.txt")
 
 ROOT_FOLDER = Path(__file__).resolve().parent / "Course_Collective"
 OUTPUT_VIDEO = config.get("DEFAULT", "OUTPUT_VIDEO", fallback="output/final_videov.mp4")
@@ -24,6 +28,18 @@ SERVICE_ACCOUNT_FILE = os.getenv("SMARTIKLE_WORKBOOK_GOOGLE_CREDENTIALS")
 SHEET_ID = "1iuQ53zJSD5b9QtGkEw74RfHHbMLbau0Bliv5r4bsIxs"
 WORKSHEET_NAME = "G6VIR-short"
 
+# OAuth token shared by all workflows on this host, independent of the working directory
+TOKEN_FILE = os.getenv("YOUTUBE_TOKEN_FILE", str(Path(__file__).resolve().parent / "token.pickle"))
+
+# videos.insert costs 1600 of the default 10,000 daily quota units; shared by every process on the host
+UPLOADS_PER_DAY = config.getint("DEFAULT", "YOUTUBE_UPLOADS_PER_DAY", fallback=6)
+QUOTA_RETRY_SECONDS = 3600
+# A resumable upload of a long video can take far longer than the default lease
+UPLOAD_LEASE_SECONDS = 4 * 3600
+upload_limiter = get_shared_limiter("youtube:upload", lease_seconds=UPLOAD_LEASE_SECONDS,
+                                    concurrency=1, max_concurrency=2,
+                                    per_minute=UPLOADS_PER_DAY / 1440, burst=UPLOADS_PER_DAY)
+
 SCOPES = [
     "https://www.googleapis.com/auth/youtube.upload",
     "https://www.googleapis.com/auth/youtube.readonly"
@@ -31,13 +47,13 @@ SCOPES = [
 
 def get_authenticated_service():
     credentials = None
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
+    if os.path.exists(TOKEN_FILE):
+        with open(TOKEN_FILE, "rb") as token:
             credentials = pickle.load(token)
     if not credentials:
         flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRETS_FILE, SCOPES)
         credentials = flow.run_local_server(port=0)
-        with open("token.pickle", "wb") as token:
+        with open(TOKEN_FILE, "wb") as token:
             pickle.dump(credentials, token)
     return build("youtube", "v3", credentials=credentials)
 
@@ -69,13 +85,22 @@ def upload_video(file_path, title, description, tags=[], category_id="22", priva
         }
     }
 
-    media = MediaFileUpload(file_path, chunksize=-1, resumable=True, mimetype="video/*")
-    request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
-    response = None
-    while response is None:
-        status, response = request.next_chunk()
-        if status:
-            print(f"Uploaded {int(status.progress() * 100)}%")
+    # Waits while other uploads on this host have used up the quota
+    with upload_limiter.slot() as slot:
+        media = MediaFileUpload(file_path, chunksize=-1, resumable=True, mimetype="video/*")
+        request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
+        response = None
+        try:
+            while response is None:
+                status, response = request.next_chunk()
+                if status:
+                    print(f"Uploaded {int(status.progress() * 100)}%")
+        except HttpError as e:
+            if e.resp.status in (403, 429) and any(reason in str(e) for reason in
+                                                  ("quotaExceeded", "rateLimitExceeded", "uploadLimitExceeded")):
+                # Hold back every uploader on the host instead of each one hitting the limit
+                slot["outcome"], slot["retry_after"] = "rate_limited", QUOTA_RETRY_SECONDS
+            raise
     video_id = response["id"]
     print("✅ Upload Complete")
     print("Video ID:", video_id)
@@ -85,6 +110,7 @@ def upload_video(file_path, title, description, tags=[], category_id="22", priva
 parser = argparse.ArgumentParser()
 parser.add_argument("--use-date-file", action="store_true")
 args = parser.parse_args()
+exit_on_sigterm()
 selected_date = None
 
 if args.use_date_file:
@@ -6,7 +6,6 @@ from tkcalendar import Calendar
 from pathlib import Path
 from PIL import Image, ImageTk
 import configparser
-import requests
 import subprocess
 import shutil
 import gspread
@@ -14,6 +13,9 @@ from google.oauth2.service_account import Credentials
 import datetime
 import os
 
+from image_download import save_image_result
+from rate_limiter import openai_create
+
 # --- Load Config ---
 config = configparser.ConfigParser()
 config.read("DONT_DELETE_ENV_FILES/config/12_STEP2_Nasean_Generate_Image_from_prompts_short_V7.txt")
@@ -38,7 +40,8 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     print("❌ ERROR: OPENAI_API_KEY not set.")
     exit()
-client = OpenAI(api_key=api_key)
+# Retries and backoff are left to rate_limiter, which shares the host-wide limits with running workflows
+client = OpenAI(api_key=api_key, max_retries=0)
 
 # --- Global Variables ---
 current_image_index = 0
@@ -312,17 +315,16 @@ def regenerate_image():
         return
     try:
         print(f"🎨 Regenerating {img_path.name}...")
-        response = client.images.generate(
+        response = openai_create(
+            client.images, "images",
             prompt=updated_prompt,
             n=1,
             size=IMAGE_SIZE,
-            model="dall-e-3"
+            model="dall-e-3",
+            response_format="b64_json"
         )
-        image_url = response.data[0].url
-        image_data = requests.get(image_url).content
-
-        with open(img_path, "wb") as f:
-            f.write(image_data)
+        # Written to a .part file first, so a failed save keeps the old image
+        save_image_result(response.data[0], img_path)
 
         messagebox.showinfo("Success", f"✅ Replaced {img_path.name}")
         edit_log.append(f"Replaced: {img_path.name}")
@@ -367,7 +369,8 @@ def generate_prompt_from_narration():
         full_prompt = full_prompt[:3000] + "..."
 
     try:
-        response = client.chat.completions.create(
+        response = openai_create(
+            client.chat.completions, "chat",
             model="gpt-4",
             messages=[
                 {"role": "system", "content": settings.get('system_msg', '')},
@@ -1,10 +1,10 @@
-import whisper
+from whisper_service import transcribe
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 # --- Config ---
-WHISPER_MODEL = "base"  # e.g., "base", "medium", "large"
+WHISPER_MODEL = "base"  # e.g., "base", "medium", "large", or "faster-whisper:base" (int8, CPU)
 AUDIO_FILENAME = "narration_short.mp3"
 OUTPUT_FILENAME = "timestamp.txt"
 USE_FIXED_SEGMENTS = True
@@ -29,8 +29,8 @@ if not audio_path.exists():
 
 # --- Whisper Transcription ---
 print(f"🎧 Generating timestamps for: {audio_path}")
-model = whisper.load_model(WHISPER_MODEL)
-result = model.transcribe(str(audio_path))
+# Uses the Whisper service when WHISPER_SERVICE_URL is set, so the model is not reloaded
+result = transcribe(audio_path, WHISPER_MODEL, word_timestamps=False)
 
 if USE_FIXED_SEGMENTS:
     print(f"📏 Using fixed {FIXED_SEGMENT_LENGTH}-second segments")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Artifact Cache - Content-addressed skip of unchanged workflow steps
+Every step in WORKFLOW_STEPS declares its inputs (params fields, upstream
+artifacts, config values) and its outputs. After a step succeeds, a manifest
+with the fingerprint of those inputs, the hashes of the step script and of
+the local helper modules it imports (directly or through other helpers), and
+the hashes of the outputs it produced is saved in <output folder>/.step_cache/.
+A later run skips the step if the fingerprint is unchanged and every recorded
+output is still on disk with the same content. Changed outputs change the
+fingerprints of downstream steps, so only they re-run.
+changed_outputs() tells which recorded outputs were edited since the step
+ran, so a step can redo only the work that depends on them (see "edit_rerun"
+in workflow_orchestrator.py).
+"""
+
+import os
+import ast
+import json
+import glob
+import hashlib
+import configparser
+from pathlib import Path
+from datetime import datetime
+
+CACHE_DIR_NAME = ".step_cache"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def expand_paths(patterns, output_folder, params):
+    """
+    Resolve artifact patterns relative to the output folder
+    Patterns may use globs and {slug}-style params fields, e.g. "images/*.png"
+    """
+    output_folder = Path(output_folder)
+    paths = {}
+    for pattern in patterns:
+        pattern = pattern.format(**params)
+        matches = glob.glob(str(output_folder / pattern))
+        if not matches and not glob.has_magic(pattern):
+            # Missing single files are part of the fingerprint too
+            paths[pattern] = None
+        for match in matches:
+            # Inputs outside the output folder (backgrounds) keep a ../ path
+            paths[Path(os.path.relpath(match, output_folder)).as_posix()] = match
+    return paths
+
+
+def hash_artifacts(patterns, output_folder, params):
+    """Map each artifact's relative path to its content hash (None if missing)"""
+    return {
+        relative: file_sha256(path) if path and Path(path).is_file() else None
+        for relative, path in sorted(expand_paths(patterns, output_folder, params).items())
+    }
+
+
+def read_config_values(config_file, keys):
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding="utf-8")
+    return {key: config.get("DEFAULT", key, fallback=None) for key in keys}
+
+
+def local_imports(script_path, script_dir):
+    """
+    Modules next to the scripts that script_path imports, followed through
+    their own imports; returns their file names, sorted
+    """
+    script_dir = Path(script_dir)
+    found = set()
+    pending = [Path(script_path)]
+    while pending:
+        path = pending.pop()
+        try:
+            tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_file = f"{name.split('.')[0]}.py"
+                if module_file not in found and (script_dir / module_file).is_file():
+                    found.add(module_file)
+                    pending.append(script_dir / module_file)
+    return sorted(found)
+
+
+def compute_fingerprint(step_number, step, params, output_folder, script_dir):
+    """Fingerprint of everything the step reads; returns (fingerprint, inputs)"""
+    script_dir = Path(script_dir)
+    config_file, config_keys = step.get("config", (None, []))
+    inputs = {
+        "script": file_sha256(script_dir / step["script"]),
+        # Step logic lives in helper modules too (rate_limiter.py, narration_audio.py, ...)
+        "helpers": {name: file_sha256(script_dir / name)
+                    for name in local_imports(script_dir / step["script"], script_dir)},
+        "params": {field: params.get(field) for field in step.get("params", [])},
+        "artifacts": hash_artifacts(step.get("inputs", []), output_folder, params),
+        "config": read_config_values(script_dir / config_file, config_keys) if config_file else {}
+    }
+    canonical = json.dumps({"step": step_number, "inputs": inputs}, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), inputs
+
+
+def manifest_path(output_folder, step_number):
+    return Path(output_folder) / CACHE_DIR_NAME / f"step{step_number}.json"
+
+
+def load_manifest(output_folder, step_number):
+    """The step's manifest, or None if there is none (or it is unreadable)"""
+    path = manifest_path(output_folder, step_number)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def changed_outputs(step_number, step, params, output_folder, script_dir):
+    """
+    Recorded outputs that were modified or deleted since the step's last run,
+    or None if there is no manifest or the input fingerprint has changed
+    """
+    manifest = load_manifest(output_folder, step_number)
+    if manifest is None:
+        return None
+    fingerprint, _ = compute_fingerprint(step_number, step, params, output_folder, script_dir)
+    if manifest.get("fingerprint") != fingerprint:
+        return None
+    output_folder = Path(output_folder)
+    return sorted(
+        relative for relative, recorded_hash in manifest.get("outputs", {}).items()
+        if not (output_folder / relative).is_file() or file_sha256(output_folder / relative) != recorded_hash
+    )
+
+
+def is_step_cached(step_number, step, params, output_folder, script_dir):
+    """True if a previous run with the same input fingerprint left intact outputs"""
+    manifest = load_manifest(output_folder, step_number)
+    if manifest is None or not manifest.get("outputs"):
+        return False
+    # Outputs must still be there, unmodified
+    return changed_outputs(step_number, step, params, output_folder, script_dir) == []
+
+
+def invalidate_step(output_folder, step_number):
+    """Drop a step's manifest before it runs, so a crashed run is never reused"""
+    path = manifest_path(output_folder, step_number)
+    if path.exists():
+        path.unlink()
+
+
+def record_step_manifest(step_number, step, params, output_folder, script_dir):
+    """Save the input fingerprint and output hashes of a step that just succeeded"""
+    fingerprint, inputs = compute_fingerprint(step_number, step, params, output_folder, script_dir)
+    outputs = {
+        relative: file_sha256(path)
+        for relative, path in sorted(expand_paths(step.get("outputs", []), output_folder, params).items())
+        if path and Path(path).is_file()
+    }
+    manifest = {
+        "step": step_number,
+        "script": step["script"],
+        "fingerprint": fingerprint,
+        "inputs": inputs,
+        "outputs": outputs,
+        "createdAt": datetime.now().isoformat()
+    }
+    path = manifest_path(output_folder, step_number)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
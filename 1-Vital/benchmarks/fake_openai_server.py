@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fake OpenAI Server - Offline stand-in for the endpoints the pipeline calls
+Point the steps at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+  POST /v1/chat/completions     canned essay JSON, visual metadata, image prompt(s);
+                                streamed as server-sent events if "stream" is set
+  POST /v1/audio/speech         silent MP3 (or raw PCM), ~CHARS_PER_SECOND characters per second
+  POST /v1/images/generations   URL of a generated PNG (or b64_json if asked for)
+  GET  /files/<name>.png        the generated PNG
+  GET  /stats                   request counts per endpoint
+Each endpoint sleeps for a configurable latency first, so benchmarks can model
+the real API's response times without spending money.
+
+Usage:
+  python fake_openai_server.py --port 8089 --chat-latency 2 --image-latency 8
+"""
+
+import re
+import sys
+import json
+import time
+import zlib
+import base64
+import struct
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Narration speed used to size the silent MP3, roughly natural speech
+CHARS_PER_SECOND = 15
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono: 417-byte frames of 1152 samples.
+# An all-zero side info and payload decodes as silence.
+MP3_FRAME_HEADER = b"\xff\xfb\x90\xc4"
+MP3_FRAME_BYTES = 417
+MP3_FRAME_SECONDS = 1152 / 44100
+PCM_SAMPLE_RATE = 24000
+
+DEFAULT_LATENCIES = {"chat": 0.0, "stream_chunk": 0.0, "speech": 0.0, "image": 0.0, "download": 0.0}
+# Characters per streamed chat chunk (about five tokens)
+STREAM_CHUNK_CHARS = 20
+
+ESSAY_PARAGRAPH = (
+    "The river shaped the valley over thousands of years, carving deep channels through the soft rock. "
+    "Farmers settled along its banks because the floods left rich soil behind every spring. "
+    "Over time small villages grew into trading towns connected by boats and bridges. "
+    "Historians still study these towns to understand how people adapted to a changing landscape."
+)
+
+
+def silent_mp3(seconds):
+    """A silent MP3 of about the given duration"""
+    frames = max(1, int(seconds / MP3_FRAME_SECONDS))
+    frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_BYTES - len(MP3_FRAME_HEADER))
+    return frame * frames
+
+
+def silent_pcm(seconds):
+    """Silent raw PCM as response_format="pcm" returns it: 24 kHz, 16-bit, mono"""
+    return bytes(int(seconds * PCM_SAMPLE_RATE) * 2)
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def solid_png(width, height, rgb=(90, 120, 160)):
+    """A single-colour RGB PNG, written without any imaging library"""
+    row = b"\x00" + bytes(rgb) * width
+    raw = row * height
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(raw, 6))
+            + _png_chunk(b"IEND", b""))
+
+
+VISUAL_METADATA = ("Location: a river valley in the temperate north. Era: early farming settlements. "
+                   "People: farmers and traders in simple wool clothing. Style: storybook illustration, "
+                   "warm earthy palette, soft golden-hour light.")
+
+
+def canned_essay(paragraphs, structured=False):
+    """
+    Essay response in the ```json ... ``` shape Step 1 parses, or as the bare
+    JSON object a json_schema response format asks for (with every field)
+    """
+    article_text = "\n\n".join(ESSAY_PARAGRAPH for _ in range(paragraphs))
+    data = {
+        "title": "How the River Shaped the Valley",
+        "slug": "how-the-river-shaped-the-valley",
+        "article_text": article_text,
+        "quiz_json": {
+            "questions": [
+                {"question": "What did the floods leave behind?",
+                 "options": ["Rich soil", "Sand", "Rocks", "Ice"], "answer": "Rich soil"}
+            ]
+        }
+    }
+    if structured:
+        data = {"title": data["title"], "slug": data["slug"], "article_text": article_text,
+                "visual_metadata": VISUAL_METADATA,
+                "youtube_description": "How a river carved a valley and drew people to settle beside it.",
+                "quiz_json": data["quiz_json"]}
+        return json.dumps(data)
+    return f"```json\n{json.dumps(data, indent=2)}\n```"
+
+
+class FakeOpenAIState:
+    """Latencies, essay size and request counters shared by all handler threads"""
+
+    def __init__(self, latencies=None, essay_paragraphs=4):
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.essay_paragraphs = essay_paragraphs
+        self.counts = {}
+        self.images = {}
+        self._lock = threading.Lock()
+        self._png_cache = {}
+
+    def count(self, endpoint):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            return self.counts[endpoint]
+
+    def png(self, size):
+        with self._lock:
+            if size not in self._png_cache:
+                width, height = (int(n) for n in size.split("x"))
+                self._png_cache[size] = solid_png(width, height)
+            return self._png_cache[size]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, body, content_type="application/json", status=200):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sleep(self, kind):
+        latency = self.state.latencies.get(kind, 0)
+        if latency:
+            time.sleep(latency)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self._chat(self._read_json())
+        elif path.endswith("/audio/speech"):
+            self._speech(self._read_json())
+        elif path.endswith("/images/generations"):
+            self._image(self._read_json())
+        else:
+            self._send({"error": {"message": f"Unknown endpoint {path}"}}, status=404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        match = re.match(r"^/files/([\w-]+)\.png$", path)
+        if match and match.group(1) in self.state.images:
+            self.state.count("download")
+            self._sleep("download")
+            self._send(self.state.png(self.state.images[match.group(1)]), "image/png")
+        elif path == "/stats":
+            self._send({"counts": self.state.counts, "latencies": self.state.latencies})
+        else:
+            self._send({"error": {"message": f"Unknown path {path}"}}, status=404)
+
+    def _chat(self, request):
+        number = self.state.count("chat")
+        self._sleep("chat")
+        system = next((m["content"] for m in request.get("messages", []) if m["role"] == "system"), "")
+        user = next((m["content"] for m in request.get("messages", []) if m["role"] == "user"), "")
+        if "educational content creator" in system:
+            structured = (request.get("response_format") or {}).get("type") == "json_schema"
+            content = canned_essay(self.state.essay_paragraphs, structured)
+        elif "visual details" in system:
+            content = VISUAL_METADATA
+        elif "JSON array" in user:
+            # Batched image prompts: one item per "<segment>.png: narration" line
+            segments = re.findall(r"^(\S+\.png):", user, re.MULTILINE)
+            content = json.dumps([
+                {"segment": segment,
+                 "prompt": f"A storybook illustration of a river valley village, scene {i}, soft light."}
+                for i, segment in enumerate(segments, start=1)
+            ])
+        else:
+            content = f"Prompt: A storybook illustration of a river valley village, scene {number}, soft light."
+        if request.get("stream"):
+            self._stream_chat(request, number, content)
+            return
+        self._send({
+            "id": f"chatcmpl-fake-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _stream_chat(self, request, number, content):
+        """Server-sent chat.completion.chunk events, STREAM_CHUNK_CHARS characters each"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunk_delay = self.state.latencies.get("stream_chunk", 0)
+        pieces = [{"role": "assistant", "content": ""}]
+        pieces += [{"content": content[i:i + STREAM_CHUNK_CHARS]} for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        for index, delta in enumerate(pieces + [{}]):
+            chunk = {
+                "id": f"chatcmpl-fake-{number}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None if delta else "stop"}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if chunk_delay and index:
+                time.sleep(chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _speech(self, request):
+        self.state.count("speech")
+        self._sleep("speech")
+        seconds = max(1.0, len(request.get("input", "")) / CHARS_PER_SECOND)
+        if request.get("response_format") == "pcm":
+            self._send(silent_pcm(seconds), "audio/pcm")
+        else:
+            self._send(silent_mp3(seconds), "audio/mpeg")
+
+    def _image(self, request):
+        number = self.state.count("image")
+        self._sleep("image")
+        size = request.get("size", "1024x1024")
+        name = f"image-{number}"
+        self.state.images[name] = size
+        if request.get("response_format") == "b64_json":
+            item = {"b64_json": base64.b64encode(self.state.png(size)).decode("ascii")}
+        else:
+            host, port = self.server.server_address[:2]
+            item = {"url": f"http://{host}:{port}/files/{name}.png"}
+        self._send({"created": int(time.time()), "data": [{**item, "revised_prompt": request.get("prompt", "")}]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(host="127.0.0.1", port=0, latencies=None, essay_paragraphs=4):
+    """Serve the fake API from a daemon thread; returns (server, base_url)"""
+    handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,),
+                   {"state": FakeOpenAIState(latencies, essay_paragraphs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI API for offline pipeline benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--chat-latency', type=float, default=0.0, help='Seconds per chat completion')
+    parser.add_argument('--stream-chunk-latency', type=float, default=0.0,
+                        help='Seconds between streamed chat chunks')
+    parser.add_argument('--speech-latency', type=float, default=0.0, help='Seconds per TTS request')
+    parser.add_argument('--image-latency', type=float, default=0.0, help='Seconds per image generation')
+    parser.add_argument('--download-latency', type=float, default=0.0, help='Seconds per image download')
+    parser.add_argument('--essay-paragraphs', type=int, default=4, help='Paragraphs in the canned essay')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.host, args.port, {
+        "chat": args.chat_latency,
+        "stream_chunk": args.stream_chunk_latency,
+        "speech": args.speech_latency,
+        "image": args.image_latency,
+        "download": args.download_latency
+    }, args.essay_paragraphs)
+    print(f"[OK] Fake OpenAI API at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
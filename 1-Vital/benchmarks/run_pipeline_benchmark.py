@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Pipeline Benchmark - End-to-end wall time of the four WebParams steps, offline
+Starts fake_openai_server.py, points the pipeline at it (OPENAI_BASE_URL) and
+at a temporary Course_Collective (COURSE_COLLECTIVE_ROOT), runs N workflows
+through workflow_orchestrator.run_workflow and reports wall time per workflow,
+per step and per sub-operation from each workflow's metrics.json.
+Step 1 times the narration by aligning the essay text (TIMESTAMP_MODE=ALIGN);
+with TIMESTAMP_MODE=WHISPER, Whisper is replaced by fixed-length segments
+unless --real-whisper is given, so only the code under test and ffmpeg do real
+work. The stand-in is patched into this process, so --subprocess runs need
+--real-whisper only with TIMESTAMP_MODE=WHISPER. Needs ffmpeg on PATH and the step scripts' Python packages (openai,
+python-docx, ffmpeg-python; openai-whisper only with --real-whisper).
+Limiter state goes to a database in the benchmark folder and the LLM cache is
+off, so runs neither touch nor depend on the host's shared state.
+
+Usage:
+  python benchmarks/run_pipeline_benchmark.py --workflows 3 --image-latency 1 --report bench.json
+  python benchmarks/run_pipeline_benchmark.py --baseline bench.json --max-regression 15
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import configparser
+import tempfile
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from fake_openai_server import start_fake_server
+from rate_limit_store import RATE_LIMIT_DB_ENV
+from llm_cache import LLM_CACHE_DIR_ENV
+
+STEP1_CONFIG = SCRIPT_DIR / "DONT_DELETE_ENV_FILES/config/00_STEP1_Nasean_Create_Essay_11_createMP3and_TimeStamp_short.txt"
+BACKGROUNDS = {"background.jpg": "1920x1080", "backgroundv.jpg": "1080x1920"}
+MP3_BITRATE = 128000
+
+
+class FixedSegmentModel:
+    """Stands in for a whisper model: fixed-length segments over the audio's duration"""
+
+    def __init__(self, segment_seconds):
+        self.segment_seconds = segment_seconds
+
+    def transcribe(self, audio_path, **kwargs):
+        # The fake TTS returns constant-bitrate MP3, so the size gives the duration
+        duration = os.path.getsize(audio_path) * 8 / MP3_BITRATE
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.segment_seconds, duration)
+            segments.append({"start": start, "end": end, "text": f"Benchmark narration segment {len(segments) + 1}."})
+            start = end
+        return {"segments": segments, "text": " ".join(s["text"] for s in segments)}
+
+
+def step1_timestamp_mode():
+    """Step 1's TIMESTAMP_MODE, read the way the step reads it"""
+    config = configparser.ConfigParser()
+    config.read(STEP1_CONFIG)
+    return config.get("DEFAULT", "TIMESTAMP_MODE", fallback="ALIGN").strip().upper()
+
+
+def create_backgrounds(course_root):
+    """Plain backgrounds for Steps 3 and 4, made with ffmpeg"""
+    for name, size in BACKGROUNDS.items():
+        subprocess.run([
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"color=c=0x303840:s={size}",
+            "-frames:v", "1", str(course_root / name)
+        ], check=True, capture_output=True)
+
+
+def write_params(bench_root, index, video_format):
+    params = {
+        "topic": "How the river shaped the valley",
+        "slug": f"bench-{index:03}",
+        "prompt": "Write a short educational essay about how a river shaped a valley.",
+        "lessonDate": datetime.now().strftime("%Y-%m-%d"),
+        "readingLength": 60,
+        "emotionStyle": "neutral",
+        "ttsVoice": "alloy",
+        "videoFormat": video_format
+    }
+    params_path = bench_root / f"bench_{index:03}_params.json"
+    with open(params_path, 'w') as f:
+        json.dump(params, f, indent=2)
+    return params_path, params
+
+
+def run_one_workflow(bench_root, course_root, index, args):
+    """Run one workflow and return its wall time, status and metrics.json"""
+    from workflow_orchestrator import run_workflow
+
+    params_path, params = write_params(bench_root, index, args.video_format)
+    workflow_id = f"bench-{index:03}"
+    started = time.perf_counter()
+    status = "completed"
+    error = None
+    try:
+        run_workflow(str(params_path), str(bench_root / f"{workflow_id}_status.json"), workflow_id,
+                     in_process=not args.subprocess, use_cache=False, work_root=bench_root / "workflows")
+    except BaseException as e:
+        status, error = "failed", str(e)
+    wall_seconds = time.perf_counter() - started
+
+    metrics_file = course_root / params["slug"] / "output" / "metrics.json"
+    metrics = json.loads(metrics_file.read_text()) if metrics_file.exists() else {"steps": {}}
+    return {"workflowId": workflow_id, "status": status, "error": error,
+            "wallSeconds": round(wall_seconds, 3), "metrics": metrics}
+
+
+def summarize(runs):
+    """Mean/min/max wall time per workflow and per step, and total time per operation"""
+    def stats(values):
+        return {"mean": round(statistics.mean(values), 3), "min": round(min(values), 3),
+                "max": round(max(values), 3)} if values else None
+
+    steps = {}
+    operations = {}
+    for run in runs:
+        for n, step in run["metrics"].get("steps", {}).items():
+            steps.setdefault(n, []).append(step.get("wallSeconds", 0.0))
+            for name, totals in step.get("operationTotals", {}).items():
+                entry = operations.setdefault(name, {"count": 0, "totalSeconds": 0.0})
+                entry["count"] += totals["count"]
+                entry["totalSeconds"] = round(entry["totalSeconds"] + totals["totalSeconds"], 3)
+    return {
+        "workflow": stats([run["wallSeconds"] for run in runs]),
+        "steps": {n: stats(values) for n, values in sorted(steps.items())},
+        "operations": dict(sorted(operations.items()))
+    }
+
+
+def print_summary(summary, total_seconds, workflows, failed):
+    print("\n" + "=" * 60)
+    print("PIPELINE BENCHMARK")
+    print("=" * 60)
+    print(f"Workflows: {workflows} ({failed} failed) in {total_seconds:.2f}s "
+          f"({workflows / total_seconds * 3600:.1f} workflows/hour)")
+    w = summary["workflow"]
+    print(f"Workflow wall time: mean {w['mean']:.2f}s  min {w['min']:.2f}s  max {w['max']:.2f}s")
+    for n, s in summary["steps"].items():
+        print(f"  Step {n}: mean {s['mean']:.2f}s  min {s['min']:.2f}s  max {s['max']:.2f}s")
+    print("Operations (all workflows):")
+    for name, totals in summary["operations"].items():
+        print(f"  {name:<22} {totals['count']:>5} x  {totals['totalSeconds']:.2f}s")
+    print("=" * 60)
+
+
+def compare_with_baseline(summary, baseline_file, max_regression):
+    """Print mean wall time changes against a previous report; True if within max_regression %"""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)["summary"]
+
+    pairs = [("workflow", summary["workflow"], baseline.get("workflow"))]
+    pairs += [(f"step {n}", s, baseline["steps"].get(n)) for n, s in summary["steps"].items()]
+
+    ok = True
+    print(f"\nCompared with {baseline_file}:")
+    for label, current, previous in pairs:
+        if not current or not previous or not previous["mean"]:
+            continue
+        change = (current["mean"] - previous["mean"]) / previous["mean"] * 100
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            flag = "  [REGRESSION]"
+            ok = False
+        print(f"  {label:<10} {previous['mean']:.2f}s -> {current['mean']:.2f}s ({change:+.1f}%){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end pipeline benchmark')
+    parser.add_argument('--workflows', type=int, default=1, help='Workflows to run')
+    parser.add_argument('--concurrency', type=int, default=1, help='Workflows run at the same time')
+    parser.add_argument('--video-format', default='landscape', choices=['landscape', 'portrait', 'square'])
+    parser.add_argument('--essay-paragraphs', type=int, default=4, help='Essay length, drives narration length')
+    parser.add_argument('--segment-seconds', type=float, default=5.0,
+                        help='Segment length of the stand-in transcription (one image per segment)')
+    parser.add_argument('--chat-latency', type=float, default=0.0, help='Fake chat completion latency (s)')
+    parser.add_argument('--stream-chunk-latency', type=float, default=0.0,
+                        help='Fake delay between streamed chat chunks (s)')
+    parser.add_argument('--speech-latency', type=float, default=0.0, help='Fake TTS latency (s)')
+    parser.add_argument('--image-latency', type=float, default=0.0, help='Fake image generation latency (s)')
+    parser.add_argument('--download-latency', type=float, default=0.0, help='Fake image download latency (s)')
+    parser.add_argument('--real-whisper', action='store_true', help='Transcribe with the real whisper model')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='Run each step as a subprocess (with TIMESTAMP_MODE=WHISPER, requires --real-whisper)')
+    parser.add_argument('--report', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Previous --report file to compare against')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='Exit with 1 if a mean wall time grew by more than this many percent')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary workflow folders')
+    args = parser.parse_args()
+
+    # With ALIGN, step 1 never loads Whisper, so the stand-in is not needed in the step processes
+    if args.subprocess and not args.real_whisper and step1_timestamp_mode() == "WHISPER":
+        print("[ERROR] The whisper stand-in only works in-process; use --real-whisper with --subprocess "
+              "when TIMESTAMP_MODE=WHISPER")
+        sys.exit(1)
+
+    bench_root = Path(tempfile.mkdtemp(prefix="pipeline_bench_"))
+    course_root = bench_root / "Course_Collective"
+    course_root.mkdir()
+    create_backgrounds(course_root)
+
+    server, base_url = start_fake_server(latencies={
+        "chat": args.chat_latency,
+        "stream_chunk": args.stream_chunk_latency,
+        "speech": args.speech_latency,
+        "image": args.image_latency,
+        "download": args.download_latency
+    }, essay_paragraphs=args.essay_paragraphs)
+    print(f"[OK] Fake OpenAI API at {base_url}")
+    print(f"[OK] Benchmark folder: {bench_root}")
+
+    # Set before the step modules are imported, they read these at import time
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["COURSE_COLLECTIVE_ROOT"] = str(course_root)
+    # Keep the fake server's rate limits out of the host-wide limiter state,
+    # and answer every GPT request from the fake server, not a response cache
+    os.environ[RATE_LIMIT_DB_ENV] = str(bench_root / "rate_limits.sqlite3")
+    os.environ.pop(LLM_CACHE_DIR_ENV, None)
+
+    if not args.real_whisper:
+        # Patched at the backend loader, so openai-whisper need not be installed
+        import whisper_service
+        whisper_service.BACKENDS["openai-whisper"].load = lambda name: FixedSegmentModel(args.segment_seconds)
+        print(f"[INFO] Whisper replaced by fixed {args.segment_seconds:g}s segments")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        runs = list(executor.map(lambda i: run_one_workflow(bench_root, course_root, i, args),
+                                 range(args.workflows)))
+    total_seconds = time.perf_counter() - started
+
+    failed = [run for run in runs if run["status"] != "completed"]
+    for run in failed:
+        print(f"[FAIL] {run['workflowId']}: {run['error']}")
+
+    summary = summarize(runs)
+    print_summary(summary, total_seconds, len(runs), len(failed))
+
+    report = {
+        "createdAt": datetime.now().isoformat(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("report", "baseline", "keep")},
+        "totalSeconds": round(total_seconds, 3),
+        "fakeApiRequests": server.RequestHandlerClass.state.counts,
+        "summary": summary,
+        "runs": [{k: v for k, v in run.items() if k != "metrics"} for run in runs]
+    }
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] Report saved to {args.report}")
+
+    ok = True
+    if args.baseline:
+        ok = compare_with_baseline(summary, args.baseline, args.max_regression)
+
+    server.shutdown()
+    if not args.keep:
+        shutil.rmtree(bench_root, ignore_errors=True)
+
+    if failed or not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
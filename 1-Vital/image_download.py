@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Image Download - Write DALL-E results to disk without buffering them twice
+An images.generate() result item carries either b64_json (when requested
+with response_format="b64_json", no second round trip) or a URL. b64_json is
+decoded to disk in slices; URLs are streamed in chunks through one pooled
+keep-alive session, so neither a new TLS connection per image nor a whole
+PNG in memory is needed. Both write <name>.part and rename it into place, so
+a crash or cancellation never leaves a truncated image behind.
+"""
+
+import os
+import base64
+import threading
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from workflow_cancel import check_cancelled
+
+CHUNK_SIZE = 256 * 1024
+# Multiple of 4, so every slice of the base64 text decodes on its own
+B64_SLICE_CHARS = 4 * 64 * 1024
+DOWNLOAD_TIMEOUT = (10, 120)
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The shared keep-alive session for image downloads"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _write_atomically(path, write):
+    """Call write(file) on path.part, then rename it to path; returns the bytes written"""
+    path = Path(path)
+    partial_path = path.with_name(path.name + ".part")
+    try:
+        with open(partial_path, "wb") as f:
+            write(f)
+            size = f.tell()
+        os.replace(partial_path, path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def save_b64_image(b64_data, path):
+    """Decode base64 image data to path"""
+    def write(f):
+        for start in range(0, len(b64_data), B64_SLICE_CHARS):
+            f.write(base64.b64decode(b64_data[start:start + B64_SLICE_CHARS]))
+    return _write_atomically(path, write)
+
+
+def download_image(url, path):
+    """Stream an image URL to path through the shared session"""
+    def write(f):
+        with get_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                check_cancelled()
+                f.write(chunk)
+    return _write_atomically(path, write)
+
+
+def save_image_result(item, path):
+    """Save one images.generate() data item to path; returns the bytes written"""
+    b64_data = getattr(item, "b64_json", None)
+    if b64_data:
+        return save_b64_image(b64_data, path)
+    return download_image(item.url, path)
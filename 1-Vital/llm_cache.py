@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LLM Cache - Opt-in disk cache for chat completion responses
+Re-running a workflow (after a step 4 failure, or with --start-step 1) repeats
+the same essay, metadata and image prompt requests. With LLM_CACHE_DIR set
+(workflow_orchestrator.py / workflow_queue.py --llm-cache DIR), rate_limiter
+answers a chat completion whose model, messages and sampling parameters were
+seen before from the cache instead of calling the API.
+Entries live in <dir>/llm_cache.sqlite3, shared by all processes on the
+host. The least recently used ones are evicted once the cache is larger than
+LLM_CACHE_MAX_MB, and entries older than LLM_CACHE_TTL_DAYS are never served.
+A workflow whose params contain "bypassLlmCache": true skips cache reads for
+its own calls; the fresh responses still replace the cached ones.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from pathlib import Path
+
+from workflow_metrics import record_operation
+
+LLM_CACHE_DIR_ENV = "LLM_CACHE_DIR"
+LLM_CACHE_MAX_MB_ENV = "LLM_CACHE_MAX_MB"
+LLM_CACHE_TTL_DAYS_ENV = "LLM_CACHE_TTL_DAYS"
+DEFAULT_MAX_MB = 200
+DEFAULT_TTL_DAYS = 30
+CACHE_FILE_NAME = "llm_cache.sqlite3"
+
+# Set per workflow by the steps from the "bypassLlmCache" params field
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+_local = threading.local()
+
+
+def configure_llm_cache(params):
+    """Apply the workflow's "bypassLlmCache" flag to the current thread/context"""
+    bypass = bool(params.get("bypassLlmCache", False))
+    _bypass.set(bypass)
+    if bypass and cache_enabled():
+        print("[INFO] LLM cache bypassed for this workflow")
+
+
+def cache_enabled():
+    return bool(os.getenv(LLM_CACHE_DIR_ENV))
+
+
+def request_key(endpoint, request):
+    """SHA-256 of the endpoint and the full request (model, messages, sampling parameters)"""
+    canonical = json.dumps({"endpoint": endpoint, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _connection():
+    """This thread's connection to the cache database, or None if the cache is off"""
+    cache_dir = os.getenv(LLM_CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    path = str(Path(cache_dir) / CACHE_FILE_NAME)
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != path:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL, "
+                     "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+def cache_get(endpoint, request):
+    """Cached response text for the request, or None (also when bypassed or disabled)"""
+    if _bypass.get():
+        return None
+    try:
+        conn = _connection()
+        if conn is None:
+            return None
+        key = request_key(endpoint, request)
+        ttl_seconds = float(os.getenv(LLM_CACHE_TTL_DAYS_ENV, DEFAULT_TTL_DAYS)) * 86400
+        row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > ttl_seconds:
+            return None
+        conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+    except (sqlite3.Error, OSError) as e:
+        print(f"[WARN] LLM cache read failed: {e}")
+        return None
+    record_operation({"name": "llm_cache.hit", "seconds": 0.0, "ok": True,
+                      "endpoint": endpoint, "model": request.get("model")})
+    return row[0]
+
+
+def cache_put(endpoint, request, value):
+    """Store a response and evict least recently used entries beyond the size cap"""
+    try:
+        conn = _connection()
+        if conn is None:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        max_bytes = float(os.getenv(LLM_CACHE_MAX_MB_ENV, DEFAULT_MAX_MB)) * 1024 * 1024
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO entries (key, model, value, size, created, last_used) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (request_key(endpoint, request), request.get("model"), value, size, now, now))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > max_bytes:
+                # Drop the least recently used entries down to 90% of the cap
+                excess = total - max_bytes * 0.9
+                for key, entry_size in conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+                    if excess <= 0:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    excess -= entry_size
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except (sqlite3.Error, OSError) as e:
+        print(f"[WARN] LLM cache write failed: {e}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Narration Alignment - Segment timestamps from the known essay text
+Whisper re-recognizes speech we generated ourselves just to recover timing.
+The narration's chunk offsets (narration_chunks.json) already say when every
+paragraph starts and ends, so only sentence boundaries inside a chunk remain:
+they are estimated from the sentences' share of the chunk's characters and
+snapped to the nearest pause ffmpeg's silencedetect finds near the estimate.
+Segments shorter than MIN_SEGMENT_DURATION_SECONDS are merged with the next
+one. The text of every segment is the essay's own, word for word.
+"""
+
+import re
+import json
+from pathlib import Path
+
+from narration_audio import split_sentences, CHUNKS_FILE_NAME
+from resource_limits import resource_slot
+from workflow_metrics import timed_operation
+from workflow_cancel import run_process
+
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SECONDS = 0.15
+# Longer silences are not pauses between sentences (e.g. silent test audio)
+MAX_PAUSE_SECONDS = 3.0
+# How far from the estimate a pause may be, as a share of the mean sentence length
+SNAP_WINDOW_FRACTION = 0.5
+MIN_SNAP_WINDOW_SECONDS = 0.3
+
+_SILENCE_START = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+_SILENCE_END = re.compile(r"silence_end:\s*(-?\d+(?:\.\d+)?)")
+
+
+def load_chunk_offsets(output_folder):
+    """The records save_chunk_offsets() wrote, or None if the narration has none"""
+    chunks_file = Path(output_folder) / CHUNKS_FILE_NAME
+    if not chunks_file.exists():
+        return None
+    with open(chunks_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def detect_pauses(audio_file):
+    """Midpoints (seconds) of the short silences in audio_file"""
+    with timed_operation("ffmpeg.silencedetect") as op:
+        with resource_slot("ffmpeg"):
+            result = run_process([
+                "ffmpeg", "-hide_banner", "-nostats", "-i", str(audio_file),
+                "-af", f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_MIN_SECONDS}",
+                "-f", "null", "-"
+            ], check=True, capture_output=True, text=True)
+        pauses = []
+        start = None
+        for line in result.stderr.splitlines():
+            match = _SILENCE_START.search(line)
+            if match:
+                start = float(match.group(1))
+                continue
+            match = _SILENCE_END.search(line)
+            if match and start is not None:
+                end = float(match.group(1))
+                if end - start <= MAX_PAUSE_SECONDS:
+                    pauses.append((start + end) / 2)
+                start = None
+        op["pauses"] = len(pauses)
+    return pauses
+
+
+def align_chunk(chunk, pauses):
+    """Sentence segments of one chunk, boundaries snapped to pauses inside it"""
+    start, end = chunk["start"], chunk["end"]
+    sentences = split_sentences(chunk["text"]) or [chunk["text"]]
+    if len(sentences) == 1:
+        return [{"start": start, "end": end, "text": sentences[0]}]
+
+    total_chars = sum(len(sentence) for sentence in sentences)
+    window = max(MIN_SNAP_WINDOW_SECONDS, (end - start) / len(sentences) * SNAP_WINDOW_FRACTION)
+    inside = [pause for pause in pauses if start < pause < end]
+    boundaries = [start]
+    chars = 0
+    for sentence in sentences[:-1]:
+        chars += len(sentence)
+        estimate = start + (end - start) * chars / total_chars
+        candidates = [pause for pause in inside if pause > boundaries[-1] and abs(pause - estimate) <= window]
+        if candidates:
+            boundaries.append(min(candidates, key=lambda pause: abs(pause - estimate)))
+        else:
+            boundaries.append(max(estimate, boundaries[-1]))
+    boundaries.append(end)
+    return [{"start": a, "end": b, "text": sentence}
+            for a, b, sentence in zip(boundaries, boundaries[1:], sentences)]
+
+
+def merge_short_segments(segments, min_seconds):
+    """Join each segment shorter than min_seconds with the one after it (the last with the one before)"""
+    merged = []
+    for segment in segments:
+        if merged and merged[-1]["end"] - merged[-1]["start"] < min_seconds:
+            merged[-1] = {"start": merged[-1]["start"], "end": segment["end"],
+                          "text": f"{merged[-1]['text']} {segment['text']}"}
+        else:
+            merged.append(dict(segment))
+    if len(merged) > 1 and merged[-1]["end"] - merged[-1]["start"] < min_seconds:
+        last = merged.pop()
+        merged[-1] = {"start": merged[-1]["start"], "end": last["end"],
+                      "text": f"{merged[-1]['text']} {last['text']}"}
+    return merged
+
+
+def align_narration(chunks, audio_file, min_segment_seconds):
+    """Timestamp segments ({"start", "end", "text"}) for a narration and its chunk offsets"""
+    pauses = detect_pauses(audio_file)
+    segments = []
+    for chunk in chunks:
+        segments.extend(align_chunk(chunk, pauses))
+    return merge_short_segments(segments, min_segment_seconds)
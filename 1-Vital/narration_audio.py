@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Narration Audio - Split narration text for TTS and join the audio gaplessly
+The speech endpoint takes at most MAX_TTS_CHARS characters per request, so a
+narration is synthesized as chunks: one per paragraph, and paragraphs over
+the limit are split at sentence boundaries (at word boundaries for a single
+sentence that is too long). Chunks are requested as raw PCM, which has no
+encoder delay or padding, so back to back they leave no gaps; their edges get
+a few milliseconds of fade against clicks, and one ffmpeg pass encodes the
+joined audio to MP3 through loudnorm so all chunks play at the same loudness.
+Chunk start/end times follow from the sample counts and are saved next to the
+narration as narration_chunks.json.
+Synthesized chunks are kept in <output folder>/.tts_cache/, named by the hash
+of their text, voice and TTS model, so re-narrating an edited essay only
+requests the paragraphs that changed. The cache holds the latest narration's
+chunks; older ones are pruned once it is complete.
+"""
+
+import re
+import sys
+import json
+import array
+import hashlib
+from pathlib import Path
+
+from resource_limits import resource_slot
+from workflow_metrics import timed_operation
+from workflow_cancel import run_process
+
+# response_format="pcm": 24 kHz, signed 16-bit little-endian, mono
+TTS_PCM_FORMAT = "pcm"
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_BYTES = 2
+FADE_SECONDS = 0.005
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+MP3_BITRATE = "128k"
+CHUNKS_FILE_NAME = "narration_chunks.json"
+TTS_CACHE_DIR_NAME = ".tts_cache"
+
+# End punctuation, any closing quotes/brackets (kept with the sentence), then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\'”’)\]]*(?=\s)')
+# A period after these does not end the sentence
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "jr.", "sr.", "vs.", "mt.", "e.g.", "i.e.", "no."}
+_INITIAL = re.compile(r'^[A-Z]\.$')
+
+
+def _is_abbreviation(text):
+    """Whether text (ending in a period) ends with an abbreviation or an initial"""
+    word = text.split()[-1].lstrip('"\'“‘([')
+    return word.lower() in ABBREVIATIONS or bool(_INITIAL.match(word))
+
+
+def split_sentences(text):
+    """Sentences of text, each exactly as written (closing quotes and brackets included)"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+        if match.group().endswith(".") and _is_abbreviation(text[start:end]):
+            continue
+        sentences.append(text[start:end].strip())
+        start = end
+    sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+def _pieces(sentence, max_chars):
+    """A sentence, or its words packed into pieces of at most max_chars"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    current = ""
+    for word in sentence.split():
+        while len(word) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(word[:max_chars])
+            word = word[max_chars:]
+        if current and len(current) + 1 + len(word) > max_chars:
+            pieces.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_tts_chunks(text, max_chars):
+    """
+    TTS requests for text: one per paragraph, paragraphs over max_chars split
+    into runs of whole sentences that fit
+    """
+    chunks = []
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            chunks.append(paragraph)
+            continue
+        current = ""
+        for sentence in split_sentences(paragraph):
+            for piece in _pieces(sentence, max_chars):
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    chunks.append(current)
+                    current = piece
+                else:
+                    current = f"{current} {piece}" if current else piece
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def pcm_seconds(size_bytes):
+    return size_bytes / (PCM_SAMPLE_RATE * PCM_SAMPLE_BYTES)
+
+
+def fade_edges(data):
+    """Ramp the first and last FADE_SECONDS of PCM data from/to silence"""
+    samples = array.array('h')
+    samples.frombytes(data[:len(data) - len(data) % PCM_SAMPLE_BYTES])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    fade = min(int(PCM_SAMPLE_RATE * FADE_SECONDS), len(samples) // 2)
+    for i in range(fade):
+        gain = i / fade
+        samples[i] = int(samples[i] * gain)
+        samples[-1 - i] = int(samples[-1 - i] * gain)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def join_pcm_to_mp3(part_files, audio_file):
+    """
+    Join PCM chunks in order and encode them as one loudness-normalized MP3
+    (written to a temp file and renamed); returns each chunk's (start, end) seconds
+    """
+    part_files = [Path(part_file) for part_file in part_files]
+    audio_file = Path(audio_file)
+    joined_file = audio_file.with_name(audio_file.name + ".pcm")
+    offsets = []
+    position = 0
+    with open(joined_file, 'wb') as joined:
+        for part_file in part_files:
+            data = fade_edges(part_file.read_bytes())
+            joined.write(data)
+            offsets.append((pcm_seconds(position), pcm_seconds(position + len(data))))
+            position += len(data)
+
+    temp_file = audio_file.with_name(audio_file.name + ".part")
+    with timed_operation("ffmpeg.narration_encode", parts=len(part_files),
+                         audio_seconds=round(pcm_seconds(position), 3)), resource_slot("ffmpeg"):
+        run_process([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(PCM_SAMPLE_RATE), "-ac", "1", "-i", str(joined_file),
+            "-af", LOUDNORM_FILTER, "-ar", str(PCM_SAMPLE_RATE),
+            "-c:a", "libmp3lame", "-b:a", MP3_BITRATE, "-f", "mp3", str(temp_file)
+        ], check=True, capture_output=True)
+    temp_file.replace(audio_file)
+    joined_file.unlink(missing_ok=True)
+    return offsets
+
+
+def save_chunk_offsets(chunks, offsets, output_folder):
+    """
+    Write narration_chunks.json: per chunk its paragraph number, text and
+    start/end seconds in the narration MP3
+    """
+    records = [
+        {"index": index, "paragraph": chunk["paragraph"], "start": round(start, 3), "end": round(end, 3),
+         "text": chunk["text"]}
+        for index, (chunk, (start, end)) in enumerate(zip(chunks, offsets))
+    ]
+    chunks_file = Path(output_folder) / CHUNKS_FILE_NAME
+    with open(chunks_file, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    return chunks_file
+
+
+def tts_cache_key(text, voice, model):
+    """SHA-256 of a chunk's text, voice and TTS model"""
+    canonical = json.dumps({"text": text, "voice": voice, "model": model, "format": TTS_PCM_FORMAT}, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def tts_cache_file(output_folder, key):
+    return Path(output_folder) / TTS_CACHE_DIR_NAME / f"{key}.pcm"
+
+
+def prune_tts_cache(output_folder, keep_keys):
+    """Delete cached chunks (and leftover partial files) the latest narration does not use"""
+    cache_dir = Path(output_folder) / TTS_CACHE_DIR_NAME
+    removed = 0
+    for path in cache_dir.glob("*"):
+        if path.name.endswith(".pcm") and path.stem in keep_keys:
+            continue
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rate Limit Store - Host-wide rate limiter state shared by every process
+Each limiter key (e.g. "openai:images:dall-e-3", "youtube:upload") has one
+row in a SQLite database: a token bucket, a pause-until time set after a
+429, and an AIMD concurrency window. Calls in flight are leases in a second
+table, so the window counts calls from all orchestrator, queue and step
+processes on the host. Each lease records the pid of its process: leases of a
+process that has exited (crashed, or killed when its workflow was cancelled)
+are dropped on the next acquire, and any lease expires after its limiter's
+lease_seconds (LEASE_SECONDS by default) in case the pid has been reused.
+Every read-modify-write runs in a BEGIN IMMEDIATE transaction, so concurrent
+processes see one consistent bucket and aggregate throughput stays under
+the account limit instead of each process spending it on its own.
+The database is RATE_LIMIT_DB, or workflows/rate_limits.sqlite3 next to the
+scripts. If it cannot be opened the limiters fall back to per-process state.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import ctypes
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+RATE_LIMIT_DB_ENV = "RATE_LIMIT_DB"
+DEFAULT_DB_PATH = Path(__file__).resolve().parent / "workflows" / "rate_limits.sqlite3"
+
+# A call holding its lease longer than this no longer counts toward the window
+LEASE_SECONDS = 300
+# How often a waiting caller re-checks the shared state
+POLL_SECONDS = 0.2
+
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 32
+
+_store = None
+_store_lock = threading.Lock()
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def pid_alive(pid):
+    """Whether a process with this pid is running on the host"""
+    if pid == os.getpid():
+        return True
+    if sys.platform == "win32":
+        # os.kill(pid, 0) would send CTRL_C_EVENT here
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, owned by another user
+        return True
+    return True
+
+
+def new_state(concurrency=INITIAL_CONCURRENCY, max_concurrency=MAX_CONCURRENCY, per_minute=None, burst=None):
+    """Initial limiter state; per_minute None means no bucket until one is learned"""
+    state = {
+        "concurrency": concurrency, "maxConcurrency": max_concurrency,
+        "successes": 0, "saturated": False, "blockedUntil": 0.0, "rateLimited": 0,
+        "rate": None, "capacity": None, "tokens": 0.0, "updated": time.time()
+    }
+    if per_minute:
+        set_rate(state, per_minute, burst)
+    return state
+
+
+def set_rate(state, per_minute, burst=None):
+    """Refill per_minute tokens a minute, with a burst of up to burst (default a minute's worth)"""
+    per_minute = max(1e-6, float(per_minute))
+    capacity = float(burst) if burst else max(1.0, per_minute)
+    if state["capacity"] is None:
+        state["tokens"] = capacity
+    state["rate"] = per_minute / 60
+    state["capacity"] = capacity
+    state["tokens"] = min(state["tokens"], capacity)
+
+
+def _refill(state, now):
+    if state["rate"] is not None:
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(state["capacity"], state["tokens"] + elapsed * state["rate"])
+    state["updated"] = now
+
+
+def limit_remaining(state, remaining, now):
+    """Never hold more tokens than the server says are left"""
+    if state["rate"] is not None:
+        _refill(state, now)
+        state["tokens"] = min(state["tokens"], float(remaining))
+
+
+def block_until(state, until):
+    state["blockedUntil"] = max(state["blockedUntil"], until)
+
+
+def try_take(state, in_flight, now):
+    """Claim a call slot; returns 0 if granted, else the seconds worth waiting"""
+    if in_flight >= state["concurrency"]:
+        state["saturated"] = True
+        return POLL_SECONDS
+    if state["blockedUntil"] > now:
+        return state["blockedUntil"] - now
+    if state["rate"] is None:
+        return 0
+    _refill(state, now)
+    if state["tokens"] >= 1:
+        state["tokens"] -= 1
+        return 0
+    return (1 - state["tokens"]) / state["rate"]
+
+
+def record_outcome(state, outcome, retry_after, now):
+    """AIMD: grow the window while it is the bottleneck, halve it on a 429"""
+    if outcome == "rate_limited":
+        state["rateLimited"] += 1
+        state["concurrency"] = max(1, state["concurrency"] // 2)
+        state["successes"] = 0
+        state["saturated"] = False
+        block_until(state, now + (retry_after if retry_after is not None else 1.0))
+    elif outcome == "ok":
+        state["successes"] += 1
+        if state["saturated"] and state["successes"] >= state["concurrency"] \
+                and state["concurrency"] < state["maxConcurrency"]:
+            state["concurrency"] += 1
+            state["successes"] = 0
+            state["saturated"] = False
+
+
+class MemoryLimitStore:
+    """Per-process state, used when the shared database is unavailable"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._leases = {}
+
+    def _in_flight(self, key, now):
+        for lease, (lease_key, expires) in list(self._leases.items()):
+            if expires < now:
+                del self._leases[lease]
+        return sum(1 for lease_key, _ in self._leases.values() if lease_key == key)
+
+    def acquire(self, key, defaults, lease_seconds=LEASE_SECONDS):
+        with self._lock:
+            now = time.time()
+            state = self._states.setdefault(key, defaults())
+            wait = try_take(state, self._in_flight(key, now), now)
+            if wait:
+                return None, wait
+            lease = uuid.uuid4().hex
+            self._leases[lease] = (key, now + lease_seconds)
+            return lease, 0
+
+    def release(self, key, defaults, lease, update):
+        with self._lock:
+            self._leases.pop(lease, None)
+            update(self._states.setdefault(key, defaults()), time.time())
+
+    def load(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            return {**state, "inFlight": self._in_flight(key, time.time())}
+
+
+class SqliteLimitStore:
+    """State shared through a SQLite database, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # Fail here, not on the first API call, if the database is unusable
+        self._connection()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS limiters (key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases "
+                         "(id TEXT PRIMARY KEY, key TEXT NOT NULL, expires REAL NOT NULL, pid INTEGER)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(leases)")]
+            if "pid" not in columns:
+                # Database created before leases recorded their process
+                conn.execute("ALTER TABLE leases ADD COLUMN pid INTEGER")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, key, defaults):
+        """Yield (connection, state) under a write lock and save the state afterwards"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM limiters WHERE key = ?", (key,)).fetchone()
+            state = json.loads(row[0]) if row else defaults()
+            yield conn, state
+            conn.execute("INSERT OR REPLACE INTO limiters (key, state) VALUES (?, ?)", (key, json.dumps(state)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _in_flight(self, conn, key, now):
+        """Leases held for key, after dropping expired ones and those of exited processes"""
+        conn.execute("DELETE FROM leases WHERE expires < ?", (now,))
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM leases WHERE key = ? AND pid IS NOT NULL",
+                                   (key,)).fetchall():
+            if not pid_alive(pid):
+                conn.execute("DELETE FROM leases WHERE pid = ?", (pid,))
+        return conn.execute("SELECT COUNT(*) FROM leases WHERE key = ?", (key,)).fetchone()[0]
+
+    def acquire(self, key, defaults, lease_seconds=LEASE_SECONDS):
+        with self._transaction(key, defaults) as (conn, state):
+            now = time.time()
+            wait = try_take(state, self._in_flight(conn, key, now), now)
+            if wait:
+                return None, wait
+            lease = uuid.uuid4().hex
+            conn.execute("INSERT INTO leases (id, key, expires, pid) VALUES (?, ?, ?, ?)",
+                         (lease, key, now + lease_seconds, os.getpid()))
+            return lease, 0
+
+    def release(self, key, defaults, lease, update):
+        with self._transaction(key, defaults) as (conn, state):
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease,))
+            update(state, time.time())
+
+    def load(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT state FROM limiters WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        in_flight = sum(count for pid, count in conn.execute(
+            "SELECT pid, COUNT(*) FROM leases WHERE key = ? AND expires >= ? GROUP BY pid",
+            (key, time.time())) if pid is None or pid_alive(pid))
+        return {**json.loads(row[0]), "inFlight": in_flight}
+
+
+def get_store():
+    """The host-wide store, or a per-process one if the database cannot be used"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv(RATE_LIMIT_DB_ENV, str(DEFAULT_DB_PATH))
+            try:
+                _store = SqliteLimitStore(path)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[WARN] Shared rate limit database unavailable ({e}); limiting per process")
+                _store = MemoryLimitStore()
+        return _store
+
+
+class SharedLimiter:
+    """Host-wide limiter for one key; acquire() returns a lease to pass to release()"""
+
+    def __init__(self, key, store, lease_seconds=LEASE_SECONDS, **defaults):
+        self.key = key
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self._defaults = defaults
+
+    def _new_state(self):
+        return new_state(**self._defaults)
+
+    def acquire(self, cancel_token=None):
+        while True:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            lease, wait = self.store.acquire(self.key, self._new_state, self.lease_seconds)
+            if lease:
+                return lease
+            # Poll: other processes release slots without notifying us
+            if cancel_token:
+                cancel_token.wait(min(wait, POLL_SECONDS * 5))
+            else:
+                time.sleep(min(wait, POLL_SECONDS * 5))
+
+    def release(self, lease, outcome, retry_after=None, update=None):
+        """outcome is "ok", "rate_limited" or "error"; update(state, now) may adjust the bucket"""
+        def apply(state, now):
+            if update is not None:
+                update(state, now)
+            record_outcome(state, outcome, retry_after, now)
+        self.store.release(self.key, self._new_state, lease, apply)
+
+    @contextmanager
+    def slot(self, cancel_token=None):
+        """Hold a slot for the block; a block that raises counts as "error" unless it set the outcome"""
+        lease = self.acquire(cancel_token)
+        result = {"outcome": "error", "retry_after": None}
+        try:
+            yield result
+            if result["outcome"] == "error":
+                result["outcome"] = "ok"
+        finally:
+            self.release(lease, result["outcome"], result["retry_after"])
+
+    def snapshot(self):
+        state = self.store.load(self.key) or self._new_state()
+        return {"concurrency": state["concurrency"], "inFlight": state.get("inFlight", 0),
+                "requestsPerMinute": round(state["rate"] * 60, 3) if state["rate"] else None,
+                "rateLimited": state["rateLimited"]}
+
+
+def get_shared_limiter(key, lease_seconds=LEASE_SECONDS, **defaults):
+    """
+    Limiter for key; defaults (concurrency, max_concurrency, per_minute, burst)
+    only seed a new key. Calls that can outlast LEASE_SECONDS pass a longer lease_seconds.
+    """
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = SharedLimiter(key, get_store(), lease_seconds, **defaults)
+        return _limiters[key]
+
+
+def get_shared_limiter_snapshot():
+    with _limiters_lock:
+        limiters = list(_limiters.items())
+    return {key: limiter.snapshot() for key, limiter in limiters}
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rate Limiter - Adaptive rate limiting and retries for OpenAI API calls
+Steps call openai_create(client.images, "images", model=..., ...) instead of
+client.images.generate(...), and likewise for chat completions and speech.
+Each (endpoint, model) pair gets a host-wide limiter (rate_limit_store.py) that
+  - keeps a token bucket sized from the x-ratelimit-* response headers
+  - pauses every caller until Retry-After / the reset time has passed
+  - tunes its concurrency additively upward while calls succeed and halves
+    it on every 429 (AIMD), so it settles just below the account's limit
+The limiter state is shared by all processes on the host, so concurrent
+workflows divide the account's limits instead of each throttling the others.
+The legacy V7 scripts and the image review tool call through here as well,
+so running them next to the V8 pipeline spends the same budget.
+Failed calls are retried with exponential backoff and jitter. The OpenAI
+clients are created with max_retries=0 so every 429 reaches this module.
+Chat completions are answered from the opt-in llm_cache when possible;
+openai_stream_chat() streams one, handing each content delta to a callback.
+"""
+
+import re
+import time
+import random
+from email.utils import parsedate_to_datetime
+
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from openai.types.chat import ChatCompletion
+
+from resource_limits import resource_slot
+from rate_limit_store import get_shared_limiter, set_rate, limit_remaining, block_until
+from llm_cache import cache_get, cache_put, cache_enabled
+from workflow_metrics import record_operation
+from workflow_cancel import cancellable_sleep, current_cancel_token, check_cancelled
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# SDK method per endpoint name; everything else is .create()
+ENDPOINT_METHODS = {"images": "generate"}
+
+
+def parse_duration(value):
+    """Seconds from an x-ratelimit-reset-* value such as "20ms", "1s" or "6m0s"; None if unreadable"""
+    if not value:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", str(value))
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers):
+    """Seconds the server asked us to wait (retry-after-ms / retry-after), or None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with jitter; a server-given Retry-After takes precedence"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+    ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def apply_rate_limit_headers(state, headers, now):
+    """Size the shared bucket from x-ratelimit-* headers and pause it until a reset if exhausted"""
+    limit = headers.get("x-ratelimit-limit-requests")
+    if limit:
+        try:
+            set_rate(state, float(limit))
+        except ValueError:
+            pass
+    for kind in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        try:
+            remaining = float(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+        if remaining is None:
+            continue
+        if kind == "requests":
+            limit_remaining(state, remaining, now)
+        if remaining <= 0:
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset:
+                block_until(state, now + reset)
+
+
+def get_limiter(endpoint, model):
+    return get_shared_limiter(f"openai:{endpoint}:{model or ''}")
+
+
+def _call_create(resource, endpoint, kwargs):
+    """The endpoint's SDK method with kwargs, returning (result, response headers)"""
+    method = ENDPOINT_METHODS.get(endpoint, "create")
+    raw_resource = getattr(resource, "with_raw_response", None)
+    if raw_resource is None:
+        return getattr(resource, method)(**kwargs), None
+    raw = getattr(raw_resource, method)(**kwargs)
+    return raw.parse(), raw.headers
+
+
+def _call_with_limits(endpoint, model, call):
+    """
+    Run call() -> (result, headers) under the (endpoint, model) limiter,
+    retrying 429s, timeouts, connection and 5xx errors with backoff
+    """
+    limiter = get_limiter(endpoint, model)
+    cancel_token = current_cancel_token()
+
+    for attempt in range(MAX_ATTEMPTS):
+        lease = limiter.acquire(cancel_token)
+        outcome, headers, retry_after = "error", None, None
+        try:
+            with resource_slot("openai"):
+                result, headers = call()
+            outcome = "ok"
+            return result
+        except RateLimitError as e:
+            headers = e.response.headers
+            if getattr(e, "code", None) == "insufficient_quota":
+                # Out of credit: waiting will not help
+                raise
+            outcome, retry_after = "rate_limited", parse_retry_after(headers)
+            error = e
+        except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+            response = getattr(e, "response", None)
+            retry_after = parse_retry_after(response.headers) if response is not None else None
+            error = e
+        finally:
+            limiter.release(lease, outcome, retry_after,
+                            (lambda state, now: apply_rate_limit_headers(state, headers, now)) if headers else None)
+
+        if attempt == MAX_ATTEMPTS - 1:
+            raise error
+        delay = backoff_delay(attempt, retry_after)
+        print(f"[WARN] {endpoint} {model or ''} call failed ({type(error).__name__}), "
+              f"retrying in {delay:.1f}s (attempt {attempt + 2}/{MAX_ATTEMPTS})")
+        record_operation({"name": "openai.backoff", "seconds": round(delay, 3), "ok": True,
+                          "endpoint": endpoint, "model": model, "reason": outcome})
+        cancellable_sleep(delay)
+
+
+def openai_create(resource, endpoint, **kwargs):
+    """
+    resource.create(**kwargs) (images: .generate) through the (endpoint, model)
+    limiter, retrying 429s, timeouts, connection and 5xx errors with backoff
+    e.g. openai_create(client.chat.completions, "chat", model="gpt-4", messages=[...])
+    """
+    cacheable = endpoint == "chat" and not kwargs.get("stream")
+    if cacheable:
+        cached = cache_get(endpoint, kwargs)
+        if cached is not None:
+            return ChatCompletion.model_validate_json(cached)
+
+    result = _call_with_limits(endpoint, kwargs.get("model"), lambda: _call_create(resource, endpoint, kwargs))
+    if cacheable:
+        cache_put(endpoint, kwargs, result.model_dump_json())
+    return result
+
+
+class StreamInterrupted(Exception):
+    """A streamed response broke off after part of it was delivered, so it cannot be retried"""
+
+
+def openai_stream_chat(completions, on_text, **kwargs):
+    """
+    Streaming chat completion: on_text(delta) is called as content arrives and
+    the full text is returned. The limiter slot is held until the stream ends.
+    Cached like openai_create(); a cache hit hands on_text the whole text at once.
+    """
+    cached = cache_get("chat", kwargs)
+    if cached is not None:
+        content = ChatCompletion.model_validate_json(cached).choices[0].message.content
+        on_text(content)
+        return content
+
+    def consume():
+        raw = completions.with_raw_response.create(stream=True, **kwargs)
+        parts = []
+        try:
+            for chunk in raw.parse():
+                check_cancelled()
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_text(delta)
+        except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+            if parts:
+                raise StreamInterrupted(f"Stream interrupted after {len(parts)} chunks: {e}") from e
+            raise
+        return "".join(parts), raw.headers
+
+    content = _call_with_limits("chat", kwargs.get("model"), consume)
+    if cache_enabled():
+        # Stored like a non-streamed response, so both kinds of call share entries
+        cache_put("chat", kwargs, ChatCompletion.model_validate({
+            "id": "chatcmpl-stream", "object": "chat.completion", "created": int(time.time()),
+            "model": kwargs.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}]
+        }).model_dump_json())
+    return content
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource Limits - Host-wide concurrency limits per resource class
+Steps wrap their expensive sections in resource_slot():
+  "openai"  - chat, image and TTS API calls
+  "ffmpeg"  - CPU-bound ffmpeg encodes
+  "whisper" - whisper model load + transcription
+Limits are only enforced once configure_limits() has been called (the
+workflow queue does this); standalone step runs are not limited.
+Waiting workflows are served highest priority first.
+Every slot request is also a cancellation point: a cancelled workflow gets
+WorkflowCancelled instead of a slot, even while it is queued for one.
+"""
+
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from workflow_cancel import check_cancelled, current_cancel_token
+
+RESOURCE_CLASSES = ("openai", "ffmpeg", "whisper")
+
+# Priority of the workflow the current thread works for (higher runs first)
+_workflow_priority = contextvars.ContextVar("workflow_priority", default=0)
+
+_limits = {}
+
+
+class PrioritySemaphore:
+    """Counting semaphore that hands free slots to the highest-priority waiter"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority=0, cancel_token=None):
+        with self._cond:
+            # Equal priorities are served first come, first served
+            entry = (-priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            while self._in_use >= self.limit or self._waiters[0] != entry:
+                # Wake up periodically so a cancelled workflow leaves the queue
+                self._cond.wait(0.5 if cancel_token else None)
+                if cancel_token and cancel_token.cancelled:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                    cancel_token.raise_if_cancelled()
+            heapq.heappop(self._waiters)
+            self._in_use += 1
+            # The next waiter may fit into another free slot
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Current usage, for queue status reporting"""
+        with self._cond:
+            return {"limit": self.limit, "inUse": self._in_use, "waiting": len(self._waiters)}
+
+
+def configure_limits(limits):
+    """Set the slot count per resource class, e.g. {"openai": 8, "ffmpeg": 2, "whisper": 1}"""
+    for name, limit in limits.items():
+        if name not in RESOURCE_CLASSES:
+            raise ValueError(f"Unknown resource class: {name}")
+        if limit and limit > 0:
+            _limits[name] = PrioritySemaphore(limit)
+        else:
+            _limits.pop(name, None)
+
+
+def get_limits_snapshot():
+    return {name: semaphore.snapshot() for name, semaphore in _limits.items()}
+
+
+def set_workflow_priority(priority):
+    """Set the priority used by resource_slot() in the current thread/context"""
+    return _workflow_priority.set(priority)
+
+
+@contextmanager
+def resource_slot(name):
+    """Hold one slot of the given resource class for the duration of the block"""
+    check_cancelled()
+    semaphore = _limits.get(name)
+    if semaphore is None:
+        yield
+        return
+    semaphore.acquire(_workflow_priority.get(), current_cancel_token())
+    try:
+        yield
+    finally:
+        semaphore.release()
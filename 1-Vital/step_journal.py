@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Step Journal - Per-unit checkpoints inside a step
+Steps that produce many units (step 2 images, step 4 overlays and segments)
+append one JSON line per completed unit: its key, the parameters it was made
+with and the checksum of the output file. After a crash or cancel, a rerun
+treats a unit as done only if its entry matches the current parameters and
+the output on disk still has the recorded checksum, so truncated or stale
+files are redone instead of trusted.
+"""
+
+import json
+import threading
+from pathlib import Path
+from datetime import datetime
+
+from artifact_cache import file_sha256
+
+JOURNAL_DIR_NAME = ".journal"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND_CHUNK = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+
+def is_complete_png(path):
+    """True if the file starts with the PNG signature and ends with the IEND chunk"""
+    path = Path(path)
+    try:
+        if path.stat().st_size < len(PNG_SIGNATURE) + len(PNG_IEND_CHUNK):
+            return False
+        with open(path, 'rb') as f:
+            if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                return False
+            f.seek(-len(PNG_IEND_CHUNK), 2)
+            return f.read() == PNG_IEND_CHUNK
+    except OSError:
+        return False
+
+
+class StepJournal:
+    """Append-only JSONL journal of completed units for one step"""
+
+    def __init__(self, output_folder, name):
+        self.path = Path(output_folder) / JOURNAL_DIR_NAME / f"{name}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash is simply not a checkpoint
+                        continue
+                    # Later entries for the same unit replace earlier ones
+                    self.entries[entry["key"]] = entry
+            # Terminate a partial last line so the next entry starts on its own line
+            with open(self.path, 'rb+') as f:
+                f.seek(0, 2)
+                if f.tell() > 0:
+                    f.seek(-1, 2)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_done(self, key, output_path, **params):
+        """True if the unit was journaled with these params and its output is unchanged"""
+        entry = self.entries.get(key)
+        if not entry or any(entry.get(name) != value for name, value in params.items()):
+            return False
+        output_path = Path(output_path)
+        return output_path.is_file() and file_sha256(output_path) == entry["checksum"]
+
+    def record(self, key, output_path, **params):
+        """Checkpoint a completed unit; the output file must be fully written"""
+        output_path = Path(output_path)
+        entry = {
+            "key": key,
+            "output": output_path.name,
+            "checksum": file_sha256(output_path),
+            "bytes": output_path.stat().st_size,
+            **params,
+            "recordedAt": datetime.now().isoformat()
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+            self.entries[key] = entry
+        return entry
@@ -7,9 +7,12 @@ from openai import OpenAI
 from dotenv import load_dotenv
 from docx import Document
 
+from rate_limiter import openai_create
+
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries and backoff are left to rate_limiter
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
 # Read essay
 doc = Document('Course_Collective/birth of martin luther king jr-01-15-2026/output/essay_short.docx')
@@ -68,7 +71,8 @@ Format as:
 """
 
 print("[AI] Extracting visual metadata...")
-response = client.chat.completions.create(
+response = openai_create(
+    client.chat.completions, "chat",
     model="gpt-4",
     messages=[
         {"role": "system", "content": "You are an expert at extracting visual details for AI image generation. Be specific and concise."},
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test that narration text is split and aligned without losing or changing any of the essay"""
+
+from narration_audio import split_sentences, split_tts_chunks
+from narration_alignment import align_chunk, merge_short_segments
+
+SAMPLES = [
+    'He said "Stop." Then left.',
+    "Mr. Smith met Dr. Jones (at noon.) They talked [briefly.] Then it rained!",
+    "Martin Luther King Jr. was born in 1929. John F. Kennedy spoke. Was it ‘true?’ Yes.",
+    "Wait... what? “Quoted.” End",
+]
+
+
+def squeeze(text):
+    return "".join(text.split())
+
+
+def test_sentences_reproduce_text():
+    for text in SAMPLES:
+        sentences = split_sentences(text)
+        assert " ".join(sentences) == text, sentences
+        assert squeeze("".join(sentences)) == squeeze(text)
+
+
+def test_closing_quotes_and_brackets_stay_with_sentence():
+    assert split_sentences('He said "Stop." Then left.') == ['He said "Stop."', 'Then left.']
+    assert split_sentences("It ended (at noon.) Then rain.") == ["It ended (at noon.)", "Then rain."]
+
+
+def test_no_split_after_abbreviations():
+    assert split_sentences("Mr. Smith met Dr. Jones. They talked.") == ["Mr. Smith met Dr. Jones.", "They talked."]
+
+
+def test_chunks_reproduce_paragraphs():
+    text = "\n\n".join(SAMPLES)
+    for max_chars in (20, 40, 4096):
+        chunks = split_tts_chunks(text, max_chars)
+        assert all(len(chunk) <= max_chars for chunk in chunks)
+        assert squeeze("".join(chunks)) == squeeze(text)
+
+
+def test_aligned_segments_reproduce_chunk_text():
+    for text in SAMPLES:
+        chunk = {"start": 3.0, "end": 12.0, "text": text}
+        for pauses in ([], [4.1, 6.0, 8.2, 10.5]):
+            segments = align_chunk(chunk, pauses)
+            assert " ".join(segment["text"] for segment in segments) == text
+            assert segments[0]["start"] == 3.0 and segments[-1]["end"] == 12.0
+            assert all(a["end"] == b["start"] for a, b in zip(segments, segments[1:]))
+            merged = merge_short_segments(segments, 5)
+            assert " ".join(segment["text"] for segment in merged) == text
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Whisper Service - Keeps Whisper models loaded and transcribes for every workflow
+Loading a model takes seconds and hundreds of MB, and each step 1 run,
+17_Recreate_Narration_timestamp.py and the V7 sheet loop used to pay it per
+lesson. This long-lived local service loads each model once and answers
+  POST /transcribe  {"audio": "<path>", "model": "base", "wordTimestamps": true, "priority": 0}
+with {"segments": [{"start", "end", "text", "words": [{"word", "start", "end"}]}], "text", ...}
+  GET  /status      loaded models, queued and served requests
+Requests are queued highest priority first. A worker takes the next request
+plus up to BATCH_SIZE queued ones for the same model, so with --max-models
+below the number of models in use each load is shared by a batch. Identical
+requests (same unchanged audio file, model and options) in flight are
+answered by one transcription.
+Clients call transcribe(): with WHISPER_SERVICE_URL set it goes through the
+service, otherwise (or if the service cannot be reached) the model is loaded
+in this process, once per process.
+A model name may start with a backend: "base" or "openai-whisper:base" runs
+openai-whisper; "faster-whisper:base" runs CTranslate2 (faster-whisper) with
+int8 weights and Silero VAD filtering, several times faster on CPU-only hosts
+(WHISPER_COMPUTE_TYPE / WHISPER_CPU_THREADS adjust it). Both return the same
+segments and words.
+
+Usage:
+  python whisper_service.py --port 8790 --preload base --workers 1
+  python whisper_service.py --preload faster-whisper:small
+  python workflow_queue.py serve --whisper-service http://127.0.0.1:8790 ...
+"""
+
+import os
+import json
+import time
+import heapq
+import argparse
+import itertools
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from resource_limits import resource_slot
+from workflow_metrics import timed_operation
+from workflow_cancel import check_cancelled
+
+WHISPER_SERVICE_URL_ENV = "WHISPER_SERVICE_URL"
+WHISPER_COMPUTE_TYPE_ENV = "WHISPER_COMPUTE_TYPE"
+WHISPER_CPU_THREADS_ENV = "WHISPER_CPU_THREADS"
+DEFAULT_BACKEND = "openai-whisper"
+# Pauses this long split speech regions for faster-whisper's VAD filter
+VAD_MIN_SILENCE_MS = 500
+DEFAULT_PORT = 8790
+# Models kept loaded per process; the least recently used one is dropped beyond this
+DEFAULT_MAX_MODELS = 2
+BATCH_SIZE = 8
+# A long narration on CPU can take many minutes
+REQUEST_TIMEOUT_SECONDS = 3600
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+# A model's transcribe() installs hooks on the model, so calls on one model take turns
+_model_use_locks = {}
+# Held while a model loads, so requests for other (loaded) models are not blocked
+_model_load_locks = {}
+max_loaded_models = DEFAULT_MAX_MODELS
+
+
+def parse_model_name(name):
+    """Split e.g. 'faster-whisper:base' into (backend, model); a plain 'base' is openai-whisper"""
+    backend, _, model = name.partition(":")
+    if not model:
+        return DEFAULT_BACKEND, name
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown Whisper backend '{backend}' (use one of: {', '.join(BACKENDS)})")
+    return backend, model
+
+
+class OpenAIWhisperBackend:
+    """openai-whisper (PyTorch, fp32 on CPU)"""
+
+    def load(self, model):
+        # Imported here: processes that only talk to the service never load torch
+        import whisper
+        return whisper.load_model(model)
+
+    def transcribe(self, model, audio_file, word_timestamps):
+        result = model.transcribe(str(audio_file), word_timestamps=word_timestamps)
+        segments = []
+        for segment in result.get("segments", []):
+            entry = {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            if "words" in segment:
+                entry["words"] = [{"word": word["word"], "start": word["start"], "end": word["end"]}
+                                  for word in segment["words"]]
+            segments.append(entry)
+        return {"text": result.get("text", ""), "segments": segments}
+
+
+class FasterWhisperBackend:
+    """faster-whisper: CTranslate2 with int8 weights on CPU, silence skipped by VAD"""
+
+    def load(self, model):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("faster-whisper not installed. Install with: pip install faster-whisper")
+        return WhisperModel(model, device="cpu",
+                            compute_type=os.getenv(WHISPER_COMPUTE_TYPE_ENV, "int8"),
+                            cpu_threads=int(os.getenv(WHISPER_CPU_THREADS_ENV, 0)))
+
+    def transcribe(self, model, audio_file, word_timestamps):
+        # Segments are decoded lazily as the generator is consumed
+        generated, _ = model.transcribe(str(audio_file), word_timestamps=word_timestamps, vad_filter=True,
+                                        vad_parameters={"min_silence_duration_ms": VAD_MIN_SILENCE_MS})
+        segments = []
+        for segment in generated:
+            check_cancelled()
+            entry = {"start": segment.start, "end": segment.end, "text": segment.text}
+            if segment.words is not None:
+                entry["words"] = [{"word": word.word, "start": word.start, "end": word.end}
+                                  for word in segment.words]
+            segments.append(entry)
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments}
+
+
+BACKENDS = {"openai-whisper": OpenAIWhisperBackend(), "faster-whisper": FasterWhisperBackend()}
+
+
+def get_model(name):
+    """The loaded model for a (backend-prefixed) model name, loading it on first use"""
+    with _models_lock:
+        model = _models.get(name)
+        if model is not None:
+            _models.move_to_end(name)
+            return model
+        load_lock = _model_load_locks.setdefault(name, threading.Lock())
+    with load_lock:
+        # Another request may have loaded it while this one waited
+        with _models_lock:
+            model = _models.get(name)
+            if model is not None:
+                _models.move_to_end(name)
+                return model
+        backend, model_name = parse_model_name(name)
+        with timed_operation("whisper.load", model=name):
+            model = BACKENDS[backend].load(model_name)
+        with _models_lock:
+            _models[name] = model
+            _model_use_locks.setdefault(name, threading.Lock())
+            while len(_models) > max_loaded_models:
+                _models.popitem(last=False)
+        return model
+
+
+def loaded_models():
+    with _models_lock:
+        return list(_models)
+
+
+def transcribe_local(audio_file, model_name, word_timestamps=True):
+    """Transcribe in this process with the cached model"""
+    backend, _ = parse_model_name(model_name)
+    with resource_slot("whisper"):
+        model = get_model(model_name)
+        with _model_use_locks[model_name], timed_operation("whisper.transcribe", model=model_name):
+            return BACKENDS[backend].transcribe(model, audio_file, word_timestamps)
+
+
+def transcribe_remote(url, audio_file, model_name, word_timestamps=True, priority=0):
+    """Transcribe through the service at url"""
+    body = json.dumps({
+        "audio": str(Path(audio_file).resolve()),
+        "model": model_name,
+        "wordTimestamps": word_timestamps,
+        "priority": priority
+    }).encode("utf-8")
+    request = urllib.request.Request(url.rstrip("/") + "/transcribe", data=body,
+                                     headers={"Content-Type": "application/json"})
+    with timed_operation("whisper.service", model=model_name) as op:
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+                result = json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Whisper service error {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+        op["queuedSeconds"] = result.get("queuedSeconds")
+    return result
+
+
+def transcribe(audio_file, model_name, word_timestamps=True):
+    """
+    Segments (with words, if asked for) of audio_file: from the service when
+    WHISPER_SERVICE_URL is set and reachable, else from a model in this process
+    """
+    url = os.getenv(WHISPER_SERVICE_URL_ENV)
+    if url:
+        try:
+            return transcribe_remote(url, audio_file, model_name, word_timestamps)
+        except urllib.error.URLError as e:
+            print(f"[WARN] Whisper service at {url} unavailable ({e.reason}); transcribing locally")
+    return transcribe_local(audio_file, model_name, word_timestamps)
+
+
+class TranscriptionJob:
+    def __init__(self, key, audio, model, word_timestamps, priority):
+        self.key = key
+        self.audio = audio
+        self.model = model
+        self.word_timestamps = word_timestamps
+        self.priority = priority
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TranscriptionService:
+    """Priority queue of transcription jobs served by worker threads"""
+
+    def __init__(self, workers=1):
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self.active = 0
+        self.served = 0
+        self.coalesced = 0
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"whisper-worker-{i}", daemon=True).start()
+
+    def submit(self, audio, model, word_timestamps=True, priority=0):
+        """Queue a transcription, or join an identical one already queued or running"""
+        stat = os.stat(audio)
+        key = (os.path.realpath(audio), stat.st_size, stat.st_mtime_ns, model, bool(word_timestamps))
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None:
+                self.coalesced += 1
+                return job
+            job = TranscriptionJob(key, audio, model, word_timestamps, priority)
+            self._jobs[key] = job
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job))
+            self._cond.notify()
+            return job
+
+    def _next_batch(self):
+        """The highest-priority job and queued jobs for the same model, up to BATCH_SIZE"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            _, _, first = heapq.heappop(self._queue)
+            batch = [first]
+            rest = []
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                if entry[2].model == first.model and len(batch) < BATCH_SIZE:
+                    batch.append(entry[2])
+                else:
+                    rest.append(entry)
+            for entry in rest:
+                heapq.heappush(self._queue, entry)
+            self.active += len(batch)
+            return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            for job in batch:
+                job.started = time.perf_counter()
+                try:
+                    job.result = transcribe_local(job.audio, job.model, job.word_timestamps)
+                except Exception as e:
+                    job.error = f"{type(e).__name__}: {e}"
+                with self._cond:
+                    self._jobs.pop(job.key, None)
+                    self.active -= 1
+                    self.served += 1
+                job.done.set()
+
+    def status(self):
+        with self._cond:
+            return {"models": loaded_models(), "queued": len(self._queue), "active": self.active,
+                    "served": self.served, "coalesced": self.coalesced}
+
+
+class TranscriptionHandler(BaseHTTPRequestHandler):
+    """POST /transcribe and GET /status for the service in server.service"""
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/status":
+            self.send_error(404, "Use POST /transcribe or GET /status")
+            return
+        self._send_json(200, self.server.service.status())
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/transcribe":
+            self.send_error(404, "Use POST /transcribe or GET /status")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            audio = request["audio"]
+            model = request.get("model") or self.server.default_model
+            priority = int(request.get("priority", 0))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+        if not os.path.isfile(audio):
+            self._send_json(404, {"error": f"Audio file not found: {audio}"})
+            return
+
+        job = self.server.service.submit(audio, model, request.get("wordTimestamps", True), priority)
+        job.done.wait()
+        if job.error:
+            self._send_json(500, {"error": job.error})
+            return
+        self._send_json(200, {
+            **job.result,
+            "model": model,
+            "queuedSeconds": round(job.started - job.submitted, 3),
+            "transcribeSeconds": round(time.perf_counter() - job.started, 3)
+        })
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_whisper_service(host="127.0.0.1", port=DEFAULT_PORT, workers=1, default_model="base"):
+    """Serve transcriptions from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), TranscriptionHandler)
+    server.daemon_threads = True
+    server.service = TranscriptionService(workers)
+    server.default_model = default_model
+    thread = threading.Thread(target=server.serve_forever, name="whisper-service", daemon=True)
+    thread.start()
+    print(f"[OK] Whisper service at http://{host}:{server.server_address[1]}")
+    return server
+
+
+def main():
+    global max_loaded_models
+    parser = argparse.ArgumentParser(description='Whisper Service')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=1, help='Transcriptions run at once')
+    parser.add_argument('--max-models', type=int, default=DEFAULT_MAX_MODELS, help='Models kept loaded')
+    parser.add_argument('--preload', nargs='*', default=[], metavar='MODEL', help='Models to load at startup')
+    args = parser.parse_args()
+
+    max_loaded_models = max(1, args.max_models)
+    for name in args.preload:
+        print(f"[INFO] Loading Whisper model: {name}")
+        get_model(name)
+    server = start_whisper_service(args.host, args.port, args.workers,
+                                   args.preload[0] if args.preload else "base")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\n[STOP] Whisper service stopped")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
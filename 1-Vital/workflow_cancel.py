@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Workflow Cancel - Cooperative cancellation of a running workflow
+Each workflow run has a CancelToken. Cancelling it
+  - terminates the step subprocesses (their whole process group, so ffmpeg
+    children go too), escalating to a kill after CANCEL_GRACE_SECONDS
+  - terminates ffmpeg processes started through run_process() by in-process steps
+  - makes resource_slot(), check_cancelled() and cancellable_sleep() raise
+    WorkflowCancelled in the workflow's threads, so no further API call starts
+WorkflowCancelled derives from BaseException, like KeyboardInterrupt, so the
+steps' broad "except Exception" retry handlers do not swallow it.
+Step scripts call exit_on_sigterm() first thing, so the SIGTERM a cancel sends
+unwinds their main thread and its finally blocks (rate limiter lease releases)
+run before the kill.
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import contextvars
+
+# How long cancelled processes get to exit after SIGTERM before they are killed
+CANCEL_GRACE_SECONDS = 10
+
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class WorkflowCancelled(BaseException):
+    """Raised in a workflow's threads once its CancelToken is cancelled"""
+
+
+def new_session_kwargs():
+    """Popen arguments that put a child in its own process group"""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def terminate_process(process, grace_seconds=CANCEL_GRACE_SECONDS, group=False):
+    """
+    Ask a process (or its process group) to exit, and kill it if it is still
+    running after grace_seconds. Returns immediately; escalation runs in a thread.
+    """
+    if process.poll() is not None:
+        return
+
+    def send(sig):
+        try:
+            if group and sys.platform != "win32":
+                os.killpg(process.pid, sig)
+            elif sig == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+
+    send(signal.SIGTERM)
+
+    def escalate():
+        deadline = time.monotonic() + grace_seconds
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                return
+            time.sleep(0.1)
+        if group and sys.platform == "win32":
+            # No process groups to signal; take the whole tree down
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+        else:
+            send(getattr(signal, "SIGKILL", signal.SIGTERM))
+
+    threading.Thread(target=escalate, name=f"kill-{process.pid}", daemon=True).start()
+
+
+def exit_on_sigterm():
+    """Raise SystemExit in the main thread on SIGTERM instead of dying without cleanup"""
+    def handle(signum, frame):
+        raise SystemExit(128 + signum)
+    signal.signal(signal.SIGTERM, handle)
+
+
+class CancelToken:
+    """Cancellation state of one workflow run, shared by all its threads"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        # process -> whether to signal its whole process group
+        self._processes = {}
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the workflow; safe to call from a signal handler and more than once"""
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes.items())
+        for process, group in processes:
+            terminate_process(process, group=group)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise WorkflowCancelled("Cancelled by user")
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds; True if cancelled meanwhile"""
+        return self._event.wait(timeout)
+
+    def register_process(self, process, group=False):
+        """Track a child process so cancel() terminates it"""
+        with self._lock:
+            self._processes[process] = group
+        if self._event.is_set():
+            terminate_process(process, group=group)
+
+    def unregister_process(self, process):
+        with self._lock:
+            self._processes.pop(process, None)
+
+
+def set_cancel_token(token):
+    """Make token the current thread/context's token; returns a reset token"""
+    return _current_token.set(token)
+
+
+def reset_cancel_token(reset_token):
+    _current_token.reset(reset_token)
+
+
+def current_cancel_token():
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Raise WorkflowCancelled if the current workflow has been cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def cancellable_sleep(seconds):
+    """time.sleep() that ends early, raising WorkflowCancelled, on cancellation"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    if token.wait(seconds):
+        token.raise_if_cancelled()
+
+
+def run_process(cmd, check=False, capture_output=False, text=False, **kwargs):
+    """
+    subprocess.run() whose child is terminated when the workflow is cancelled
+    Used for ffmpeg, so an in-process step's encodes stop with the workflow
+    """
+    token = _current_token.get()
+    if token is None:
+        return subprocess.run(cmd, check=check, capture_output=capture_output, text=text, **kwargs)
+
+    token.raise_if_cancelled()
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    process = subprocess.Popen(cmd, text=text, **kwargs)
+    token.register_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        token.unregister_process(process)
+    token.raise_if_cancelled()
+
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
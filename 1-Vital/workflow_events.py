@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Workflow Events - Append-only progress log and server-sent-events endpoint
+Every status change update_status() makes is also appended to
+<status file>.events.jsonl as one JSON line with an increasing "seq", written
+with a single O_APPEND write so readers never see half an event. Tailing the
+log replaces polling the status file.
+Optionally an HTTP endpoint streams the same events as they happen:
+  GET /workflows/<workflow_id>/events
+replays the log (after the Last-Event-ID header or ?since=<seq>, if given)
+and then pushes live events until the workflow completes, fails or is cancelled.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TERMINAL_STATUSES = ("completed", "error", "cancelled")
+HEARTBEAT_SECONDS = 15
+
+_registry_lock = threading.Lock()
+_event_logs = {}
+_workflow_status_files = {}
+
+
+def events_path_for(status_file):
+    """Event log that belongs to a status file, e.g. X_status.json -> X_status.events.jsonl"""
+    return Path(status_file).with_suffix(".events.jsonl")
+
+
+def atomic_write_json(path, data):
+    """Write JSON to a temp file next to path and rename it over path"""
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def read_events(path, since=0):
+    """Events in the log with seq greater than since; a torn last line is ignored"""
+    events = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("seq", 0) > since:
+                    events.append(event)
+    except FileNotFoundError:
+        pass
+    return events
+
+
+class EventLog:
+    """Sequence-numbered JSONL log with live subscribers"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        # Continue numbering after whatever an earlier process (e.g. queue submit) wrote
+        existing = read_events(self.path)
+        self.seq = existing[-1]["seq"] if existing else 0
+
+    def append(self, event_type, data):
+        with self._lock:
+            self.seq += 1
+            event = {"seq": self.seq, "type": event_type, "time": datetime.now().isoformat(), **data}
+            line = (json.dumps(event) + "\n").encode("utf-8")
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            for subscriber in list(self._subscribers):
+                subscriber.put(event)
+        return event
+
+    def subscribe(self):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def get_event_log(status_file):
+    """The process-wide EventLog for a status file"""
+    path = events_path_for(status_file).resolve()
+    with _registry_lock:
+        if path not in _event_logs:
+            _event_logs[path] = EventLog(path)
+        return _event_logs[path]
+
+
+def register_workflow(workflow_id, status_file):
+    """Make a workflow's events reachable at /workflows/<workflow_id>/events"""
+    with _registry_lock:
+        _workflow_status_files[workflow_id] = os.path.abspath(status_file)
+
+
+def publish_event(status_file, event_type, data):
+    """Append an event to the status file's log and push it to subscribers"""
+    return get_event_log(status_file).append(event_type, data)
+
+
+class EventStreamHandler(BaseHTTPRequestHandler):
+    """Serves GET /workflows/<workflow_id>/events as text/event-stream"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "workflows" or parts[2] != "events":
+            self.send_error(404, "Use /workflows/<workflow_id>/events")
+            return
+        with _registry_lock:
+            status_file = _workflow_status_files.get(parts[1])
+        if status_file is None:
+            self.send_error(404, f"Unknown workflow: {parts[1]}")
+            return
+
+        try:
+            since = int(self.headers.get("Last-Event-ID") or parse_qs(url.query).get("since", ["0"])[0])
+        except ValueError:
+            since = 0
+
+        log = get_event_log(status_file)
+        # Subscribe before replaying, so nothing published in between is lost
+        subscriber = log.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            last_seq = since
+            for event in read_events(log.path, since):
+                last_seq = event["seq"]
+                self._send_event(event)
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+
+            while True:
+                try:
+                    event = subscriber.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b": heartbeat\n\n")
+                    self.wfile.flush()
+                    continue
+                if event["seq"] <= last_seq:
+                    continue
+                last_seq = event["seq"]
+                self._send_event(event)
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            log.unsubscribe(subscriber)
+
+    def _send_event(self, event):
+        payload = f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        self.wfile.write(payload.encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        # Keep step output readable; connections are not worth a line each
+        pass
+
+
+def start_event_server(host="127.0.0.1", port=8765):
+    """Serve the SSE endpoint from a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), EventStreamHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="workflow-events", daemon=True)
+    thread.start()
+    print(f"[OK] Progress events at http://{host}:{server.server_address[1]}/workflows/<workflow_id>/events")
+    return server
+
+
+def stop_event_server(server, grace_seconds=2.0):
+    """Give subscribers a moment to receive the final event, then stop serving"""
+    deadline = time.monotonic() + grace_seconds
+    with _registry_lock:
+        logs = list(_event_logs.values())
+    while any(log.subscriber_count() for log in logs) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    server.shutdown()
+    server.server_close()
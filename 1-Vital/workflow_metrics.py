@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Workflow Metrics - Where a workflow's time, CPU and disk go
+Step scripts wrap each sub-operation (GPT call, TTS, whisper, DALL-E call,
+ffmpeg invocation) in timed_operation(). Run in-process, the records go to the
+recorder the orchestrator installed; run as a subprocess, they are appended to
+the JSONL file named by WORKFLOW_METRICS_FILE and collected after the step.
+The orchestrator adds per-step wall time, CPU time, peak RSS and bytes written,
+and saves everything as metrics.json in the workflow's output folder, plus an
+optional Prometheus textfile for the node exporter's textfile collector.
+The collector exports every file in its directory on each scrape, so the file
+of a finished workflow is deleted PROMETHEUS_RETENTION_SECONDS after its final
+write (enough scrapes to record its final values), and one whose workflow
+never finished after PROMETHEUS_STALE_SECONDS.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows: CPU and RSS figures are simply left out
+    resource = None
+
+METRICS_FILE_ENV = "WORKFLOW_METRICS_FILE"
+METRICS_FILE_NAME = "metrics.json"
+PROMETHEUS_PREFIX = "smartikle"
+PROMETHEUS_RETENTION_SECONDS = 15 * 60
+PROMETHEUS_STALE_SECONDS = 24 * 3600
+
+# Recorder installed by the orchestrator for in-process runs
+_operation_recorder = contextvars.ContextVar("operation_recorder", default=None)
+_file_lock = threading.Lock()
+
+
+def set_operation_recorder(recorder):
+    """Route operation records to recorder(record); returns a reset token"""
+    return _operation_recorder.set(recorder)
+
+
+def reset_operation_recorder(token):
+    _operation_recorder.reset(token)
+
+
+def record_operation(record):
+    """Hand one finished operation to the orchestrator, if anyone is collecting"""
+    recorder = _operation_recorder.get()
+    if recorder is not None:
+        recorder(record)
+        return
+    metrics_file = os.getenv(METRICS_FILE_ENV)
+    if metrics_file:
+        with _file_lock:
+            with open(metrics_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def timed_operation(name, **details):
+    """
+    Time the block as one operation, e.g. timed_operation("dalle.image", image=3)
+    The yielded dict can be filled in by the block (e.g. details["bytes"] = size)
+    """
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield details
+        ok = True
+    finally:
+        record_operation({
+            "name": name,
+            "seconds": round(time.perf_counter() - started, 3),
+            "ok": ok,
+            **details
+        })
+
+
+def read_operations_file(path):
+    """Operation records a subprocess step appended; a torn last line is ignored"""
+    records = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def rusage_to_metrics(usage):
+    """CPU seconds and peak RSS from a resource.struct_rusage"""
+    # ru_maxrss is kilobytes on Linux
+    return {
+        "cpuUserSeconds": round(usage.ru_utime, 3),
+        "cpuSystemSeconds": round(usage.ru_stime, 3),
+        "peakRssBytes": usage.ru_maxrss * 1024
+    }
+
+
+def wait_with_rusage(process):
+    """Wait for a Popen child and return its rusage metrics (children included)"""
+    if resource is None or not hasattr(os, "wait4"):
+        process.wait()
+        return {}
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped through Popen (e.g. while being terminated on cancel)
+        process.wait()
+        return {}
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage_to_metrics(usage)
+
+
+def thread_usage():
+    """Snapshot for measuring an in-process step: this thread's CPU, process peak RSS"""
+    snapshot = {"cpuSeconds": time.thread_time()}
+    if resource is not None:
+        snapshot["peakRssBytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return snapshot
+
+
+def summarize_operations(operations):
+    """Count, total and max seconds per operation name"""
+    totals = {}
+    for op in operations:
+        entry = totals.setdefault(op["name"], {"count": 0, "totalSeconds": 0.0, "maxSeconds": 0.0})
+        entry["count"] += 1
+        entry["totalSeconds"] = round(entry["totalSeconds"] + op["seconds"], 3)
+        entry["maxSeconds"] = max(entry["maxSeconds"], op["seconds"])
+    return totals
+
+
+class WorkflowMetrics:
+    """Collects step and operation metrics for one workflow run"""
+
+    def __init__(self, workflow_id):
+        self.workflow_id = workflow_id
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        # Concurrent steps save through the same temp file
+        self._save_lock = threading.Lock()
+        self.status = "running"
+        self.steps = {}
+
+    def step_started(self, step_number):
+        with self._lock:
+            self.steps[step_number] = {
+                "status": "running",
+                "startedAt": datetime.now().isoformat(),
+                "_started": time.perf_counter(),
+                "operations": []
+            }
+
+    def step_cached(self, step_number):
+        with self._lock:
+            self.steps[step_number] = {"status": "cached", "wallSeconds": 0.0, "operations": []}
+
+    def add_operation(self, step_number, record):
+        with self._lock:
+            self.steps[step_number]["operations"].append(record)
+
+    def step_finished(self, step_number, status, usage=None, bytes_written=None):
+        with self._lock:
+            step = self.steps[step_number]
+            step["status"] = status
+            step["wallSeconds"] = round(time.perf_counter() - step.pop("_started"), 3)
+            step.update(usage or {})
+            if bytes_written is not None:
+                step["bytesWritten"] = bytes_written
+
+    def finish(self, status):
+        self.status = status
+
+    def to_dict(self):
+        with self._lock:
+            steps = {
+                str(n): {
+                    **{k: v for k, v in step.items() if not k.startswith("_")},
+                    "operationTotals": summarize_operations(step["operations"])
+                }
+                for n, step in sorted(self.steps.items())
+            }
+        return {
+            "workflowId": self.workflow_id,
+            "status": self.status,
+            "startedAt": self.started_at.isoformat(),
+            "updatedAt": datetime.now().isoformat(),
+            "wallSeconds": round(time.perf_counter() - self._started, 3),
+            "steps": steps
+        }
+
+    def save(self, output_folder, prometheus_dir=None):
+        """Write metrics.json (and the Prometheus textfile, if asked); returns the data"""
+        data = self.to_dict()
+        path = Path(output_folder) / METRICS_FILE_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.tmp")
+        with self._save_lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_path, path)
+            if prometheus_dir:
+                write_prometheus_textfile(data, prometheus_dir)
+        return data
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items())
+
+
+def format_prometheus(data):
+    """Render a metrics.json dict in the Prometheus text exposition format"""
+    workflow_id = data["workflowId"]
+    p = PROMETHEUS_PREFIX
+    lines = [
+        f"# HELP {p}_workflow_duration_seconds Wall time of the workflow run",
+        f"# TYPE {p}_workflow_duration_seconds gauge",
+        f"{p}_workflow_duration_seconds{{{_labels(workflow_id=workflow_id, status=data['status'])}}} {data['wallSeconds']}",
+    ]
+
+    step_metrics = [
+        ("step_duration_seconds", "wallSeconds", "Wall time per step"),
+        ("step_cpu_user_seconds", "cpuUserSeconds", "User CPU time per step, including child processes"),
+        ("step_cpu_system_seconds", "cpuSystemSeconds", "System CPU time per step, including child processes"),
+        ("step_cpu_seconds", "cpuSeconds", "CPU time of the step thread (in-process runs)"),
+        ("step_peak_rss_bytes", "peakRssBytes", "Peak resident memory per step"),
+        ("step_bytes_written", "bytesWritten", "Size of the artifacts a step wrote"),
+    ]
+    for metric, key, help_text in step_metrics:
+        samples = [(n, step[key]) for n, step in data["steps"].items() if step.get(key) is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP {p}_{metric} {help_text}")
+        lines.append(f"# TYPE {p}_{metric} gauge")
+        for n, value in samples:
+            lines.append(f"{p}_{metric}{{{_labels(workflow_id=workflow_id, step=n)}}} {value}")
+
+    lines.append(f"# HELP {p}_operation_seconds_total Time spent per sub-operation")
+    lines.append(f"# TYPE {p}_operation_seconds_total counter")
+    for n, step in data["steps"].items():
+        for name, totals in step["operationTotals"].items():
+            lines.append(f"{p}_operation_seconds_total{{{_labels(workflow_id=workflow_id, step=n, operation=name)}}} "
+                         f"{totals['totalSeconds']}")
+    lines.append(f"# HELP {p}_operation_count_total Number of sub-operations")
+    lines.append(f"# TYPE {p}_operation_count_total counter")
+    for n, step in data["steps"].items():
+        for name, totals in step["operationTotals"].items():
+            lines.append(f"{p}_operation_count_total{{{_labels(workflow_id=workflow_id, step=n, operation=name)}}} "
+                         f"{totals['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(data, prometheus_dir):
+    """Write <dir>/smartikle_workflow_<id>.prom atomically, as the textfile collector expects"""
+    prometheus_dir = Path(prometheus_dir)
+    prometheus_dir.mkdir(parents=True, exist_ok=True)
+    path = prometheus_dir / f"{PROMETHEUS_PREFIX}_workflow_{data['workflowId']}.prom"
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(data))
+    os.replace(temp_path, path)
+    prune_prometheus_textfiles(prometheus_dir, keep=path)
+    return path
+
+
+def prune_prometheus_textfiles(prometheus_dir, keep=None, now=None):
+    """Delete workflow textfiles that have been exported long enough; returns how many"""
+    now = time.time() if now is None else now
+    removed = 0
+    for path in Path(prometheus_dir).glob(f"{PROMETHEUS_PREFIX}_workflow_*.prom"):
+        if path == keep:
+            continue
+        try:
+            age = now - path.stat().st_mtime
+            if age < PROMETHEUS_RETENTION_SECONDS:
+                continue
+            running = 'status="running"' in path.read_text(encoding='utf-8')
+            if running and age < PROMETHEUS_STALE_SECONDS:
+                continue
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            # Pruned by another workflow at the same time
+            continue
+    return removed
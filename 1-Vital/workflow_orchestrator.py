@@ -11,22 +11,127 @@ import json
 import argparse
 import subprocess
 import signal
+import importlib.util
+import threading
+import time
+import tempfile
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
 
+from workflow_progress import parse_progress_line, set_progress_callback, reset_progress_callback
+from resource_limits import set_workflow_priority
+from artifact_cache import is_step_cached, changed_outputs, invalidate_step, record_step_manifest, expand_paths
+from workflow_metrics import (METRICS_FILE_ENV, WorkflowMetrics, read_operations_file, wait_with_rusage,
+                              thread_usage, set_operation_recorder, reset_operation_recorder)
+from workflow_cancel import (CancelToken, WorkflowCancelled, CANCEL_GRACE_SECONDS, new_session_kwargs,
+                             set_cancel_token, current_cancel_token)
+from workflow_events import (atomic_write_json, publish_event, register_workflow,
+                             start_event_server, stop_event_server)
+from llm_cache import LLM_CACHE_DIR_ENV
+from whisper_service import WHISPER_SERVICE_URL_ENV
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+# Each workflow gets its own scratch directory under here (see create_workflow_dir)
+DEFAULT_WORK_ROOT = SCRIPT_DIR / "workflows"
+
+# Number of trailing output lines kept for the error message of a failed step
+ERROR_TAIL_LINES = 50
+
+CONFIG_DIR = "DONT_DELETE_ENV_FILES/config"
+
+# Workflow steps as a dependency graph: a step starts as soon as every step
+# whose artifacts it consumes has completed.
+# "params", "inputs" (artifacts relative to the output folder), "config" and
+# "outputs" declare what a step reads and writes, for the artifact cache.
+# "progress_phases" lists the step's progress units in the order they run, with
+# their share of the step's time, so percent-complete only moves forward.
+# "edit_rerun" lets a user edit some of a step's outputs ("edited") by hand:
+# when only those (and outputs the rerun rewrites) changed since the step's
+# last run, the step runs with "args" (in-process: its "entry" function)
+# instead of from scratch. E.g. edit essay.json and run the workflow again:
+# step 1 only narrates the edited essay (unchanged paragraphs come from the
+# TTS cache) and the steps after it re-run on the new narration.
+WORKFLOW_STEPS = {
+    # Essay, visual metadata, narration_short.mp3 and timestamps
+    1: {
+        "script": "00_STEP1_Nasean_Create_Essay_WebParams_V8.py", "use_date": False, "depends_on": [],
+        "params": ["topic", "slug", "prompt", "emotionStyle", "ttsVoice"],
+        "inputs": [],
+        "config": (f"{CONFIG_DIR}/00_STEP1_Nasean_Create_Essay_11_createMP3and_TimeStamp_short.txt",
+                   ["VOICE", "TTS_MODEL", "WHISPER_MODEL", "MAX_TTS_CHARS", "AUDIO_FILE", "TIMESTAMP_FILE",
+                    "STREAM_ESSAY", "STRUCTURED_ESSAY", "STRUCTURED_ESSAY_MODEL", "TIMESTAMP_MODE",
+                    "MIN_SEGMENT_DURATION_SECONDS"]),
+        "outputs": ["essay_short.docx", "essay.json", "essay_metadata.txt", "narration_short.mp3",
+                    "narration_timestamps_short.txt", "narration_chunks.json", "youtubetitle.txt", "youtubedescription.txt",
+                    "quiz_data.json"],
+        "edit_rerun": {"edited": ["essay.json"],
+                       "rewrites": ["essay_short.docx", "narration_short.mp3", "narration_timestamps_short.txt",
+                                    "narration_chunks.json"],
+                       "args": ["--renarrate"], "entry": "run_renarrate"},
+    },
+    # Needs the timestamps and essay metadata from step 1
+    2: {
+        "script": "12_STEP2_Nasean_Generate_Image_WebParams_V8.py", "use_date": False, "depends_on": [1],
+        "params": ["slug"],
+        "inputs": ["narration_timestamps_short.txt", "essay_metadata.txt"],
+        "config": (f"{CONFIG_DIR}/12_STEP2_Nasean_Generate_Image_from_prompts_short_V7.txt",
+                   ["size", "style", "mode", "guidance", "negative_guidance", "append", "style_tags", "system_msg",
+                    "PROMPT_BATCH"]),
+        "outputs": ["images/*.png", "images/*.txt", "generated_prompts_short.txt", "{slug}.png"],
+    },
+    # Only needs narration_short.mp3, so it overlaps the DALL-E phase of step 2
+    3: {
+        "script": "13_STEP3_Nasean_Create_NarrationMP4_WebParams_V9.py", "use_date": False, "depends_on": [1],
+        "params": ["slug", "videoFormat"],
+        "inputs": ["narration_short.mp3", "../../background.jpg", "../../backgroundv.jpg"],
+        "config": (f"{CONFIG_DIR}/13_STEP3_Nasean_Create_Nasean_NarrationMP4_vertical.txt",
+                   ["FRAME_RATE", "VIDEO_CODEC", "PIX_FMT"]),
+        "outputs": ["narration*.mp4"],
+    },
+    # Joins on the images from step 2 and the narration video from step 3
+    4: {
+        "script": "14_STEP4_Nasean_YOUTUBE_FFMPEG_Create_Final_Video_WebParams_V9.py", "use_date": False, "depends_on": [2, 3],
+        "params": ["slug", "topic", "videoFormat"],
+        "inputs": ["images/*.png", "narration_timestamps_short.txt", "narration*.mp4",
+                   "../../background.jpg", "../../backgroundv.jpg"],
+        "config": (f"{CONFIG_DIR}/14_STEP4_Nasean_YOUTUBE_FFMPEG_Create_Final_Video_UPLOADER_verticle_v6.txt",
+                   ["FRAME_RATE", "VIDEO_CODEC", "PIX_FMT"]),
+        "outputs": ["final_videov.mp4"],
+        "progress_phases": [("overlay", 0.3), ("segment", 0.7)],
+    },
+    # YouTube upload is optional - skip for web workflow
+    # 5: {"script": "15_STEP5_Nasean_youtube_UPLOADER_v1.py", "use_date": True, "depends_on": [4]},
+}
+
 # Global flag for graceful shutdown
 CANCEL_REQUESTED = False
 
+# Cancel tokens of the workflows running in this process
+_active_cancel_tokens = set()
+
+# Running steps that have not stopped this long after a cancel are abandoned;
+# by then step process groups have been killed (see workflow_cancel.py).
+# In-process steps cannot be killed: cancellation is cooperative there. An
+# abandoned one runs on, on a daemon thread that does not hold up interpreter
+# exit; worker pools inside the step stop at their next cancellation point
+# (API call, resource slot or ffmpeg run).
+CANCEL_ABANDON_SECONDS = CANCEL_GRACE_SECONDS + 2
+
+
 def signal_handler(signum, frame):
-    """Handle SIGTERM/SIGINT for graceful shutdown"""
+    """
+    Handle SIGTERM/SIGINT: cancel the running workflow, which stops its steps
+    and exits with the status "cancelled". A second signal exits right away.
+    """
     global CANCEL_REQUESTED
+    if CANCEL_REQUESTED or not _active_cancel_tokens:
+        sys.exit(1)
     print("\n[CANCEL] Workflow cancellation requested")
     CANCEL_REQUESTED = True
-    sys.exit(1)
-
-# Register signal handlers
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
+    for token in list(_active_cancel_tokens):
+        token.cancel()
 
 # Load environment variables from .env file
 try:
@@ -38,79 +143,475 @@ except ImportError:
 except Exception as e:
     print(f"[WARN] Could not load .env file: {e}")
 
-def update_status(status_file, step, total_steps=4, status="running", error=None):
-    """Update the status file for real-time progress tracking"""
-    try:
-        status_data = {
-            "currentStep": step,
-            "totalSteps": total_steps,
-            "status": status,
-            "updatedAt": datetime.now().isoformat()
-        }
-        if error:
-            status_data["error"] = error
+# Step states per workflow, keyed by status file. Steps run concurrently, so
+# every status write goes through _status_lock.
+_status_lock = threading.Lock()
+_workflow_steps_state = {}
+
+
+def _get_steps_state(status_file):
+    return _workflow_steps_state.setdefault(status_file, {"running": set(), "completed": set(), "progress": {}})
 
-        with open(status_file, 'w') as f:
-            json.dump(status_data, f, indent=2)
-        print(f"[OK] Status updated: Step {step}/{total_steps}")
+
+def set_step_state(status_file, step, state):
+    """Record a step as "running", "completed", "failed" or "cancelled" for the status file"""
+    with _status_lock:
+        steps_state = _get_steps_state(status_file)
+        steps_state["running"].discard(step)
+        steps_state["progress"].pop(step, None)
+        if state == "running":
+            steps_state["running"].add(step)
+        elif state == "completed":
+            steps_state["completed"].add(step)
+
+
+def update_status(status_file, step, total_steps=4, status="running", error=None, progress=None):
+    """
+    Update the status file for real-time progress tracking
+    The file is replaced atomically, and the same snapshot is appended to the
+    workflow's event log for subscribers (see workflow_events.py)
+    """
+    try:
+        with _status_lock:
+            steps_state = _get_steps_state(status_file)
+            if progress and step in steps_state["running"]:
+                steps_state["progress"][step] = progress
+
+            status_data = {
+                "currentStep": step,
+                "totalSteps": total_steps,
+                "status": status,
+                "updatedAt": datetime.now().isoformat()
+            }
+            if error:
+                status_data["error"] = error
+
+            if steps_state["running"] or steps_state["completed"]:
+                status_data["runningSteps"] = sorted(steps_state["running"])
+                status_data["completedSteps"] = sorted(steps_state["completed"])
+
+                # Completed steps count fully, running steps by their reported fraction
+                done = len(steps_state["completed"]) + sum(
+                    p["fraction"] for p in steps_state["progress"].values()
+                )
+                status_data["percentComplete"] = 100.0 if status == "completed" else round(done / total_steps * 100, 1)
+
+                if steps_state["progress"]:
+                    status_data["stepProgress"] = {
+                        str(n): {k: v for k, v in p.items() if k != "fraction"}
+                        for n, p in sorted(steps_state["progress"].items())
+                    }
+                    # Concurrent steps finish together, so the slowest one is the ETA
+                    etas = [p["etaSeconds"] for p in steps_state["progress"].values() if p["etaSeconds"] is not None]
+                    status_data["etaSeconds"] = max(etas) if etas else None
+
+            atomic_write_json(status_file, status_data)
+            publish_event(status_file, "progress" if progress else "status", status_data)
+        # Sub-step progress events are frequent, only log step changes
+        if not progress:
+            print(f"[OK] Status updated: Step {step}/{total_steps}")
     except Exception as e:
         print(f"[WARN] Failed to update status: {e}")
 
 
-def run_step(step_number, script_name, status_file, params_file, use_date_file=True):
-    """Run a single workflow step"""
+def make_progress_reporter(status_file, step_number, total_steps=4):
+    """
+    Build a callback(current, total, unit) that records the step's sub-step
+    progress and ETA, from which update_status derives overall percent-complete.
+    The units of a step with "progress_phases" are weighted into one 0-1
+    fraction for the whole step, which never goes backwards.
+    """
+    step_started = time.monotonic()
+    phases = WORKFLOW_STEPS.get(step_number, {}).get("progress_phases", [])
+    phase_spans = {}
+    offset = 0.0
+    for unit, weight in phases:
+        phase_spans[unit] = (offset, weight)
+        offset += weight
+    reported = {"fraction": 0.0}
+
+    def report(current, total, unit):
+        now = time.monotonic()
+        unit_fraction = min(current / total, 1.0) if total else 1.0
+        phase_offset, phase_weight = phase_spans.get(unit, (0.0, 1.0))
+        fraction = max(reported["fraction"], phase_offset + phase_weight * unit_fraction)
+        reported["fraction"] = fraction
+
+        eta_seconds = None
+        if 0 < fraction < 1:
+            elapsed = now - step_started
+            eta_seconds = round(elapsed / fraction * (1 - fraction), 1)
+
+        update_status(status_file, step_number, total_steps, status="running", progress={
+            "current": current,
+            "total": total,
+            "unit": unit,
+            "fraction": fraction,
+            "etaSeconds": eta_seconds
+        })
+
+    return report
+
+
+def run_step(step_number, script_name, status_file, params_file, use_date_file=True, work_dir=None,
+             metrics=None, extra_args=()):
+    """
+    Run a single workflow step, inside the workflow's scratch directory if given
+    Returns the CPU and memory usage of the step process (and its ffmpeg children)
+    The step gets its own process group, so cancelling the workflow stops the
+    step and any ffmpeg it started
+    """
     print(f"\n{'='*60}")
     print(f"STEP {step_number}: {script_name}")
     print(f"{'='*60}\n")
 
     update_status(status_file, step_number, status="running")
 
-    cmd = ["python", script_name]
+    # Absolute script path, since the step runs with the workflow's scratch directory as cwd
+    cmd = ["python", str(SCRIPT_DIR / script_name)]
     if use_date_file:
         cmd.append("--use-date-file")
+    cmd.extend(extra_args)
 
     # Set environment variable so step script knows which params file to use
     env = os.environ.copy()
     env['WORKFLOW_PARAMS_FILE'] = params_file
+    # Unbuffered child output so lines arrive as they are printed
+    env['PYTHONUNBUFFERED'] = '1'
+    # The step appends its timed operations here (see workflow_metrics.py)
+    operations_file = Path(work_dir or tempfile.gettempdir()) / f"step{step_number}_operations.jsonl"
+    if operations_file.exists():
+        operations_file.unlink()
+    env[METRICS_FILE_ENV] = str(operations_file)
+
+    report_progress = make_progress_reporter(status_file, step_number)
+    # Only the tail is kept for the error message, the rest is forwarded live
+    output_tail = deque(maxlen=ERROR_TAIL_LINES)
+
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1,
+        cwd=work_dir,
+        env=env,  # Pass environment with unique params file
+        **new_session_kwargs()
+    )
+    cancel_token = current_cancel_token()
+    if cancel_token is not None:
+        cancel_token.register_process(process, group=True)
+    for line in process.stdout:
+        # Prefix forwarded lines so output of concurrent steps stays readable
+        print(f"[STEP{step_number}] {line}", end='', flush=True)
+        output_tail.append(line)
+        progress = parse_progress_line(line)
+        if progress:
+            report_progress(*progress)
+    usage = wait_with_rusage(process)
+    returncode = process.returncode
+    if cancel_token is not None:
+        cancel_token.unregister_process(process)
+        cancel_token.raise_if_cancelled()
+
+    if metrics is not None:
+        for record in read_operations_file(operations_file):
+            metrics.add_operation(step_number, record)
+
+    if returncode != 0:
+        error_msg = f"Step {step_number} failed: {''.join(output_tail).strip() or f'exit code {returncode}'}"
+        print(f"[FAIL] Step {step_number} failed with exit code {returncode}")
+        update_status(status_file, step_number, status="error", error=error_msg)
+        raise Exception(error_msg)
+
+    print(f"[OK] Step {step_number} completed successfully\n")
+    return usage
+
+
+# Step modules and OpenAI client shared across in-process step runs
+_step_modules = {}
+_step_modules_lock = threading.Lock()
+_shared_openai_client = None
+
+
+def load_step_module(script_name):
+    """
+    Import a step script once and cache it
+    Later runs reuse the module's imports (openai, ffmpeg, whisper/torch) and config
+    """
+    with _step_modules_lock:
+        return _load_step_module_locked(script_name)
+
+
+def _load_step_module_locked(script_name):
+    if script_name not in _step_modules:
+        script_path = Path(__file__).resolve().parent / script_name
+        # Script names start with digits, so give the module an importable name
+        module_name = "step_" + script_path.stem
+        spec = importlib.util.spec_from_file_location(module_name, script_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _step_modules[script_name] = module
+        print(f"[OK] Loaded step module: {script_name}")
+    return _step_modules[script_name]
+
+
+def get_shared_openai_client():
+    """Create the OpenAI client once for all in-process steps"""
+    global _shared_openai_client
+    with _step_modules_lock:
+        if _shared_openai_client is None:
+            from openai import OpenAI
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise Exception("OPENAI_API_KEY not set")
+            # Retries and backoff are left to rate_limiter
+            _shared_openai_client = OpenAI(api_key=api_key, max_retries=0)
+    return _shared_openai_client
+
+
+def run_step_in_process(step_number, script_name, status_file, params_file, metrics=None, entry="run"):
+    """
+    Run a single workflow step by calling its run() (or another entry) function in this process
+    Returns the CPU time of the step thread and the process's peak memory
+    """
+    print(f"\n{'='*60}")
+    print(f"STEP {step_number}: {script_name} (in-process)")
+    print(f"{'='*60}\n")
 
+    update_status(status_file, step_number, status="running")
+
+    progress_token = set_progress_callback(make_progress_reporter(status_file, step_number))
+    recorder_token = set_operation_recorder(
+        (lambda record: metrics.add_operation(step_number, record)) if metrics is not None else None
+    )
+    usage_before = thread_usage()
     try:
-        result = subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            env=env  # Pass environment with unique params file
-        )
-        print(result.stdout)
-        if result.stderr:
-            print(f"Warnings: {result.stderr}")
-        print(f"[OK] Step {step_number} completed successfully\n")
-        return True
-    except subprocess.CalledProcessError as e:
-        error_msg = f"Step {step_number} failed: {e.stderr or e.stdout or str(e)}"
+        module = load_step_module(script_name)
+        getattr(module, entry)(params_file, shared_client=get_shared_openai_client())
+    except SystemExit as e:
+        # Step scripts report failure with sys.exit(), exactly as in subprocess mode
+        if e.code not in (None, 0):
+            error_msg = f"Step {step_number} failed: exited with code {e.code}"
+            print(f"[FAIL] {error_msg}")
+            update_status(status_file, step_number, status="error", error=error_msg)
+            raise Exception(error_msg)
+    except Exception as e:
+        error_msg = f"Step {step_number} failed: {e}"
         print(f"[FAIL] {error_msg}")
         update_status(status_file, step_number, status="error", error=error_msg)
         raise Exception(error_msg)
+    finally:
+        reset_operation_recorder(recorder_token)
+        reset_progress_callback(progress_token)
+
+    usage = thread_usage()
+    usage["cpuSeconds"] = round(usage["cpuSeconds"] - usage_before["cpuSeconds"], 3)
+    print(f"[OK] Step {step_number} completed successfully\n")
+    return usage
+
+
+def submit_step_thread(fn, n, *args):
+    """
+    Run fn(n, *args) on a new daemon thread and return its Future. Unlike pool
+    threads, daemon threads are not joined at interpreter exit, so an
+    abandoned in-process step cannot hold up the exit after a cancel.
+    """
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(n, *args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
 
+    threading.Thread(target=target, name=f"step-{n}", daemon=True).start()
+    return future
 
-def create_workflow_params_file(params, workflow_id):
+
+def edited_step_rerun(n, step, params, output_folder):
+    """
+    The step's "edit_rerun" entry if its inputs are unchanged and only its
+    user-editable outputs (and ones the rerun rewrites) changed, else None
+    """
+    rerun = step.get("edit_rerun")
+    if rerun is None:
+        return None
+    changed = changed_outputs(n, step, params, output_folder, SCRIPT_DIR)
+    if not changed or not set(changed) & set(rerun["edited"]) \
+            or not set(changed) <= set(rerun["edited"]) | set(rerun["rewrites"]):
+        return None
+    return rerun
+
+
+def run_step_graph(status_file, params_file, start_step=1, in_process=False, priority=0,
+                   params=None, output_folder=None, work_dir=None, use_cache=True, metrics=None,
+                   cancel_token=None):
     """
-    Create a workflow-specific parameters file
+    Run WORKFLOW_STEPS as a dependency graph
+    Every step whose dependencies are complete is started right away, so
+    independent steps (2 and 3) run concurrently.
+    With params and output_folder given, steps whose input fingerprint matches
+    a previous run with intact outputs are skipped (see artifact_cache.py).
+    With metrics given, each step's timings and resource usage are collected
+    (and saved to metrics.json after each step, if output_folder is given).
+    Cancelling cancel_token stops the running steps; steps that have not
+    stopped after CANCEL_ABANDON_SECONDS are left behind so the caller is freed.
+    """
+    use_cache = use_cache and params is not None and output_folder is not None
+    cancel_token = cancel_token or CancelToken()
+
+    completed = {n for n in WORKFLOW_STEPS if n < start_step}
+    for n in sorted(completed):
+        print(f"[SKIP] Step {n} already completed")
+        set_step_state(status_file, n, "completed")
+
+    pending = set(WORKFLOW_STEPS) - completed
+    running = {}
+    failure = None
+
+    def run_one(n, rerun=None):
+        step = WORKFLOW_STEPS[n]
+        # Resource slots taken by in-process steps are granted by workflow priority
+        set_workflow_priority(priority)
+        set_cancel_token(cancel_token)
+        if use_cache:
+            invalidate_step(output_folder, n)
+        if metrics is not None:
+            metrics.step_started(n)
+        try:
+            if in_process:
+                usage = run_step_in_process(n, step["script"], status_file, params_file, metrics,
+                                            rerun["entry"] if rerun else "run")
+            else:
+                usage = run_step(n, step["script"], status_file, params_file, step["use_date"], work_dir, metrics,
+                                 rerun["args"] if rerun else ())
+        except WorkflowCancelled:
+            if metrics is not None:
+                metrics.step_finished(n, "cancelled")
+            raise
+        except Exception:
+            if metrics is not None:
+                metrics.step_finished(n, "failed")
+            raise
+        if metrics is not None:
+            metrics.step_finished(n, "completed", usage, step_bytes_written(step, params, output_folder))
+            if output_folder is not None:
+                metrics.save(output_folder)
+        if use_cache:
+            record_step_manifest(n, step, params, output_folder, SCRIPT_DIR)
+
+    cancelled_at = None
+    while pending or running:
+        if cancel_token.cancelled and cancelled_at is None:
+            cancelled_at = time.monotonic()
+            if running:
+                print(f"[CANCEL] Stopping steps {sorted(running.values())}")
+        if cancelled_at is not None and running and time.monotonic() - cancelled_at > CANCEL_ABANDON_SECONDS:
+            print(f"[CANCEL] Steps {sorted(running.values())} did not stop in time, leaving them behind")
+            for n in running.values():
+                set_step_state(status_file, n, "cancelled")
+            break
+
+        # Stop scheduling new steps after a failure or cancellation,
+        # but let the running ones finish
+        if failure is None and not cancel_token.cancelled:
+            ready = [n for n in sorted(pending) if set(WORKFLOW_STEPS[n]["depends_on"]) <= completed]
+            for n in ready:
+                pending.discard(n)
+                if use_cache and is_step_cached(n, WORKFLOW_STEPS[n], params, output_folder, SCRIPT_DIR):
+                    print(f"[CACHED] Step {n} inputs unchanged since last run, skipping")
+                    if metrics is not None:
+                        metrics.step_cached(n)
+                    completed.add(n)
+                    set_step_state(status_file, n, "completed")
+                    continue
+                rerun = edited_step_rerun(n, WORKFLOW_STEPS[n], params, output_folder) if use_cache else None
+                if rerun:
+                    print(f"[CACHED] Step {n}: only {', '.join(rerun['edited'])} edited, "
+                          f"re-running with {' '.join(rerun['args'])}")
+                set_step_state(status_file, n, "running")
+                running[submit_step_thread(run_one, n, rerun)] = n
+
+        if not running:
+            # Cached steps may have made further steps ready
+            if failure is None and not cancel_token.cancelled and any(
+                    set(WORKFLOW_STEPS[n]["depends_on"]) <= completed for n in pending):
+                continue
+            break
+
+        # Time out regularly to notice a cancel while steps are running
+        done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+        for future in done:
+            n = running.pop(future)
+            try:
+                future.result()
+                completed.add(n)
+                set_step_state(status_file, n, "completed")
+            except WorkflowCancelled:
+                set_step_state(status_file, n, "cancelled")
+            except Exception as e:
+                set_step_state(status_file, n, "failed")
+                if failure is None:
+                    failure = e
+
+    if cancel_token.cancelled:
+        next_step = min(pending) if pending else max(WORKFLOW_STEPS)
+        print(f"[CANCEL] Workflow cancelled before step {next_step}")
+        update_status(status_file, next_step, status="cancelled", error="Cancelled by user")
+        sys.exit(1)
+
+    if failure is not None:
+        raise failure
+
+    if pending:
+        raise Exception(f"Steps {sorted(pending)} could not run: dependencies not completed")
+
+
+def step_bytes_written(step, params, output_folder):
+    """Total size of the artifacts a step declares as outputs"""
+    if params is None or output_folder is None:
+        return None
+    return sum(
+        os.path.getsize(path)
+        for path in expand_paths(step.get("outputs", []), output_folder, params).values()
+        if path and os.path.isfile(path)
+    )
+
+
+def create_workflow_dir(workflow_id, work_root=None):
+    """
+    Create the workflow's private scratch directory
+    Step subprocesses run with it as cwd, so files the scripts write relative
+    to the working directory never collide between concurrent workflows
+    """
+    work_dir = Path(work_root or DEFAULT_WORK_ROOT).resolve() / workflow_id
+    work_dir.mkdir(parents=True, exist_ok=True)
+    print(f"[OK] Workflow directory: {work_dir}")
+    return work_dir
+
+
+def create_workflow_params_file(params, work_dir):
+    """
+    Create a workflow-specific parameters file in the workflow directory
     This ensures concurrent workflows don't interfere with each other
     """
-    # Use workflow ID in filename to avoid conflicts between concurrent workflows
-    params_file = f"workflow_params_{workflow_id}.json"
+    params_file = str(Path(work_dir) / "workflow_params.json")
     with open(params_file, 'w') as f:
         json.dump(params, f, indent=2)
     print(f"[OK] Parameters saved to {params_file}")
     return params_file
 
 
-def save_selected_date(date_str):
-    """Save the lesson date to selected_date.txt for workflow scripts"""
-    with open("selected_date.txt", 'w') as f:
+def save_selected_date(date_str, work_dir):
+    """Save the lesson date to selected_date.txt for --use-date-file scripts"""
+    with open(Path(work_dir) / "selected_date.txt", 'w') as f:
         f.write(date_str)
     print(f"[OK] Selected date saved: {date_str}")
 
@@ -169,122 +670,151 @@ def extract_quiz_data(output_folder):
     return quiz_data
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Workflow Orchestrator')
-    parser.add_argument('--params', required=True, help='Path to JSON parameters file')
-    parser.add_argument('--status-file', required=True, help='Path to status JSON file')
-    parser.add_argument('--workflow-id', required=True, help='Workflow ID')
-    parser.add_argument('--start-step', type=int, default=1, help='Step to start from (1-4)')
-
-    args = parser.parse_args()
-
+def run_workflow(params_path, status_file, workflow_id, start_step=1, in_process=False, priority=0,
+                 use_cache=True, work_root=None, prometheus_dir=None, cancel_token=None):
+    """
+    Run the complete workflow and save the output JSON for the Node.js backend
+    Raises on failure and exits with SystemExit(1) when cancel_token is
+    cancelled (or SIGTERM arrives); used by main() and by workflow_queue
+    """
     print(f"""
 ================================================================
          WORKFLOW ORCHESTRATOR - Content Creation Pipeline
-                    Workflow ID: {args.workflow_id[:16]}...
+                    Workflow ID: {workflow_id[:16]}...
 ================================================================
 """)
 
+    # Load parameters
+    with open(params_path, 'r') as f:
+        params = json.load(f)
+
+    print("Parameters loaded:")
+    print(f"  Topic: {params['topic']}")
+    print(f"  Slug: {params['slug']}")
+    print(f"  Date: {params['lessonDate']}")
+    print(f"  Reading Length: {params['readingLength']}s")
+    print()
+
+    # Create the workflow's own directory and parameters file for Python scripts
+    # All paths are passed explicitly so concurrent workflows don't conflict
+    work_dir = create_workflow_dir(workflow_id, work_root)
+    params_filename = create_workflow_params_file(params, work_dir)
+    save_selected_date(params['lessonDate'], work_dir)
+
+    # Determine output folder path
+    # This should match the folder structure created by STEP 1
+    # Use path relative to this script's location
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    root_folder = os.getenv("COURSE_COLLECTIVE_ROOT") or os.path.join(script_dir, "Course_Collective")
+    # Use slug as folder name (e.g., WED26-2026-01-15-23-37-49)
+    folder_name = params['slug']
+    output_folder = os.path.join(root_folder, folder_name, "output")
+
+    # Start from specified step (default is 1)
+    if start_step > 1:
+        print(f"\n[RESUME] Starting from step {start_step}")
+
+    # Run workflow steps as a dependency graph (see WORKFLOW_STEPS)
+    if not use_cache:
+        print("[INFO] Artifact cache disabled, all steps will run")
+    # Timings and resource usage end up in <output folder>/metrics.json
+    metrics = WorkflowMetrics(workflow_id)
+    cancel_token = cancel_token or CancelToken()
+    _active_cancel_tokens.add(cancel_token)
     try:
-        # Load parameters
-        with open(args.params, 'r') as f:
-            params = json.load(f)
-
-        print("Parameters loaded:")
-        print(f"  Topic: {params['topic']}")
-        print(f"  Slug: {params['slug']}")
-        print(f"  Date: {params['lessonDate']}")
-        print(f"  Reading Length: {params['readingLength']}s")
-        print()
-
-        # Create workflow parameters file for Python scripts
-        # Use workflow ID to ensure concurrent workflows don't conflict
-        params_filename = create_workflow_params_file(params, args.workflow_id)
-
-        # Determine output folder path
-        # This should match the folder structure created by STEP 1
-        # Use path relative to this script's location
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        root_folder = os.path.join(script_dir, "Course_Collective")
-        # Use slug as folder name (e.g., WED26-2026-01-15-23-37-49)
-        folder_name = params['slug']
-        output_folder = os.path.join(root_folder, folder_name, "output")
-
-        # Run workflow steps
-        steps = [
-            ("00_STEP1_Nasean_Create_Essay_WebParams_V8.py", False),  # Uses workflow_params.json
-            ("12_STEP2_Nasean_Generate_Image_WebParams_V8.py", False),  # Web version - no Google Sheets
-            ("13_STEP3_Nasean_Create_NarrationMP4_WebParams_V9.py", False),  # Web version - no Google Sheets
-            ("14_STEP4_Nasean_YOUTUBE_FFMPEG_Create_Final_Video_WebParams_V9.py", False),  # Web version - no Google Sheets
-            # YouTube upload is optional - skip for web workflow
-            # ("15_STEP5_Nasean_youtube_UPLOADER_v1.py", True),
-        ]
-
-        # Start from specified step (default is 1)
-        start_step = args.start_step
-        if start_step > 1:
-            print(f"\n[RESUME] Starting from step {start_step}")
-
-        for idx, (script, use_date) in enumerate(steps, start=1):
-            # Skip steps before start_step
-            if idx < start_step:
-                print(f"[SKIP] Step {idx} already completed")
-                continue
+        run_step_graph(status_file, params_filename, start_step, in_process, priority,
+                       params=params, output_folder=output_folder, work_dir=work_dir,
+                       use_cache=use_cache, metrics=metrics, cancel_token=cancel_token)
+        metrics.finish("completed")
+    except BaseException:
+        metrics.finish("cancelled" if cancel_token.cancelled else "failed")
+        raise
+    finally:
+        _active_cancel_tokens.discard(cancel_token)
+        metrics.save(output_folder, prometheus_dir)
+        print(f"[OK] Metrics saved to {os.path.join(output_folder, 'metrics.json')}")
+
+    # Extract output data
+    print(f"\n{'='*60}")
+    print("Extracting output data...")
+    print(f"{'='*60}\n")
 
-            # Check for cancellation before starting each step
-            if CANCEL_REQUESTED:
-                print(f"[CANCEL] Workflow cancelled before step {idx}")
-                update_status(args.status_file, idx, status="cancelled", error="Cancelled by user")
-                sys.exit(1)
-
-            run_step(idx, script, args.status_file, params_filename, use_date)
-
-            # Check for cancellation after each step
-            if CANCEL_REQUESTED:
-                print(f"[CANCEL] Workflow cancelled after step {idx}")
-                update_status(args.status_file, idx, status="cancelled", error="Cancelled by user")
-                sys.exit(1)
-
-        # Extract output data
-        print(f"\n{'='*60}")
-        print("Extracting output data...")
-        print(f"{'='*60}\n")
-
-        youtube_url = extract_youtube_url(output_folder)
-        article_text = extract_article_text(output_folder)
-        quiz_data = extract_quiz_data(output_folder)
-
-        # Save output for Node.js backend
-        output_data = {
-            "success": True,
-            "workflowId": args.workflow_id,
-            "youtubeUrl": youtube_url or "https://youtube.com/placeholder",
-            "articleText": article_text or "Article text could not be extracted",
-            "thumbnailUrl": f"/images/{params['slug']}.png",  # Thumbnail created by Step 2
-            "quizData": quiz_data,  # Include quiz data for smartikle
-            "metadata": {
-                "topic": params['topic'],
-                "slug": params['slug'],
-                "outputFolder": output_folder
-            }
+    youtube_url = extract_youtube_url(output_folder)
+    article_text = extract_article_text(output_folder)
+    quiz_data = extract_quiz_data(output_folder)
+
+    # Save output for Node.js backend
+    output_data = {
+        "success": True,
+        "workflowId": workflow_id,
+        "youtubeUrl": youtube_url or "https://youtube.com/placeholder",
+        "articleText": article_text or "Article text could not be extracted",
+        "thumbnailUrl": f"/images/{params['slug']}.png",  # Thumbnail created by Step 2
+        "quizData": quiz_data,  # Include quiz data for smartikle
+        "metadata": {
+            "topic": params['topic'],
+            "slug": params['slug'],
+            "outputFolder": output_folder
         }
+    }
 
-        output_file = args.params.replace('_params.json', '_output.json')
-        with open(output_file, 'w') as f:
-            json.dump(output_data, f, indent=2)
+    output_file = params_path.replace('_params.json', '_output.json')
+    with open(output_file, 'w') as f:
+        json.dump(output_data, f, indent=2)
 
-        print(f"[OK] Output saved to {output_file}")
-        print(f"[OK] YouTube URL: {youtube_url}")
+    print(f"[OK] Output saved to {output_file}")
+    print(f"[OK] YouTube URL: {youtube_url}")
 
-        # Mark as completed
-        update_status(args.status_file, 4, status="completed")
+    # Mark as completed
+    update_status(status_file, 4, status="completed")
 
-        print(f"""
+    print(f"""
 ================================================================
                   WORKFLOW COMPLETED SUCCESSFULLY
 ================================================================
 """)
+    return output_data
+
 
+def main():
+    parser = argparse.ArgumentParser(description='Workflow Orchestrator')
+    parser.add_argument('--params', required=True, help='Path to JSON parameters file')
+    parser.add_argument('--status-file', required=True, help='Path to status JSON file')
+    parser.add_argument('--workflow-id', required=True, help='Workflow ID')
+    parser.add_argument('--start-step', type=int, default=1, help='Step to start from (1-4)')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run steps inside this process with a shared OpenAI client instead of one interpreter per step')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Run every step even if its inputs are unchanged since the last run')
+    parser.add_argument('--work-dir', default=str(DEFAULT_WORK_ROOT),
+                        help='Root for per-workflow scratch directories')
+    parser.add_argument('--prometheus-dir', default=None,
+                        help='Also write metrics as a Prometheus textfile into this directory')
+    parser.add_argument('--events-port', type=int, default=None,
+                        help='Serve progress as server-sent events on this local port')
+    parser.add_argument('--events-host', default='127.0.0.1', help='Interface for the events endpoint')
+    parser.add_argument('--llm-cache', default=None, metavar='DIR',
+                        help='Answer repeated GPT requests from a response cache in this directory')
+    parser.add_argument('--whisper-service', default=None, metavar='URL',
+                        help='Transcribe through the Whisper service at this URL (see whisper_service.py)')
+
+    args = parser.parse_args()
+    if args.llm_cache:
+        # Environment, so step subprocesses use the cache too
+        os.environ[LLM_CACHE_DIR_ENV] = args.llm_cache
+    if args.whisper_service:
+        os.environ[WHISPER_SERVICE_URL_ENV] = args.whisper_service
+
+    # Register signal handlers
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    register_workflow(args.workflow_id, args.status_file)
+    events_server = start_event_server(args.events_host, args.events_port) if args.events_port else None
+
+    try:
+        run_workflow(args.params, args.status_file, args.workflow_id, args.start_step, args.in_process,
+                     use_cache=not args.no_cache, work_root=args.work_dir, prometheus_dir=args.prometheus_dir)
     except Exception as e:
         print(f"""
 ================================================================
@@ -294,6 +824,9 @@ def main():
 """)
         update_status(args.status_file, 0, status="error", error=str(e))
         sys.exit(1)
+    finally:
+        if events_server:
+            stop_event_server(events_server)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Workflow Progress - Structured sub-step progress events
+Step scripts call report_progress() for each unit of work (image, segment, ...).
+Run as a subprocess, the event is printed as a [PROGRESS] line that
+workflow_orchestrator parses from the live output; run in-process, it goes
+straight to the callback the orchestrator installed.
+"""
+
+import re
+import contextvars
+
+PROGRESS_PREFIX = "[PROGRESS]"
+PROGRESS_PATTERN = re.compile(r"^\[PROGRESS\]\s+(\d+)/(\d+)\s+(\w+)")
+
+# Callback installed by the orchestrator for in-process runs
+_progress_callback = contextvars.ContextVar("progress_callback", default=None)
+
+
+def set_progress_callback(callback):
+    """Route progress events to callback(current, total, unit); returns a reset token"""
+    return _progress_callback.set(callback)
+
+
+def reset_progress_callback(token):
+    """Restore the callback that was active before set_progress_callback()"""
+    _progress_callback.reset(token)
+
+
+def report_progress(current, total, unit):
+    """Report that `current` of `total` units (e.g. 7/23 images) are done"""
+    callback = _progress_callback.get()
+    if callback is not None:
+        callback(current, total, unit)
+    else:
+        print(f"{PROGRESS_PREFIX} {current}/{total} {unit}", flush=True)
+
+
+def parse_progress_line(line):
+    """Parse a [PROGRESS] output line into (current, total, unit), or None"""
+    match = PROGRESS_PATTERN.match(line.strip())
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)), match.group(3)
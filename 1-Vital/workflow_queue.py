@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Workflow Queue - Admits smartikle workflows and schedules them on one host
+Instead of starting one workflow_orchestrator.py per submission, the Node.js
+backend drops a job into the spool directory and this long-lived service runs
+the workflows in-process, with separate limits for concurrent OpenAI calls,
+ffmpeg encodes and whisper transcriptions (see resource_limits.py).
+Higher-priority workflows are admitted first and win contended resource slots.
+A queued or running workflow is cancelled by dropping a marker into cancel/;
+running ones stop their steps and free their slot right away.
+
+Usage:
+  python workflow_queue.py serve --max-workflows 4 --openai-limit 8 --ffmpeg-limit 2 --whisper-limit 1
+  python workflow_queue.py submit --params workflow_X_params.json --status-file X_status.json --workflow-id X --priority 5
+  python workflow_queue.py cancel --workflow-id X
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+from workflow_orchestrator import run_workflow, update_status
+from resource_limits import configure_limits, get_limits_snapshot
+from workflow_cancel import CancelToken
+from workflow_events import register_workflow, start_event_server
+from llm_cache import LLM_CACHE_DIR_ENV
+from whisper_service import WHISPER_SERVICE_URL_ENV
+
+DEFAULT_SPOOL_DIR = Path(__file__).resolve().parent / "workflow_queue"
+SPOOL_SUBDIRS = ("incoming", "active", "done", "failed", "cancel", "cancelled")
+
+
+def ensure_spool_dirs(spool_dir):
+    for name in SPOOL_SUBDIRS:
+        (spool_dir / name).mkdir(parents=True, exist_ok=True)
+
+
+def submit_job(spool_dir, params_file, status_file, workflow_id, priority=0, start_step=1):
+    """Write a job file into the spool's incoming folder"""
+    ensure_spool_dirs(spool_dir)
+    job = {
+        "workflowId": workflow_id,
+        "params": os.path.abspath(params_file),
+        "statusFile": os.path.abspath(status_file),
+        "priority": priority,
+        "startStep": start_step,
+        "submittedAt": datetime.now().isoformat()
+    }
+    # Write next to the spool and rename, so the service never reads a partial job
+    temp_file = spool_dir / f".{workflow_id}.json.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(job, f, indent=2)
+    job_file = spool_dir / "incoming" / f"{workflow_id}.json"
+    os.replace(temp_file, job_file)
+
+    update_status(job["statusFile"], 0, status="queued")
+    print(f"[OK] Workflow {workflow_id} queued with priority {priority}: {job_file}")
+    return job_file
+
+
+def request_cancel(spool_dir, workflow_id):
+    """Ask the queue service to cancel a queued or running workflow"""
+    ensure_spool_dirs(spool_dir)
+    marker = spool_dir / "cancel" / workflow_id
+    marker.touch()
+    print(f"[OK] Cancel requested for workflow {workflow_id}: {marker}")
+    return marker
+
+
+def run_job(job, job_name, spool_dir, cancel_token, prometheus_dir=None):
+    """Run one admitted workflow and file its job under done/, failed/ or cancelled/"""
+    destination = "failed"
+    try:
+        run_workflow(job["params"], job["statusFile"], job["workflowId"],
+                     job.get("startStep", 1), in_process=True, priority=job.get("priority", 0),
+                     prometheus_dir=prometheus_dir, cancel_token=cancel_token)
+        destination = "done"
+    except SystemExit:
+        # Cancellation inside the step graph exits after writing its own status
+        print(f"[CANCEL] Workflow {job['workflowId']} cancelled")
+        destination = "cancelled"
+    except Exception as e:
+        print(f"[FAIL] Workflow {job['workflowId']} failed: {e}")
+        update_status(job["statusFile"], 0, status="error", error=str(e))
+    finally:
+        os.replace(spool_dir / "active" / job_name, spool_dir / destination / job_name)
+
+
+def serve(spool_dir, max_workflows, poll_interval=1.0, prometheus_dir=None):
+    """Admit queued jobs by priority and run up to max_workflows at once"""
+    ensure_spool_dirs(spool_dir)
+
+    # Jobs left active by a previous run of the queue are admitted again
+    for job_file in (spool_dir / "active").glob("*.json"):
+        os.replace(job_file, spool_dir / "incoming" / job_file.name)
+        print(f"[RESUME] Re-queued {job_file.name}")
+
+    queued = []
+    queued_names = set()
+    running = {}
+    cancel_tokens = {}
+
+    print(f"[OK] Workflow queue serving {spool_dir} (max {max_workflows} workflows)")
+    while True:
+        for job_file in sorted((spool_dir / "incoming").glob("*.json")):
+            if job_file.name in queued_names:
+                continue
+            try:
+                with open(job_file, 'r') as f:
+                    job = json.load(f)
+            except Exception as e:
+                print(f"[WARN] Skipping unreadable job {job_file.name}: {e}")
+                os.replace(job_file, spool_dir / "failed" / job_file.name)
+                continue
+            queued_names.add(job_file.name)
+            register_workflow(job["workflowId"], job["statusFile"])
+            # Highest priority first, then oldest submission
+            heapq.heappush(queued, (-job.get("priority", 0), job.get("submittedAt", ""), job_file.name, job))
+            print(f"[QUEUE] {job['workflowId']} queued (priority {job.get('priority', 0)}, {len(queued)} waiting)")
+
+        for marker in (spool_dir / "cancel").iterdir():
+            job_name = f"{marker.name}.json"
+            if job_name in running:
+                print(f"[CANCEL] Cancelling running workflow {marker.name}")
+                cancel_tokens[job_name].cancel()
+            elif job_name in queued_names:
+                print(f"[CANCEL] Removing queued workflow {marker.name}")
+                job = next(entry[3] for entry in queued if entry[2] == job_name)
+                queued = [entry for entry in queued if entry[2] != job_name]
+                heapq.heapify(queued)
+                queued_names.discard(job_name)
+                os.replace(spool_dir / "incoming" / job_name, spool_dir / "cancelled" / job_name)
+                update_status(job["statusFile"], 0, status="cancelled", error="Cancelled by user")
+            marker.unlink()
+
+        for name, thread in list(running.items()):
+            if not thread.is_alive():
+                del running[name]
+                cancel_tokens.pop(name, None)
+
+        while queued and len(running) < max_workflows:
+            _, _, job_name, job = heapq.heappop(queued)
+            queued_names.discard(job_name)
+            os.replace(spool_dir / "incoming" / job_name, spool_dir / "active" / job_name)
+            print(f"[START] Admitting workflow {job['workflowId']} ({len(running) + 1}/{max_workflows} running)")
+            cancel_tokens[job_name] = CancelToken()
+            thread = threading.Thread(target=run_job,
+                                      args=(job, job_name, spool_dir, cancel_tokens[job_name], prometheus_dir),
+                                      name=f"workflow-{job['workflowId'][:16]}", daemon=True)
+            running[job_name] = thread
+            thread.start()
+
+        time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workflow Queue')
+    parser.add_argument('--spool-dir', default=str(DEFAULT_SPOOL_DIR), help='Queue spool directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Run the queue service')
+    serve_parser.add_argument('--max-workflows', type=int, default=4, help='Workflows admitted at once')
+    serve_parser.add_argument('--openai-limit', type=int, default=8, help='Concurrent OpenAI calls')
+    serve_parser.add_argument('--ffmpeg-limit', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                              help='Concurrent ffmpeg encodes')
+    serve_parser.add_argument('--whisper-limit', type=int, default=1, help='Concurrent whisper transcriptions')
+    serve_parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between spool scans')
+    serve_parser.add_argument('--prometheus-dir', default=None,
+                              help='Write workflow metrics as Prometheus textfiles into this directory')
+    serve_parser.add_argument('--events-port', type=int, default=None,
+                              help='Serve progress of all workflows as server-sent events on this local port')
+    serve_parser.add_argument('--events-host', default='127.0.0.1', help='Interface for the events endpoint')
+    serve_parser.add_argument('--llm-cache', default=None, metavar='DIR',
+                              help='Answer repeated GPT requests from a response cache in this directory')
+    serve_parser.add_argument('--whisper-service', default=None, metavar='URL',
+                              help='Transcribe through the Whisper service at this URL (see whisper_service.py)')
+
+    submit_parser = subparsers.add_parser('submit', help='Queue a workflow')
+    submit_parser.add_argument('--params', required=True, help='Path to JSON parameters file')
+    submit_parser.add_argument('--status-file', required=True, help='Path to status JSON file')
+    submit_parser.add_argument('--workflow-id', required=True, help='Workflow ID')
+    submit_parser.add_argument('--priority', type=int, default=0, help='Higher runs first')
+    submit_parser.add_argument('--start-step', type=int, default=1, help='Step to start from (1-4)')
+
+    cancel_parser = subparsers.add_parser('cancel', help='Cancel a queued or running workflow')
+    cancel_parser.add_argument('--workflow-id', required=True, help='Workflow ID')
+
+    args = parser.parse_args()
+    spool_dir = Path(args.spool_dir)
+
+    if args.command == 'submit':
+        submit_job(spool_dir, args.params, args.status_file, args.workflow_id, args.priority, args.start_step)
+        return
+    if args.command == 'cancel':
+        request_cancel(spool_dir, args.workflow_id)
+        return
+
+    if args.llm_cache:
+        os.environ[LLM_CACHE_DIR_ENV] = args.llm_cache
+    if args.whisper_service:
+        os.environ[WHISPER_SERVICE_URL_ENV] = args.whisper_service
+    configure_limits({
+        "openai": args.openai_limit,
+        "ffmpeg": args.ffmpeg_limit,
+        "whisper": args.whisper_limit
+    })
+    print(f"[OK] Resource limits: {get_limits_snapshot()}")
+    if args.events_port:
+        start_event_server(args.events_host, args.events_port)
+    try:
+        serve(spool_dir, args.max_workflows, args.poll_interval, args.prometheus_dir)
+    except KeyboardInterrupt:
+        print("\n[STOP] Workflow queue stopped; active jobs are re-queued on next start")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()